@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# Concurrency check for the ASGI stack: fire N chat turns at once against the async
+# views with the fake LLM and the in-memory Mongo stand-in, all inside one process.
+#
+#   python benchmarks/async_load.py --concurrency 500 --llm-latency 1.0
+#
+# With a non-blocking stack the wall time stays close to one LLM round trip
+# instead of growing with N.
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup(llm_latency):
+    sys.path.insert(0, BACKEND_DIR)
+    os.environ["MONGODB_BACKEND"] = "memory"
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_TTFT"] = str(llm_latency)
+    os.environ["FAKE_LLM_TOKEN_DELAY"] = "0"
+    os.environ.setdefault("RATE_LIMIT", "0")
+    os.environ["DJANGO_ROOT_URLCONF"] = "config.asgi_urls"
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+    os.environ.setdefault("DJANGO_SECRET_KEY", "benchmark-only-key")
+    import asgi  # noqa: F401  (configures Django exactly like the ASGI server does)
+
+
+async def post(client, path, body):
+    resp = await client.post(path, json.dumps(body), content_type="application/json")
+    if resp.status_code != 200:
+        raise RuntimeError(f"{path} → {resp.status_code}: {resp.content[:200]!r}")
+    return resp
+
+
+async def run(concurrency, chats_per_user):
+    from django.test import AsyncClient
+
+    client = AsyncClient()
+    users = []
+    for i in range((concurrency + chats_per_user - 1) // chats_per_user):
+        creds = {"email": f"load{i}@ngmc.test", "password": "load-test"}
+        await post(client, "/checkAuth/", {"apikey": "Abkr212@ngmc", "userName": f"load{i}", **creds})
+        users.append(creds)
+
+    async def turn(i):
+        started = time.perf_counter()
+        await post(client, "/postchat/", {"message": f"UG exam timetable {i}", **users[i % len(users)]})
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(turn(i) for i in range(concurrency)))
+    return time.perf_counter() - started, sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--chats-per-user", type=int, default=10)
+    args = parser.parse_args()
+
+    setup(args.llm_latency)
+    wall, latencies = asyncio.run(run(args.concurrency, args.chats_per_user))
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(
+        f"{args.concurrency} concurrent chats, fake LLM latency {args.llm_latency:.2f}s → "
+        f"wall {wall:.2f}s (serial would be {args.concurrency * args.llm_latency:.0f}s), "
+        f"p50 {statistics.median(latencies):.2f}s p99 {p99:.2f}s, "
+        f"{args.concurrency / wall:.1f} chats/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+# Offline load test for the chat endpoints: fake LLM, in-memory Mongo, everything in
+# one process, no network. Drives /postchat/, /postchat/<id>/, /getuserchats/ and
+# /getchat/ with a fixed number of concurrent workers and reports throughput and
+# p50/p95/p99 per endpoint.
+#
+#   python benchmarks/load.py --concurrency 16 --requests 400 --llm-latency 0.05
+#   python benchmarks/load.py --stack asgi --concurrency 200 --compare benchmarks/results/<older>.json
+#
+# Each run is written to benchmarks/results/<timestamp>-<git sha>.json so numbers can
+# be compared across commits.
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+APIKEY = "Abkr212@ngmc"
+
+# (endpoint, relative weight) of the default mix.
+MIX = {"postchat": 4, "continue": 4, "getuserchats": 1, "getchat": 1}
+
+QUESTIONS = [
+    "UG 5th sem exam timetable",
+    "PG fee structure for MBA",
+    "BCA syllabus",
+    "seating arrangement for tomorrow",
+    "who is the principal",
+    "B.Com CA 3rd sem exam schedule",
+    "hostel fees",
+    "MSc computer science syllabus",
+]
+
+
+def setup(args):
+    sys.path.insert(0, BACKEND_DIR)
+    os.environ["MONGODB_BACKEND"] = "memory"
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_TTFT"] = str(args.llm_latency)
+    os.environ["FAKE_LLM_TOKEN_DELAY"] = str(args.token_delay)
+    # The simulated users send far more than a real one would; the limits are opt-in here.
+    os.environ["RATE_LIMIT"] = "1" if args.rate_limit else "0"
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+    os.environ.setdefault("DJANGO_SECRET_KEY", "benchmark-only-key")
+    if args.stack == "asgi":
+        os.environ["DJANGO_ROOT_URLCONF"] = "config.asgi_urls"
+        import asgi  # noqa: F401  (configures Django exactly like the ASGI server does)
+    else:
+        import django
+        django.setup()
+
+
+def git_revision():
+    try:
+        sha = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+        dirty = subprocess.check_output(["git", "status", "--porcelain", "--", "."], cwd=BACKEND_DIR, text=True).strip()
+        return sha + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def percentile(sorted_values, p):
+    # Nearest-rank percentile of an already sorted list.
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Plan:
+    # Deterministic request sequence shared by the sync and async drivers.
+    def __init__(self, args):
+        self.rng = random.Random(args.seed)
+        self.users = [
+            {"email": f"bench{i}@ngmc.test", "password": "bench-pass", "userName": f"bench{i}"}
+            for i in range(args.users)
+        ]
+        mix = MIX if not args.endpoints else {name: MIX[name] for name in args.endpoints}
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.repeat = args.repeat_questions
+        self.chat_ids = {}
+        self.lock = threading.Lock()
+
+    def next(self, i):
+        user = self.users[i % len(self.users)]
+        name = self.rng.choices(self.names, self.weights)[0]
+        question = QUESTIONS[i % len(QUESTIONS)]
+        if not self.repeat:
+            # Unique wording per request so the first-turn response cache stays cold.
+            question = f"{question} (request {i})"
+        with self.lock:
+            chat_ids = self.chat_ids.get(user["email"])
+            chat_id = self.rng.choice(chat_ids) if chat_ids else None
+        if name == "continue" and chat_id is None:
+            name = "postchat"
+        return name, user, question, chat_id
+
+    def remember(self, user, chat_id):
+        with self.lock:
+            self.chat_ids.setdefault(user["email"], []).append(chat_id)
+
+
+def request_args(name, user, question, chat_id):
+    creds = {"email": user["email"], "password": user["password"]}
+    if name == "postchat":
+        return "post", "/postchat/", {"message": question, **creds}
+    if name == "continue":
+        return "post", f"/postchat/{chat_id}/", {"message": question, **creds}
+    if name == "getuserchats":
+        return "post", "/getuserchats/", creds
+    return "get", "/getchat/", None
+
+
+def signup_body(user):
+    return {"apikey": APIKEY, **user}
+
+
+def run_sync(args, plan):
+    from django.test import Client
+
+    local = threading.local()
+
+    def client():
+        if not hasattr(local, "client"):
+            local.client = Client()
+        return local.client
+
+    def call(method, path, body):
+        if method == "get":
+            return client().get(path)
+        return client().post(path, json.dumps(body), content_type="application/json")
+
+    for user in plan.users:
+        call("post", "/checkAuth/", signup_body(user))
+    for user in plan.users:
+        resp = call("post", "/postchat/", {"message": "warm up", "email": user["email"], "password": user["password"]})
+        plan.remember(user, resp.json()["chatId"])
+
+    def one(i):
+        name, user, question, chat_id = plan.next(i)
+        method, path, body = request_args(name, user, question, chat_id)
+        started = time.perf_counter()
+        resp = call(method, path, body)
+        elapsed = time.perf_counter() - started
+        if name == "postchat" and resp.status_code == 200:
+            plan.remember(user, resp.json()["chatId"])
+        return name, resp.status_code, elapsed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        samples = list(pool.map(one, range(args.requests)))
+    return time.perf_counter() - started, samples
+
+
+async def run_async(args, plan):
+    from django.test import AsyncClient
+
+    client = AsyncClient()
+
+    async def call(method, path, body):
+        if method == "get":
+            return await client.get(path)
+        return await client.post(path, json.dumps(body), content_type="application/json")
+
+    for user in plan.users:
+        await call("post", "/checkAuth/", signup_body(user))
+    for user in plan.users:
+        resp = await call("post", "/postchat/", {"message": "warm up", "email": user["email"], "password": user["password"]})
+        plan.remember(user, resp.json()["chatId"])
+
+    next_index = iter(range(args.requests))
+    samples = []
+
+    async def worker():
+        for i in next_index:
+            name, user, question, chat_id = plan.next(i)
+            method, path, body = request_args(name, user, question, chat_id)
+            started = time.perf_counter()
+            resp = await call(method, path, body)
+            elapsed = time.perf_counter() - started
+            if name == "postchat" and resp.status_code == 200:
+                plan.remember(user, resp.json()["chatId"])
+            samples.append((name, resp.status_code, elapsed))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    return time.perf_counter() - started, samples
+
+
+def summarize(samples, wall):
+    def stats(latencies, errors):
+        latencies = sorted(latencies)
+        return {
+            "requests": len(latencies),
+            "errors": errors,
+            "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        }
+
+    endpoints = {}
+    for name in sorted({name for name, _, _ in samples}):
+        rows = [s for s in samples if s[0] == name]
+        endpoints[name] = stats([s[2] for s in rows], sum(1 for s in rows if s[1] >= 400))
+    overall = stats([s[2] for s in samples], sum(1 for s in samples if s[1] >= 400))
+    return overall, endpoints
+
+
+def stage_breakdown():
+    # Mean time per instrumented stage over the run, from chatbot.metrics.
+    from chatbot.metrics import stage_latency
+
+    totals = {}
+    with stage_latency._lock:
+        series = list(stage_latency._series.items())
+    for (stage, op, _endpoint), (_counts, total, count) in series:
+        key = f"{stage}:{op}" if op else stage
+        seconds, calls = totals.get(key, (0.0, 0))
+        totals[key] = (seconds + total, calls + count)
+    return {key: {"calls": calls, "mean_ms": round(seconds / calls * 1000, 3)} for key, (seconds, calls) in sorted(totals.items())}
+
+
+def print_report(result, baseline=None):
+    header = f"{'endpoint':<14}{'reqs':>7}{'err':>5}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print("-" * len(header))
+    rows = list(result["endpoints"].items()) + [("ALL", result["overall"])]
+    for name, row in rows:
+        line = (
+            f"{name:<14}{row['requests']:>7}{row['errors']:>5}{row['throughput_rps']:>9.1f}"
+            f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}"
+        )
+        before = None
+        if baseline:
+            before = baseline["overall"] if name == "ALL" else baseline["endpoints"].get(name)
+        if before and before.get("p95_ms"):
+            line += f"   p95 {(row['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100:+.1f}% vs {baseline['revision']}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stack", choices=["wsgi", "asgi"], default="wsgi")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="fake LLM time to first token (s)")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="fake LLM delay per streamed token (s)")
+    parser.add_argument("--endpoints", nargs="+", choices=list(MIX), help="restrict the mix to these endpoints")
+    parser.add_argument("--repeat-questions", action="store_true", help="reuse question wording so the response cache can hit")
+    parser.add_argument("--rate-limit", action="store_true", help="keep the per-user/IP limits on (429s count as errors)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="results file (default benchmarks/results/<timestamp>-<sha>.json)")
+    parser.add_argument("--compare", help="earlier results file to diff p95 against")
+    args = parser.parse_args()
+
+    setup(args)
+    plan = Plan(args)
+    if args.stack == "asgi":
+        wall, samples = asyncio.run(run_async(args, plan))
+    else:
+        wall, samples = run_sync(args, plan)
+
+    overall, endpoints = summarize(samples, wall)
+    from chatbot.llm import stub_calls
+    from chatbot.metrics import llm_cost_total, llm_tokens_total
+    cost = sum(llm_cost_total._values.values())
+    tokens = {}
+    for (kind, _, _), value in llm_tokens_total._values.items():
+        tokens[kind] = tokens.get(kind, 0) + int(value)
+    revision = git_revision()
+    result = {
+        "revision": revision,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "stack": args.stack,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "users": args.users,
+            "llm_latency": args.llm_latency,
+            "token_delay": args.token_delay,
+            "endpoints": args.endpoints or list(MIX),
+            "repeat_questions": args.repeat_questions,
+            "seed": args.seed,
+        },
+        "wall_seconds": round(wall, 3),
+        "overall": overall,
+        "endpoints": endpoints,
+        "upstream_llm_calls": stub_calls(),
+        "llm_cost_rupees": round(cost, 4),
+        "llm_tokens": tokens,
+        "stages": stage_breakdown(),
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{revision}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+
+    print(
+        f"\n{args.stack}, concurrency {args.concurrency}, fake LLM {args.llm_latency * 1000:.0f}ms "
+        f"→ {len(samples)} requests in {wall:.2f}s ({overall['throughput_rps']:.1f} req/s)\n"
+    )
+    print_report(result, baseline)
+    print(f"\nUpstream LLM calls: {stub_calls()} (including warm-up), estimated cost ₹{cost:.2f} "
+          f"(₹{cost / max(len(samples), 1):.4f}/request)")
+    if tokens.get("prompt"):
+        print(f"Prompt tokens: {tokens['prompt']}, {tokens.get('cached', 0) / tokens['prompt']:.0%} served from the prefix cache")
+    print(f"\nResults written to {os.path.relpath(output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# Peak Python memory per request for a user with a large history, measured with
+# tracemalloc against the in-memory Mongo stand-in.
+#
+#   python benchmarks/memory.py --chats 100 --messages 50
+#   python benchmarks/memory.py --compare benchmarks/results/<older>-memory.json
+#
+# mongomock copies every matching document on find(), so absolute numbers include the
+# stand-in's own overhead; compare runs against each other rather than reading them
+# as production figures.
+import argparse
+import gc
+import json
+import os
+import sys
+import tracemalloc
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "benchmarks"))
+
+from load import RESULTS_DIR, git_revision  # noqa: E402
+
+EMAIL = "memory@ngmc.test"
+PASSWORD = "memory-pass"
+
+
+def setup():
+    sys.path.insert(0, BACKEND_DIR)
+    os.environ["MONGODB_BACKEND"] = "memory"
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_TTFT"] = "0"
+    os.environ["FAKE_LLM_TOKEN_DELAY"] = "0"
+    os.environ.setdefault("RATE_LIMIT", "0")
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+    os.environ.setdefault("DJANGO_SECRET_KEY", "benchmark-only-key")
+    import django
+    django.setup()
+
+
+def seed(chats, messages, message_chars):
+    # Documents are written straight to the collections so seeding stays fast, then
+    # backfilled like a migrated database.
+    from bson import ObjectId
+    from django.core.management import call_command
+    from django.test import Client
+    from chatbot.database import chats_collection, conversations_collection
+
+    Client().post("/checkAuth/", json.dumps({"apikey": "Abkr212@ngmc", "userName": "memory", "email": EMAIL, "password": PASSWORD}),
+                  content_type="application/json")
+    from chatbot.models import User
+    user = User.get_by_email(EMAIL)
+
+    started = datetime.now() - timedelta(days=30)
+    body = ("Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * (message_chars // 56 + 1))[:message_chars]
+    for c in range(chats):
+        chat_id = ObjectId()
+        chats_collection.insert_one({"_id": chat_id, "title": f"Chat {c}", "user_id": user.id, "created_at": started})
+        conversations_collection.insert_many([
+            {"chat_id": chat_id, "role": "user" if m % 2 == 0 else "AI", "message": f"{m}: {body}",
+             "created_at": started + timedelta(seconds=m)}
+            for m in range(messages)
+        ])
+    call_command("backfill_chat_recent", stdout=open(os.devnull, "w"))
+
+
+def measure(client, method, path, body=None):
+    gc.collect()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    if method == "get":
+        resp = client.get(path)
+    else:
+        resp = client.post(path, json.dumps(body), content_type="application/json")
+    content = resp.content
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    if resp.status_code != 200:
+        raise RuntimeError(f"{path} → {resp.status_code}: {content[:200]!r}")
+    return peak, len(content)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=50, help="messages per chat")
+    parser.add_argument("--message-chars", type=int, default=300)
+    parser.add_argument("--output", help="results file (default benchmarks/results/<timestamp>-<sha>-memory.json)")
+    parser.add_argument("--compare", help="earlier memory results file to diff against")
+    args = parser.parse_args()
+
+    setup()
+    seed(args.chats, args.messages, args.message_chars)
+
+    from django.test import Client
+    client = Client()
+    creds = {"email": EMAIL, "password": PASSWORD}
+    from chatbot.database import chats_collection
+    chat_id = str(chats_collection.find_one()["_id"])
+
+    cases = {
+        "getuserchats": ("post", "/getuserchats/", creds),
+        "getchat": ("get", "/getchat/", None),
+        "history": ("post", "/getuserchats/history/", {**creds, "limit": 50}),
+        "history_summary": ("post", "/getuserchats/history/", {**creds, "limit": 50, "summary": True}),
+        "continue": ("post", f"/postchat/{chat_id}/", {**creds, "message": "and the exam timetable?"}),
+    }
+    measure(client, *cases["history_summary"])  # warm imports, prompt and caches
+
+    results = {}
+    for name, (method, path, body) in cases.items():
+        peak, size = measure(client, method, path, body)
+        results[name] = {"peak_kb": round(peak / 1024, 1), "response_kb": round(size / 1024, 1)}
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    revision = git_revision()
+    total = args.chats * args.messages
+    print(f"\n{args.chats} chats x {args.messages} messages ({total} messages, {args.message_chars} chars each)\n")
+    print(f"{'endpoint':<18}{'peak KB':>10}{'response KB':>13}{'bytes/msg':>11}")
+    for name, row in results.items():
+        line = f"{name:<18}{row['peak_kb']:>10.1f}{row['response_kb']:>13.1f}{row['peak_kb'] * 1024 / total:>11.0f}"
+        before = baseline and baseline["endpoints"].get(name)
+        if before and before["peak_kb"]:
+            line += f"   {(row['peak_kb'] - before['peak_kb']) / before['peak_kb'] * 100:+.1f}% vs {baseline['revision']}"
+        print(line)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{revision}-memory.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "revision": revision,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "config": {"chats": args.chats, "messages": args.messages, "message_chars": args.message_chars},
+            "endpoints": results,
+        }, f, indent=2)
+    print(f"\nResults written to {os.path.relpath(output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# Reply extraction: chatbot.reply_parser against the json.loads + regex fallback it
+# replaced, on typical and adversarial model outputs. Correctness (fences, prose,
+# truncation, chunking, randomized outputs) is covered by chatbot/tests/test_reply_parser.py.
+#
+#   python benchmarks/reply_parser.py
+#   python benchmarks/reply_parser.py --sizes 200,200000
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from chatbot.reply_parser import parse_reply  # noqa: E402
+
+
+def legacy_extract(resp):
+    try:
+        parsed = json.loads(resp)
+        if parsed.get('reply') and parsed.get('title'):
+            return parsed
+    except json.JSONDecodeError:
+        pass
+    match = re.search(r'\{[\s\S]*"reply"[\s\S]*"title"[\s\S]*\}', resp)
+    if match:
+        try:
+            return json.loads(match.group(0))
+        except json.JSONDecodeError:
+            pass
+    return {"reply": resp, "title": "NGMC Query Response"}
+
+
+def sample_reply(size):
+    line = "- **UG 5th semester**: https://coe.ngmc.ac.in/wp-content/uploads/files/timetable/UG-5TT.pdf\n"
+    return (line * (size // len(line) + 1))[:size]
+
+
+def cases(size):
+    reply = sample_reply(size)
+    plain = json.dumps({"reply": reply, "title": "Exam Timetable"})
+    return {
+        "json": plain,
+        "fenced+prose": f"```json\n{plain}\n```\nLet me know if you need anything else!",
+        "reply-only": json.dumps({"reply": reply}),
+        # Braces and a "reply" but never a "title": the regex tries every "{" as a start.
+        "no-title": '{"reply": ' + json.dumps(reply) + "}" + ' {"reply"' * (size // 200),
+    }
+
+
+def bench(fn, text, budget=0.5):
+    runs, started = 0, time.perf_counter()
+    while True:
+        fn(text)
+        runs += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= budget or runs >= 10000:
+            return elapsed / runs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="200,2000,20000", help="reply sizes in characters")
+    args = parser.parse_args()
+
+    print(f"{'case':<14}{'size':>8}{'legacy µs':>14}{'parser µs':>14}{'speedup':>10}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        for name, text in cases(size).items():
+            legacy, new = bench(legacy_extract, text), bench(parse_reply, text)
+            print(f"{name:<14}{size:>8}{legacy * 1e6:>14.1f}{new * 1e6:>14.1f}{legacy / new:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
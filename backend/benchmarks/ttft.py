@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# Time-to-first-token of /postchat/stream/ against the blocking /postchat/.
+#
+# Start the server with the fake backend so no OpenAI calls are made:
+#   LLM_BACKEND=fake FAKE_LLM_TTFT=0.5 python manage.py runserver
+#   python benchmarks/ttft.py --email you@example.com --password secret
+import argparse
+import statistics
+import time
+
+import requests
+
+
+def blocking_turn(session, base_url, body):
+    started = time.perf_counter()
+    resp = session.post(f"{base_url}/postchat/", json=body, timeout=120)
+    resp.raise_for_status()
+    elapsed = time.perf_counter() - started
+    return elapsed, elapsed
+
+
+def streaming_turn(session, base_url, body):
+    started = time.perf_counter()
+    first_token = None
+    with session.post(f"{base_url}/postchat/stream/", json=body, stream=True, timeout=120) as resp:
+        resp.raise_for_status()
+        for line in resp.iter_lines(decode_unicode=True):
+            if first_token is None and line == "event: token":
+                first_token = time.perf_counter() - started
+    total = time.perf_counter() - started
+    return first_token if first_token is not None else total, total
+
+
+def summarize(name, samples):
+    ttft = [s[0] * 1000 for s in samples]
+    total = [s[1] * 1000 for s in samples]
+    print(
+        f"{name:<10} ttft p50={statistics.median(ttft):8.1f}ms max={max(ttft):8.1f}ms | "
+        f"total p50={statistics.median(total):8.1f}ms max={max(total):8.1f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--message", default="UG 5th sem exam timetable")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    body = {"email": args.email, "password": args.password, "message": args.message}
+    session = requests.Session()
+    results = {"blocking": [], "streaming": []}
+    for _ in range(args.runs):
+        results["blocking"].append(blocking_turn(session, args.url, body))
+        results["streaming"].append(streaming_turn(session, args.url, body))
+
+    for name, samples in results.items():
+        summarize(name, samples)
+
+
+if __name__ == "__main__":
+    main()
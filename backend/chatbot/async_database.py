@@ -0,0 +1,40 @@
+import os
+import time
+import pymongo
+from pymongo import AsyncMongoClient
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from .database import MONGODB_BACKEND, MONGODB_URI, MONGODB_DB_NAME, MONGODB_HEALTH_TIMEOUT, client_options
+
+# The async client connects lazily on first use, so importing this never blocks the event
+# loop. It takes the same pool and timeout settings as the sync client.
+if MONGODB_BACKEND == "memory":
+    from .database import db as sync_db
+    from .mongo_memory import AsyncDatabase
+    db = AsyncDatabase(sync_db)
+else:
+    mongo_client = AsyncMongoClient(MONGODB_URI, **client_options())
+    db = mongo_client[MONGODB_DB_NAME]
+
+users_collection = db.users
+chats_collection = db.chats
+conversations_collection = db.conversations
+
+# See chatbot.database: lazily decoded documents for list reads of conversations.
+if MONGODB_BACKEND == "memory":
+    lazy_conversations_collection = conversations_collection
+else:
+    lazy_conversations_collection = conversations_collection.with_options(
+        codec_options=CodecOptions(document_class=RawBSONDocument))
+
+
+async def ping(timeout: float = MONGODB_HEALTH_TIMEOUT):
+    # See chatbot.database.Mongo.ping.
+    started = time.perf_counter()
+    with pymongo.timeout(timeout):
+        await db.command("ping")
+    return (time.perf_counter() - started) * 1000
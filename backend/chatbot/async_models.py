@@ -0,0 +1,258 @@
+import asyncio
+from .async_database import users_collection, chats_collection, conversations_collection, lazy_conversations_collection
+from . import models
+from .models import USER_FIELDS, CHAT_FIELDS, CONVERSATION_FIELDS, LIST_CHUNK_CHATS, chat_list_fields
+from bson import ObjectId
+from .metrics import timed_call
+from .auth import hash_password, forget_user
+from .write_behind import write_behind
+from datetime import datetime
+
+# Async mirrors of chatbot.models; same documents, same constructors, awaitable queries.
+
+async def aiterate(items):
+    if hasattr(items, '__aiter__'):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+class User(models.User):
+    __slots__ = ()
+
+    @classmethod
+    @timed_call("mongo", "User.create")
+    async def create(cls, userName, email, password):
+        user_data = {
+            'userName': userName,
+            'email': email,
+            # Hashing is deliberately slow; keep it off the event loop.
+            'password': await asyncio.to_thread(hash_password, password),
+            'created_at': datetime.now()
+        }
+        result = await users_collection.insert_one(user_data)
+        return cls(userName, email, user_data['password'], result.inserted_id, user_data['created_at'])
+
+    @classmethod
+    @timed_call("mongo", "User.get_by_email")
+    async def get_by_email(cls, email):
+        user_data = await users_collection.find_one({'email': email}, USER_FIELDS)
+        if user_data:
+            return cls(user_data['userName'], user_data['email'], user_data.get('password', ''), user_data['_id'], user_data['created_at'])
+        return None
+
+    @classmethod
+    @timed_call("mongo", "User.get")
+    async def get(cls, user_id):
+        user_data = await users_collection.find_one({'_id': ObjectId(user_id)}, USER_FIELDS)
+        if user_data:
+            return cls(user_data['userName'], user_data['email'], user_data.get('password', ''), user_data['_id'], user_data['created_at'])
+        return None
+
+    @classmethod
+    @timed_call("mongo", "User.set_password")
+    async def set_password(cls, user, password):
+        user.password = await asyncio.to_thread(hash_password, password)
+        await users_collection.update_one({'_id': user.id}, {'$set': {'password': user.password}})
+        forget_user(user.id, user.email)
+        return user
+
+class Chat(models.Chat):
+    __slots__ = ()
+
+    @classmethod
+    @timed_call("mongo", "Chat.create")
+    async def create(cls, title, user_id=None, _id=None):
+        chat_data = {
+            '_id': _id or ObjectId(),
+            'title': title,
+            'user_id': user_id,
+            'created_at': datetime.now()
+        }
+        if models.CHAT_RECENT_MESSAGES:
+            chat_data.update({'recent': [], 'message_count': 0, 'last_activity': chat_data['created_at']})
+        write_behind.insert('chats', chat_data, keys=(str(chat_data['_id']), str(user_id)))
+        return cls.from_doc(dict(chat_data))
+
+    @classmethod
+    @timed_call("mongo", "Chat.get")
+    async def get(cls, chat_id):
+        await write_behind.asettle(str(chat_id))
+        chat_data = await chats_collection.find_one({'_id': ObjectId(chat_id)}, CHAT_FIELDS)
+        if chat_data:
+            return cls.from_doc(chat_data)
+        return None
+
+    @classmethod
+    @timed_call("mongo", "Chat.iter_all")
+    async def iter_all(cls, recent=None):
+        await write_behind.asettle_all()
+        async for chat_data in chats_collection.find({}, chat_list_fields(recent)).sort('_id', -1):
+            yield cls.from_doc(chat_data)
+
+    @classmethod
+    async def all(cls, recent=None):
+        return [chat async for chat in cls.iter_all(recent)]
+
+    @classmethod
+    @timed_call("mongo", "Chat.iter_by_user")
+    async def iter_by_user(cls, user_id, recent=None):
+        await write_behind.asettle(str(user_id))
+        async for chat_data in chats_collection.find({'user_id': user_id}, chat_list_fields(recent)).sort('_id', -1):
+            yield cls.from_doc(chat_data)
+
+    @classmethod
+    async def filter_by_user(cls, user_id, recent=None):
+        return [chat async for chat in cls.iter_by_user(user_id, recent)]
+
+    @classmethod
+    @timed_call("mongo", "Chat.page_by_user")
+    async def page_by_user(cls, user_id, before=None, limit=20, recent=None):
+        await write_behind.asettle(str(user_id))
+        query = {'user_id': user_id}
+        if before:
+            query['_id'] = {'$lt': ObjectId(before)}
+        chats = []
+        async for chat_data in chats_collection.find(query, chat_list_fields(recent)).sort('_id', -1).limit(limit):
+            chats.append(cls.from_doc(chat_data))
+        return chats
+
+    @timed_call("mongo", "Chat.save")
+    async def save(self):
+        write_behind.update('chats', self.id, self.dirty_fields(), keys=(str(self.id), str(self.user_id)))
+        self.mark_saved()
+
+    @classmethod
+    @timed_call("mongo", "Chat.update_summary")
+    async def update_summary(cls, chat_id, summary, summary_until):
+        write_behind.update('chats', chat_id, {'summary': summary, 'summary_until': summary_until}, keys=(str(chat_id),))
+
+class Conversation(models.Conversation):
+    __slots__ = ()
+
+    @classmethod
+    @timed_call("mongo", "Conversation.bulk_create")
+    async def bulk_create(cls, conversations, user_id=None):
+        # user_id is stored on each message for per-user search (chatbot.search).
+        for conv in conversations:
+            conv.id = conv.id or ObjectId()
+            write_behind.insert('conversations', {
+                '_id': conv.id,
+                'chat_id': conv.chat_id,
+                'user_id': user_id,
+                'role': conv.role,
+                'message': conv.message,
+                'created_at': conv.created_at
+            }, keys=(str(conv.chat_id), str(user_id)))
+
+    @classmethod
+    @timed_call("mongo", "Conversation.filter_by_chat")
+    async def filter_by_chat(cls, chat):
+        await write_behind.asettle(str(chat.id))
+        conversations = []
+        async for conv_data in lazy_conversations_collection.find({'chat_id': chat.id}, CONVERSATION_FIELDS).sort('created_at', 1):
+            conversations.append(cls.from_doc(conv_data))
+        return conversations
+
+    @classmethod
+    @timed_call("mongo", "Conversation.group_by_chats")
+    async def group_by_chats(cls, chats):
+        # Chats whose whole history is embedded need no query.
+        grouped = {chat.id: list(chat.recent) for chat in chats if chat.has_full_history()}
+        missing = [chat.id for chat in chats if chat.id not in grouped]
+        grouped.update((chat_id, []) for chat_id in missing)
+        if not missing:
+            return grouped
+        await write_behind.asettle(*(str(chat_id) for chat_id in missing))
+        async for conv_data in lazy_conversations_collection.find({'chat_id': {'$in': missing}}, CONVERSATION_FIELDS).sort('created_at', 1):
+            grouped[conv_data['chat_id']].append(cls.from_doc(conv_data))
+        return grouped
+
+    @classmethod
+    async def iter_by_chats(cls, chats, chunk=LIST_CHUNK_CHATS):
+        # Same chunking as models.Conversation.iter_by_chats; `chats` may be an async iterator.
+        batch = []
+        async for chat in aiterate(chats):
+            batch.append(chat)
+            if len(batch) == chunk:
+                grouped = await cls.group_by_chats(batch)
+                for chat in batch:
+                    yield chat, grouped[chat.id]
+                batch = []
+        if batch:
+            grouped = await cls.group_by_chats(batch)
+            for chat in batch:
+                yield chat, grouped[chat.id]
+
+    @classmethod
+    @timed_call("mongo", "Conversation.last_by_chats")
+    async def last_by_chats(cls, chats):
+        last = {chat.id: chat.recent[-1] for chat in chats if chat.recent}
+        chat_ids = [chat.id for chat in chats if chat.recent is None]
+        if not chat_ids:
+            return last
+        await write_behind.asettle(*(str(chat_id) for chat_id in chat_ids))
+        pipeline = [
+            {'$match': {'chat_id': {'$in': chat_ids}}},
+            {'$sort': {'_id': -1}},
+            {'$group': {'_id': '$chat_id', 'last': {'$first': '$$ROOT'}}},
+        ]
+        async for row in await conversations_collection.aggregate(pipeline):
+            conv_data = row['last']
+            last[row['_id']] = cls.from_doc(conv_data)
+        return last
+
+    @classmethod
+    @timed_call("mongo", "Conversation.filter_by_chat_last_n")
+    async def filter_by_chat_last_n(cls, chat, n):
+        await write_behind.asettle(str(chat.id))
+        conversations = []
+        async for conv_data in conversations_collection.find({'chat_id': chat.id}, CONVERSATION_FIELDS).sort('_id', -1).limit(n):
+            conversations.append(cls.from_doc(conv_data))
+        return conversations
+
+    @classmethod
+    @timed_call("mongo", "Conversation.recent")
+    async def recent(cls, n):
+        conversations = []
+        async for conv_data in conversations_collection.find({}, CONVERSATION_FIELDS).sort('_id', -1).limit(n):
+            conversations.append(cls.from_doc(conv_data))
+        return conversations
+
+    @classmethod
+    @timed_call("mongo", "Conversation.iter_newest_first")
+    async def iter_newest_first(cls, chat, after=None):
+        # Lazy, batched walk from the newest message back, stopping wherever the caller stops.
+        # Messages embedded in the chat document are used first; older ones are queried.
+        before = None
+        if chat.recent is not None:
+            for conv in reversed(chat.recent):
+                if after and conv.id <= after:
+                    return
+                yield conv
+            if chat.has_full_history():
+                return
+            before = chat.recent[0].id if chat.recent else None
+        await write_behind.asettle(str(chat.id))
+        query = {'chat_id': chat.id}
+        if after or before:
+            query['_id'] = {}
+            if after:
+                query['_id']['$gt'] = after
+            if before:
+                query['_id']['$lt'] = before
+        async for conv_data in conversations_collection.find(query, CONVERSATION_FIELDS).sort('_id', -1).batch_size(20):
+            yield cls.from_doc(conv_data)
+
+    @classmethod
+    @timed_call("mongo", "Conversation.filter_by_chat_range")
+    async def filter_by_chat_range(cls, chat, after, upto):
+        await write_behind.asettle(str(chat.id))
+        query = {'chat_id': chat.id, '_id': {'$lte': upto}}
+        if after:
+            query['_id']['$gt'] = after
+        conversations = []
+        async for conv_data in conversations_collection.find(query, CONVERSATION_FIELDS).sort('_id', 1):
+            conversations.append(cls.from_doc(conv_data))
+        return conversations
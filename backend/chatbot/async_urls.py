@@ -0,0 +1,22 @@
+from django.urls import path
+from . import async_views as views
+
+urlpatterns = [
+    path('checkAuth/', views.checkAuth),
+    path('postchat/', views.post_chat),
+    path('postchat/stream/', views.post_chat_stream),
+    path('postchat/<str:chat_id>/stream/', views.continue_chat_stream),
+    path('postchat/<str:chat_id>/', views.continue_chat),
+    path('jobs/postchat/', views.submit_chat_job),
+    path('jobs/postchat/<str:chat_id>/', views.submit_chat_job),
+    path('jobs/<str:job_id>/', views.get_chat_job),
+    path('getchat/', views.get_chats),
+    path('getuserchats/', views.get_user_chats),
+    path('getuserchats/history/', views.get_user_chat_history),
+    path('getuserchats/search/', views.search_user_chats),
+    path('getuserchats/export/', views.export_user_chats),
+    path('cache/stats/', views.cache_stats),
+    path('metrics/', views.metrics),
+    path('healthz/', views.healthz),
+    path('readyz/', views.readyz),
+]
@@ -0,0 +1,529 @@
+import json
+import asyncio
+from bson import ObjectId
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from .async_models import User, Chat, Conversation
+from .utils import (
+    add_cors_headers, validate_message, validate_user_data,
+    auser_auth_middleware, acall_chatgpt, astream_chatgpt, extract_json_from_response,
+    LLM_ERROR_REPLY, parse_json_body, body_str
+)
+from .llm import LLMError
+from .rate_limit import RATE_LIMITED_REPLY, RateLimited, acheck_rate
+from .auth import issue_token, verify_password, is_hashed, remember_login, SESSION_TTL_SECONDS
+from . import views
+from .views import (
+    HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE,
+    serialize_conversation, serialize_chat, sse_event, cache_stats, metrics, healthz, readiness,
+    json_bytes, json_object, json_pieces_response, read_export_options, export_response,
+    too_many_requests, read_idempotency_key, read_wait, job_response
+)
+from .async_database import chats_collection, conversations_collection, ping
+from .export import (
+    EXPORT_BATCH_CHATS, EXPORT_CHAT_FIELDS, EXPORT_MESSAGE_SORT, CONVERSATION_FIELDS,
+    document_frame, chat_head, chat_tail, message_bytes, chat_query, abuffered, agzipped
+)
+from .write_behind import write_behind
+from .prompt import CONTINUE_CHAT_FORMAT, prompt_builder, build_prompt
+from .context import abuild_context
+from .response_cache import response_cache
+from .reply_parser import ReplyParser
+from .fast_path import fast_answer
+from .search import SearchError, asearch_messages
+from .jobs import JobConflict, job_queue
+from .metrics import instrument, bind_endpoint
+
+# async def twins of chatbot.views, served by asgi.py. Request handling and response
+# shapes are identical; only Mongo and OpenAI calls are awaited.
+
+@csrf_exempt
+@instrument("checkAuth")
+async def checkAuth(request):
+    if request.method == "OPTIONS":
+        resp = HttpResponse(status=204)
+        return add_cors_headers(request, resp)
+
+    if request.method != 'POST':
+        return JsonResponse({"error":"POST required"}, status=405)
+
+    try:
+        body = parse_json_body(request)
+    except json.JSONDecodeError:
+        return JsonResponse({"error":"Invalid JSON"}, status=400)
+
+    apikey = body_str(body, 'apikey')
+    userName = body_str(body, 'userName')
+    password = body_str(body, 'password')
+    email = body_str(body, 'email')
+
+    if apikey != "Abkr212@ngmc":
+        return JsonResponse({"error":"Invalid access key"}, status=401)
+
+    user_err = validate_user_data(userName, email, password)
+    if user_err:
+        return JsonResponse({"error": user_err}, status=400)
+
+    try:
+        existing_user = await User.get_by_email(email)
+        if existing_user:
+            if not await asyncio.to_thread(verify_password, password, existing_user.password):
+                return add_cors_headers(request, JsonResponse({"error":"Invalid credentials"}, status=401))
+            if not is_hashed(existing_user.password):
+                await User.set_password(existing_user, password)
+            user, message = existing_user, "User already exists"
+        else:
+            user = await User.create(userName, email, password)
+            message = "User created successfully"
+        remember_login(user, password)
+        resp = JsonResponse({
+            "status": "success",
+            "message": message,
+            "userId": str(user.id),
+            "token": issue_token(user),
+            "expiresIn": SESSION_TTL_SECONDS
+        })
+        return add_cors_headers(request, resp)
+    except Exception as e:
+        print(f"User creation error: {e}")
+        return JsonResponse({"error": "Failed to create/get user"}, status=500)
+
+async def read_chat_request(request):
+    if request.method == "OPTIONS":
+        resp = HttpResponse(status=204)
+        return add_cors_headers(request, resp), None, None
+
+    if request.method != 'POST':
+        return JsonResponse({"error":"POST required"}, status=405), None, None
+
+    try:
+        await acheck_rate(request)
+        auth_error, user = await auser_auth_middleware(request)
+        if auth_error:
+            return add_cors_headers(request, auth_error), None, None
+        await acheck_rate(request, user)
+    except RateLimited as e:
+        return too_many_requests(request, e), None, None
+
+    body = parse_json_body(request)
+
+    user_message = body_str(body, 'message')
+
+    err = validate_message(user_message)
+    if err:
+        return JsonResponse({"error": err}, status=400), None, None
+
+    return None, user, user_message
+
+async def load_user_chat(chat_id, user):
+    try:
+        chat = await Chat.get(chat_id)
+        if not chat:
+            return JsonResponse({"error":"Chat not found"}, status=404), None
+    except Exception:
+        return JsonResponse({"error":"Chat not found"}, status=404), None
+
+    if chat.user_id and str(chat.user_id) != str(user.id):
+        return JsonResponse({"error": "Unauthorized to access this chat"}, status=403), None
+
+    if not chat.user_id:
+        chat.user_id = user.id
+        await chat.save()
+
+    return None, chat
+
+async def new_chat_messages(user_message):
+    # Refresh the shared prompt with the async driver so building it never blocks the loop.
+    await prompt_builder.aensure_fresh()
+    return views.new_chat_messages(user_message)
+
+async def continue_chat_messages(chat, user_message):
+    await prompt_builder.aensure_fresh()
+    return await abuild_context(chat, build_prompt(user_message, CONTINUE_CHAT_FORMAT), user_message)
+
+async def save_new_chat(user, user_message, parsed):
+    chat = await Chat.create(title=parsed['title'], user_id=user.id)
+    conversations = [
+        Conversation(chat.id, 'user', user_message),
+        Conversation(chat.id, 'AI', parsed['reply'])
+    ]
+    await Conversation.bulk_create(conversations, user_id=user.id)
+    chat.push_recent(conversations)
+    return chat
+
+async def save_turn(chat, user_message, parsed):
+    await chat.save()
+    conversations = [
+        Conversation(chat.id, 'user', user_message),
+        Conversation(chat.id, 'AI', parsed['reply'])
+    ]
+    await Conversation.bulk_create(conversations, user_id=chat.user_id)
+    chat.push_recent(conversations)
+
+def llm_unavailable(request):
+    # Nothing is saved or cached: the client can simply send the message again.
+    return add_cors_headers(request, JsonResponse({"error": LLM_ERROR_REPLY}, status=503))
+
+@csrf_exempt
+@instrument("post_chat")
+async def post_chat(request):
+    error, user, user_message = await read_chat_request(request)
+    if error:
+        return error
+
+    parsed = fast_answer(user_message) or response_cache.get(user_message)
+    if parsed is None:
+        try:
+            gpt_resp = await acall_chatgpt(await new_chat_messages(user_message))
+        except LLMError:
+            return llm_unavailable(request)
+        except RateLimited as e:
+            return too_many_requests(request, e)
+        parsed = extract_json_from_response(gpt_resp)
+        response_cache.set(user_message, parsed)
+    chat = await save_new_chat(user, user_message, parsed)
+
+    resp = JsonResponse({
+        "chatId": str(chat.id),
+        "reply": parsed['reply'],
+        "title": parsed['title'],
+        "userId": str(user.id)
+    })
+    return add_cors_headers(request, resp)
+
+@csrf_exempt
+@instrument("continue_chat")
+async def continue_chat(request, chat_id):
+    error, user, user_message = await read_chat_request(request)
+    if error:
+        return error
+
+    error, chat = await load_user_chat(chat_id, user)
+    if error:
+        return error
+
+    # No fast path: a follow-up is read in the context of the conversation.
+    try:
+        gpt_resp = await acall_chatgpt(await continue_chat_messages(chat, user_message))
+    except LLMError:
+        return llm_unavailable(request)
+    except RateLimited as e:
+        return too_many_requests(request, e)
+    parsed = extract_json_from_response(gpt_resp)
+    await save_turn(chat, user_message, parsed)
+
+    resp = JsonResponse({
+        "chatId": str(chat.id),
+        "reply": parsed['reply'],
+        "userId": str(user.id)
+    })
+    return add_cors_headers(request, resp)
+
+async def stream_turn(messages, finish, cache_key=None):
+    parser = ReplyParser()
+    try:
+        async for delta in astream_chatgpt(messages):
+            text = parser.feed(delta)
+            if text:
+                yield sse_event("token", {"delta": text})
+    except LLMError:
+        yield sse_event("error", {"error": LLM_ERROR_REPLY})
+        return
+    except RateLimited as e:
+        yield sse_event("error", {"error": RATE_LIMITED_REPLY, "retryAfter": e.retry_after})
+        return
+
+    text = parser.close()
+    if text:
+        yield sse_event("token", {"delta": text})
+    parsed = parser.result()
+    if cache_key is not None:
+        response_cache.set(cache_key, parsed)
+    yield sse_event("done", await finish(parsed))
+
+async def cached_turn(parsed, finish):
+    yield sse_event("token", {"delta": parsed['reply']})
+    yield sse_event("done", await finish(parsed))
+
+def sse_response(request, events):
+    resp = StreamingHttpResponse(bind_endpoint(events), content_type="text/event-stream")
+    resp["Cache-Control"] = "no-cache"
+    resp["X-Accel-Buffering"] = "no"
+    return add_cors_headers(request, resp)
+
+@csrf_exempt
+@instrument("post_chat_stream")
+async def post_chat_stream(request):
+    error, user, user_message = await read_chat_request(request)
+    if error:
+        return error
+
+    async def finish(parsed):
+        chat = await save_new_chat(user, user_message, parsed)
+        return {
+            "chatId": str(chat.id),
+            "reply": parsed['reply'],
+            "title": parsed['title'],
+            "userId": str(user.id)
+        }
+
+    parsed = fast_answer(user_message) or response_cache.get(user_message)
+    if parsed is not None:
+        return sse_response(request, cached_turn(parsed, finish))
+    messages = await new_chat_messages(user_message)
+    return sse_response(request, stream_turn(messages, finish, cache_key=user_message))
+
+@csrf_exempt
+@instrument("continue_chat_stream")
+async def continue_chat_stream(request, chat_id):
+    error, user, user_message = await read_chat_request(request)
+    if error:
+        return error
+
+    error, chat = await load_user_chat(chat_id, user)
+    if error:
+        return error
+
+    async def finish(parsed):
+        await save_turn(chat, user_message, parsed)
+        return {
+            "chatId": str(chat.id),
+            "reply": parsed['reply'],
+            "userId": str(user.id)
+        }
+
+    messages = await continue_chat_messages(chat, user_message)
+    return sse_response(request, stream_turn(messages, finish))
+
+async def chat_list_pieces(pairs):
+    pieces = [b"["]
+    async for chat, conversations in pairs:
+        if len(pieces) > 1:
+            pieces.append(b", ")
+        pieces.append(json_bytes(serialize_chat(chat, conversations)))
+    pieces.append(b"]")
+    return pieces
+
+@csrf_exempt
+@instrument("submit_chat_job")
+async def submit_chat_job(request, chat_id=None):
+    error, user, user_message = await read_chat_request(request)
+    if error:
+        return error
+
+    if chat_id is not None:
+        error, chat = await load_user_chat(chat_id, user)
+        if error:
+            return error
+        chat_id = chat.id
+
+    error, key = read_idempotency_key(request)
+    if error:
+        return add_cors_headers(request, error)
+
+    try:
+        job, created = await job_queue.asubmit(user.id, user_message, chat_id, key)
+    except JobConflict as e:
+        return add_cors_headers(request, JsonResponse({"error": str(e)}, status=409))
+    job_queue.start()
+    return job_response(request, job, created)
+
+@csrf_exempt
+@instrument("get_chat_job")
+async def get_chat_job(request, job_id):
+    if request.method == "OPTIONS":
+        resp = HttpResponse(status=204)
+        return add_cors_headers(request, resp)
+
+    if request.method != 'POST':
+        return JsonResponse({"error":"POST required"}, status=405)
+
+    auth_error, user = await auser_auth_middleware(request)
+    if auth_error:
+        return add_cors_headers(request, auth_error)
+
+    error, wait = read_wait(request)
+    if error:
+        return add_cors_headers(request, error)
+
+    job_queue.start()
+    job = await job_queue.await_job(job_id, user.id, wait)
+    if job is None:
+        return add_cors_headers(request, JsonResponse({"error": "Job not found"}, status=404))
+    return job_response(request, job)
+
+@csrf_exempt
+@instrument("get_chats")
+async def get_chats(request):
+    if request.method == "OPTIONS":
+        resp = HttpResponse(status=204)
+        return add_cors_headers(request, resp)
+
+    if request.method != 'GET':
+        return JsonResponse({"error":"GET required"}, status=405)
+
+    try:
+        pairs = Conversation.iter_by_chats(Chat.iter_all())
+        resp = json_pieces_response(await chat_list_pieces(pairs))
+        return add_cors_headers(request, resp)
+    except Exception as e:
+        print(f"Error fetching chats: {e}")
+        return JsonResponse({"error": "Failed to fetch chats"}, status=500)
+
+@csrf_exempt
+@instrument("get_user_chats")
+async def get_user_chats(request):
+    if request.method == "OPTIONS":
+        resp = HttpResponse(status=204)
+        return add_cors_headers(request, resp)
+
+    if request.method != 'POST':
+        return JsonResponse({"error":"POST required"}, status=405)
+
+    auth_error, user = await auser_auth_middleware(request)
+    if auth_error:
+        return add_cors_headers(request, auth_error)
+
+    pairs = Conversation.iter_by_chats(Chat.iter_by_user(user.id))
+    resp = json_pieces_response(json_object({
+        "user": {
+            "id": str(user.id),
+            "userName": user.userName,
+            "email": user.email
+        },
+        "chats": await chat_list_pieces(pairs)
+    }))
+    return add_cors_headers(request, resp)
+
+@csrf_exempt
+@instrument("get_user_chat_history")
+async def get_user_chat_history(request):
+    if request.method == "OPTIONS":
+        resp = HttpResponse(status=204)
+        return add_cors_headers(request, resp)
+
+    if request.method != 'POST':
+        return JsonResponse({"error":"POST required"}, status=405)
+
+    auth_error, user = await auser_auth_middleware(request)
+    if auth_error:
+        return add_cors_headers(request, auth_error)
+
+    body = parse_json_body(request)
+    cursor = body.get('cursor') or None
+    summary = bool(body.get('summary', False))
+    try:
+        limit = min(max(int(body.get('limit', HISTORY_PAGE_SIZE)), 1), HISTORY_MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "Invalid limit"}, status=400)
+    if cursor and not ObjectId.is_valid(cursor):
+        return JsonResponse({"error": "Invalid cursor"}, status=400)
+
+    if summary:
+        user_chats = await Chat.page_by_user(user.id, before=cursor, limit=limit, recent=1)
+        last = await Conversation.last_by_chats(user_chats)
+        chats_data = []
+        for chat in user_chats:
+            last_conv = last.get(chat.id)
+            chats_data.append({
+                'id': str(chat.id),
+                'title': chat.title,
+                'created_at': chat.created_at.isoformat(),
+                'lastMessage': serialize_conversation(last_conv) if last_conv else None,
+                'messageCount': chat.message_count,
+                'lastActivity': chat.last_activity.isoformat() if chat.last_activity else None
+            })
+        resp = JsonResponse({
+            "chats": chats_data,
+            "nextCursor": str(user_chats[-1].id) if len(user_chats) == limit else None
+        })
+    else:
+        user_chats = await Chat.page_by_user(user.id, before=cursor, limit=limit)
+        resp = json_pieces_response(json_object({
+            "chats": await chat_list_pieces(Conversation.iter_by_chats(user_chats)),
+            "nextCursor": str(user_chats[-1].id) if len(user_chats) == limit else None
+        }))
+
+    return add_cors_headers(request, resp)
+
+async def export_pieces(fmt='ndjson', user=None, batch_size=EXPORT_BATCH_CHATS):
+    # Same walk as chatbot.export.export_pieces over the async client.
+    await write_behind.asettle_all()
+    opening, separator, closing = document_frame(fmt, user)
+    yield opening
+    last_id = None
+    first = True
+    while True:
+        chats = await chats_collection.find(chat_query(user, last_id), EXPORT_CHAT_FIELDS).sort('_id', 1).limit(batch_size).to_list()
+        if not chats:
+            break
+        last_id = chats[-1]['_id']
+        messages = conversations_collection.find(
+            {'chat_id': {'$in': [chat_data['_id'] for chat_data in chats]}}, CONVERSATION_FIELDS
+        ).sort(EXPORT_MESSAGE_SORT)
+        pending = await anext(messages, None)
+        for chat_data in chats:
+            yield chat_head(chat_data) if first else separator + chat_head(chat_data)
+            first = False
+            count = 0
+            while pending is not None and pending['chat_id'] == chat_data['_id']:
+                yield message_bytes(pending, count == 0)
+                count += 1
+                pending = await anext(messages, None)
+            yield chat_tail(fmt)
+    yield closing
+
+@csrf_exempt
+@instrument("search_user_chats")
+async def search_user_chats(request):
+    if request.method == "OPTIONS":
+        resp = HttpResponse(status=204)
+        return add_cors_headers(request, resp)
+
+    if request.method != 'POST':
+        return JsonResponse({"error":"POST required"}, status=405)
+
+    auth_error, user = await auser_auth_middleware(request)
+    if auth_error:
+        return add_cors_headers(request, auth_error)
+
+    body = parse_json_body(request)
+    try:
+        resp = JsonResponse(await asearch_messages(user.id, body.get('query'), body.get('cursor'), body.get('limit')))
+    except SearchError as e:
+        resp = JsonResponse({"error": str(e)}, status=400)
+
+    return add_cors_headers(request, resp)
+
+@csrf_exempt
+@instrument("export_user_chats")
+async def export_user_chats(request):
+    if request.method == "OPTIONS":
+        resp = HttpResponse(status=204)
+        return add_cors_headers(request, resp)
+
+    if request.method != 'POST':
+        return JsonResponse({"error":"POST required"}, status=405)
+
+    auth_error, user = await auser_auth_middleware(request)
+    if auth_error:
+        return add_cors_headers(request, auth_error)
+
+    options_error, fmt, compress = read_export_options(request)
+    if options_error:
+        return add_cors_headers(request, options_error)
+
+    chunks = abuffered(export_pieces(fmt, user))
+    if compress:
+        chunks = agzipped(chunks)
+    return export_response(request, chunks, fmt, user, compress)
+
+
+async def readyz(request):
+    if request.method != 'GET':
+        return JsonResponse({"error":"GET required"}, status=405)
+    try:
+        return readiness(await ping())
+    except Exception as e:
+        print(f"Readiness check failed: {e}")
+        return readiness(error=e)
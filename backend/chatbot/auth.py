@@ -0,0 +1,145 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from django.core import signing
+from django.contrib.auth.hashers import check_password, identify_hasher, make_password
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+# Signed, stateless session tokens plus in-process caches so an authenticated request
+# normally needs no MongoDB read at all. The caches are per process: a password change
+# clears them only in the process that made it, so other workers keep accepting the old
+# password (and tokens issued before) for up to USER_CACHE_TTL seconds.
+SESSION_TTL_SECONDS = int(os.environ.get("SESSION_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", "2048"))
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", "300"))
+
+TOKEN_SALT = "chatbot.session"
+
+
+def hash_password(password: str) -> str:
+    return make_password(password)
+
+
+def is_hashed(stored: str) -> bool:
+    try:
+        identify_hasher(stored)
+        return True
+    except ValueError:
+        return False
+
+
+def verify_password(password: str, stored: str) -> bool:
+    # Accounts created before hashing still hold the plaintext; the caller upgrades them.
+    if is_hashed(stored):
+        return check_password(password, stored)
+    return bool(stored) and constant_time_compare(password, stored)
+
+
+def password_version(user) -> str:
+    # Changes whenever the stored password does, which revokes every token issued before.
+    return salted_hmac(TOKEN_SALT, user.password or "").hexdigest()[:12]
+
+
+def issue_token(user) -> str:
+    return signing.dumps({"uid": str(user.id), "pv": password_version(user)}, salt=TOKEN_SALT, compress=True)
+
+
+def read_token(token) -> Optional[dict]:
+    # token comes straight from the request body, so it may be any JSON value.
+    if not isinstance(token, str):
+        return None
+    try:
+        return signing.loads(token, salt=TOKEN_SALT, max_age=SESSION_TTL_SECONDS)
+    except signing.BadSignature:
+        return None
+
+
+def token_matches(payload: dict, user) -> bool:
+    return user is not None and constant_time_compare(payload.get("pv", ""), password_version(user))
+
+
+def request_token(request, body: dict) -> Optional[str]:
+    header = request.META.get("HTTP_AUTHORIZATION", "")
+    if header.startswith("Bearer "):
+        return header[len("Bearer "):].strip()
+    return body.get("token") or None
+
+
+def credential_key(password: str) -> str:
+    # Keyed digest so the login cache never holds plaintext passwords.
+    return salted_hmac(TOKEN_SALT + ".login", password).hexdigest()
+
+
+class TTLCache:
+    # Small thread-safe LRU with per-entry expiry.
+    def __init__(self, max_entries: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# user id (str) -> User, and email -> (credential_key, user id) for clients that still
+# send email/password with every request.
+user_cache = TTLCache()
+login_cache = TTLCache()
+
+
+def remember_user(user):
+    user_cache.set(str(user.id), user)
+
+
+def remember_login(user, password: str):
+    remember_user(user)
+    login_cache.set(user.email, (credential_key(password), str(user.id)))
+
+
+def cached_login(email: str, password: str):
+    entry = login_cache.get(email)
+    if entry is None or not constant_time_compare(entry[0], credential_key(password)):
+        return None
+    return user_cache.get(entry[1])
+
+
+def forget_user(user_id, email: Optional[str] = None):
+    # Called by the models whenever a user document changes.
+    user_cache.pop(str(user_id))
+    if email:
+        login_cache.pop(email)
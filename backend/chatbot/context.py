@@ -0,0 +1,110 @@
+import os
+from typing import Dict, List
+
+from .models import Chat, Conversation
+from .metrics import timed_call
+from .prompt import Prompt, assemble
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "3000"))
+SUMMARY_TOKEN_BUDGET = int(os.environ.get("SUMMARY_TOKEN_BUDGET", "300"))
+SUMMARY_LINE_WORDS = 30
+# Per-message framing the chat API adds on top of the content tokens.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    # Roughly 4 characters per token for English text when tiktoken is unavailable.
+    return (len(text) + 3) // 4
+
+
+def message_tokens(message: Dict) -> int:
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def to_message(conv) -> Dict:
+    return {"role": "assistant" if conv.role == "AI" else "user", "content": conv.message}
+
+
+def fold_summary(summary: str, conversations) -> str:
+    # Extractive rolling summary: one shortened line per evicted turn, oldest lines
+    # dropped once the summary outgrows SUMMARY_TOKEN_BUDGET.
+    lines = summary.split("\n") if summary else []
+    for conv in conversations:
+        words = conv.message.split()
+        text = " ".join(words[:SUMMARY_LINE_WORDS]) + (" ..." if len(words) > SUMMARY_LINE_WORDS else "")
+        lines.append(f"[{conv.role}] {text}")
+    while len(lines) > 1 and count_tokens("\n".join(lines)) > SUMMARY_TOKEN_BUDGET:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class ContextWindow:
+    # Fills the history newest-first until the next message would exceed the budget.
+    def __init__(self, prompt: Prompt, user_message: str, summary: str = "", budget: int = CONTEXT_TOKEN_BUDGET):
+        self.prompt = prompt
+        self.user_message = user_message
+        self.summary = summary
+        self.remaining = budget - sum(message_tokens(m) for m in assemble(prompt, user_message, summary=summary))
+        self.history: List[Dict] = []
+        self.full = False
+
+    def add(self, conv) -> bool:
+        message = to_message(conv)
+        cost = message_tokens(message)
+        if self.full or cost > self.remaining:
+            self.full = True
+            return False
+        self.remaining -= cost
+        self.history.append(message)
+        return True
+
+    def messages(self) -> List[Dict]:
+        return assemble(self.prompt, self.user_message, self.history[::-1], self.summary)
+
+
+@timed_call("prompt", "context")
+def build_context(chat, prompt: Prompt, user_message: str) -> List[Dict]:
+    while True:
+        window = ContextWindow(prompt, user_message, chat.summary)
+        evicted_from = None
+        for conv in Conversation.iter_newest_first(chat, after=chat.summary_until):
+            if not window.add(conv):
+                evicted_from = conv.id
+                break
+        if evicted_from is None:
+            return window.messages()
+
+        # Everything from the first message that did not fit back to the previous
+        # summary point is folded in once; later turns never revisit it.
+        evicted = Conversation.filter_by_chat_range(chat, after=chat.summary_until, upto=evicted_from)
+        chat.summary = fold_summary(chat.summary, evicted)
+        chat.summary_until = evicted_from
+        Chat.update_summary(chat.id, chat.summary, chat.summary_until)
+
+
+@timed_call("prompt", "context")
+async def abuild_context(chat, prompt: Prompt, user_message: str) -> List[Dict]:
+    from .async_models import Chat as AsyncChat, Conversation as AsyncConversation
+
+    while True:
+        window = ContextWindow(prompt, user_message, chat.summary)
+        evicted_from = None
+        async for conv in AsyncConversation.iter_newest_first(chat, after=chat.summary_until):
+            if not window.add(conv):
+                evicted_from = conv.id
+                break
+        if evicted_from is None:
+            return window.messages()
+
+        evicted = await AsyncConversation.filter_by_chat_range(chat, after=chat.summary_until, upto=evicted_from)
+        chat.summary = fold_summary(chat.summary, evicted)
+        chat.summary_until = evicted_from
+        await AsyncChat.update_summary(chat.id, chat.summary, chat.summary_until)
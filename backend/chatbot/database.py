@@ -1,31 +1,109 @@
 import os
-from pymongo import MongoClient
+import time
+import threading
+import pymongo
+from pymongo import MongoClient, ASCENDING, DESCENDING, TEXT
+from pymongo.errors import OperationFailure
 from bson import ObjectId
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
 from datetime import datetime
 from dotenv import load_dotenv
 
 load_dotenv()
 
-try:
-    mongo_client = MongoClient(os.environ.get("MONOGDB_CONNECTION_STRING"))
-    mongo_client.admin.command('ping')
-    db = mongo_client.ngmc_chatbot
-    users_collection = db.users
-    chats_collection = db.chats
-    conversations_collection = db.conversations
-    print("✅ MongoDB connection successful!")
-except Exception as e:
-    print(f"❌ MongoDB connection failed: {e}")
-    print("Please ensure MongoDB is running or check your MONGODB_CONNECTION_STRING")
-    exit(1)
-
-def ensure_tables():
-    try:
-        users_collection.create_index("email", unique=True)
-        users_collection.create_index("created_at")
-        chats_collection.create_index("user_id")
-        chats_collection.create_index("created_at")
-        conversations_collection.create_index([("chat_id", 1), ("created_at", 1)])
-        print("MongoDB indexes created successfully!")
-    except Exception as e:
-        print(f"Index creation info: {e}")
+# "memory" runs against an in-process mongomock store (offline load tests).
+MONGODB_BACKEND = os.environ.get("MONGODB_BACKEND", "mongodb")
+MONGODB_URI = os.environ.get("MONOGDB_CONNECTION_STRING")
+MONGODB_DB_NAME = os.environ.get("MONGODB_DB_NAME", "ngmc_chatbot")
+MONGODB_HEALTH_TIMEOUT = float(os.environ.get("MONGODB_HEALTH_TIMEOUT", "1"))
+
+# Pool and timeout settings shared by the sync and async clients (see pymongo's
+# MongoClient options). Nothing here opens a connection: the client connects on the
+# first operation, so importing this module never waits on the network.
+CLIENT_OPTIONS = {
+    "maxPoolSize": ("MONGODB_MAX_POOL_SIZE", int, 100),
+    "minPoolSize": ("MONGODB_MIN_POOL_SIZE", int, 0),
+    "maxIdleTimeMS": ("MONGODB_MAX_IDLE_MS", int, 300000),
+    "waitQueueTimeoutMS": ("MONGODB_WAIT_QUEUE_TIMEOUT_MS", int, 5000),
+    "connectTimeoutMS": ("MONGODB_CONNECT_TIMEOUT_MS", int, 5000),
+    "serverSelectionTimeoutMS": ("MONGODB_SERVER_SELECTION_TIMEOUT_MS", int, 5000),
+    "socketTimeoutMS": ("MONGODB_SOCKET_TIMEOUT_MS", int, 30000),
+    "readPreference": ("MONGODB_READ_PREFERENCE", str, "primary"),
+    "appname": ("MONGODB_APP_NAME", str, "ngmc-chatbot"),
+}
+
+# (collection, keys, options); created by ensure_indexes(). create_index() is a no-op
+# when an identical index already exists, so this is safe to run on every deploy.
+INDEXES = [
+    ("users", [("email", ASCENDING)], {"unique": True}),
+    ("users", [("created_at", ASCENDING)], {}),
+    ("chats", [("user_id", ASCENDING), ("_id", DESCENDING)], {}),
+    ("chats", [("created_at", ASCENDING)], {}),
+    ("conversations", [("chat_id", ASCENDING), ("_id", ASCENDING)], {}),
+    ("conversations", [("chat_id", ASCENDING), ("created_at", ASCENDING)], {}),
+    # Per-user message search (chatbot.search); $text queries must pass user_id.
+    ("conversations", [("user_id", ASCENDING), ("message", TEXT)],
+     {"name": "conversations_search", "default_language": "english"}),
+    # Background chat turns (chatbot.jobs): claiming, idempotency keys, expiry of finished jobs.
+    ("jobs", [("status", ASCENDING), ("run_at", ASCENDING)], {}),
+    ("jobs", [("user_id", ASCENDING), ("key", ASCENDING)],
+     {"unique": True, "partialFilterExpression": {"key": {"$type": "string"}}}),
+    ("jobs", [("expires", ASCENDING)], {"expireAfterSeconds": 0}),
+]
+
+
+def client_options():
+    return {name: cast(os.environ.get(env, default)) for name, (env, cast, default) in CLIENT_OPTIONS.items()}
+
+
+class Mongo:
+    def __init__(self):
+        if MONGODB_BACKEND == "memory":
+            import mongomock
+            from .mongo_memory import patch_bulk_updates
+            patch_bulk_updates()
+            self.client = mongomock.MongoClient()
+        else:
+            self.client = MongoClient(MONGODB_URI, connect=False, **client_options())
+        self.db = self.client[MONGODB_DB_NAME]
+        self.indexes_ready = False
+        self._index_lock = threading.Lock()
+
+    def ping(self, timeout: float = MONGODB_HEALTH_TIMEOUT):
+        # Round-trip time in ms; raises when the server cannot be reached within timeout.
+        started = time.perf_counter()
+        with pymongo.timeout(timeout):
+            self.client.admin.command("ping")
+        return (time.perf_counter() - started) * 1000
+
+    def ensure_indexes(self):
+        with self._index_lock:
+            for collection, keys, options in INDEXES:
+                try:
+                    self.db[collection].create_index(keys, **options)
+                except OperationFailure as e:
+                    # An existing index with the same keys but other options is left alone.
+                    print(f"Index {collection} {keys}: {e}")
+            self.indexes_ready = True
+        print("MongoDB indexes ensured")
+
+
+mongo = Mongo()
+mongo_client = mongo.client
+db = mongo.db
+users_collection = db.users
+chats_collection = db.chats
+conversations_collection = db.conversations
+# List reads of conversations get documents that decode fields only when read, so
+# message bodies stay as compact BSON until serialized. mongomock has no
+# RawBSONDocument support; the memory backend keeps plain dicts.
+if MONGODB_BACKEND == "memory":
+    lazy_conversations_collection = conversations_collection
+else:
+    lazy_conversations_collection = conversations_collection.with_options(
+        codec_options=CodecOptions(document_class=RawBSONDocument))
+
+
+def ensure_indexes():
+    mongo.ensure_indexes()
@@ -0,0 +1,140 @@
+import os
+import json
+import zlib
+from django.core.serializers.json import DjangoJSONEncoder
+from .database import chats_collection, conversations_collection
+from .models import Chat, Conversation, CONVERSATION_FIELDS
+from .write_behind import write_behind
+
+# Chat history export as JSON or NDJSON, written piece by piece while walking Mongo
+# cursors, so memory stays flat however many chats and messages an account has.
+EXPORT_BATCH_CHATS = int(os.environ.get("EXPORT_BATCH_CHATS", "100"))
+EXPORT_CHUNK_BYTES = int(os.environ.get("EXPORT_CHUNK_BYTES", str(64 * 1024)))
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+}
+EXPORT_CHAT_FIELDS = {'title': 1, 'user_id': 1, 'created_at': 1}
+# Messages arrive ordered like the chats they belong to, for the merge in export_pieces().
+EXPORT_MESSAGE_SORT = [('chat_id', 1), ('_id', 1)]
+
+def json_bytes(value):
+    return json.dumps(value, cls=DjangoJSONEncoder).encode()
+
+def serialize_conversation(conv):
+    return {
+        'id': str(conv.id),
+        'role': conv.role,
+        'message': conv.message,
+        'created_at': conv.created_at.isoformat()
+    }
+
+def serialize_chat(chat, conversations):
+    return {
+        'id': str(chat.id),
+        'title': chat.title,
+        'user_id': str(chat.user_id) if chat.user_id else None,
+        'created_at': chat.created_at.isoformat(),
+        'conversations': [serialize_conversation(conv) for conv in conversations]
+    }
+
+def document_frame(fmt, user=None):
+    # (opening, separator between chats, closing). NDJSON is one chat per line; JSON has
+    # the same shape as /getuserchats/.
+    if fmt == 'ndjson':
+        return b"", b"", b""
+    opening = b'{"chats": ['
+    if user is not None:
+        opening = b'{"user": ' + json_bytes({
+            "id": str(user.id),
+            "userName": user.userName,
+            "email": user.email
+        }) + b', "chats": ['
+    return opening, b", ", b"]}\n"
+
+def chat_head(chat_data):
+    # serialize_chat() output up to and including the opening "[" of its conversations.
+    return json_bytes(serialize_chat(Chat.from_doc(chat_data), []))[:-2]
+
+def chat_tail(fmt):
+    return b"]}\n" if fmt == 'ndjson' else b"]}"
+
+def message_bytes(conv_data, first):
+    encoded = json_bytes(serialize_conversation(Conversation.from_doc(conv_data)))
+    return encoded if first else b", " + encoded
+
+def chat_query(user=None, after=None):
+    query = {'user_id': user.id} if user is not None else {}
+    if after is not None:
+        query['_id'] = {'$gt': after}
+    return query
+
+def export_pieces(fmt='ndjson', user=None, batch_size=EXPORT_BATCH_CHATS):
+    # Chats are paged by _id (oldest first) and each page's messages come from one cursor
+    # sorted by chat, so a message is encoded and dropped as soon as it is read.
+    write_behind.settle_all()
+    opening, separator, closing = document_frame(fmt, user)
+    yield opening
+    last_id = None
+    first = True
+    while True:
+        chats = list(chats_collection.find(chat_query(user, last_id), EXPORT_CHAT_FIELDS).sort('_id', 1).limit(batch_size))
+        if not chats:
+            break
+        last_id = chats[-1]['_id']
+        messages = conversations_collection.find(
+            {'chat_id': {'$in': [chat_data['_id'] for chat_data in chats]}}, CONVERSATION_FIELDS
+        ).sort(EXPORT_MESSAGE_SORT)
+        pending = next(messages, None)
+        for chat_data in chats:
+            yield chat_head(chat_data) if first else separator + chat_head(chat_data)
+            first = False
+            count = 0
+            while pending is not None and pending['chat_id'] == chat_data['_id']:
+                yield message_bytes(pending, count == 0)
+                count += 1
+                pending = next(messages, None)
+            yield chat_tail(fmt)
+    yield closing
+
+def buffered(pieces, size=EXPORT_CHUNK_BYTES):
+    # Coalesce the many small pieces into chunks of about `size` bytes per write.
+    buffer = bytearray()
+    for piece in pieces:
+        buffer += piece
+        if len(buffer) >= size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+def gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+async def abuffered(pieces, size=EXPORT_CHUNK_BYTES):
+    buffer = bytearray()
+    async for piece in pieces:
+        buffer += piece
+        if len(buffer) >= size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+async def agzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_filename(fmt, user=None, compress=False):
+    name = f"chats-{user.id}" if user is not None else "chats"
+    return f"{name}.{fmt}" + (".gz" if compress else "")
@@ -0,0 +1,105 @@
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Iterator, List, Tuple
+
+FAKE_LLM_TTFT = float(os.environ.get("FAKE_LLM_TTFT", "0.2"))
+FAKE_LLM_TOKEN_DELAY = float(os.environ.get("FAKE_LLM_TOKEN_DELAY", "0.02"))
+# The stub behind the small routing tier answers this much sooner by default.
+FAKE_LLM_SMALL_TTFT = float(os.environ.get("FAKE_LLM_SMALL_TTFT", str(FAKE_LLM_TTFT / 4)))
+# Share of calls that fail with a connection error, to exercise retries and fallbacks.
+FAKE_LLM_FAILURE_RATE = float(os.environ.get("FAKE_LLM_FAILURE_RATE", "0"))
+# Prompt prefix caching like OpenAI's: prefixes seen before are cached once they reach
+# FAKE_LLM_CACHE_MIN_TOKENS, in steps of 128 tokens. The stub only matches whole messages.
+FAKE_LLM_CACHE_MIN_TOKENS = int(os.environ.get("FAKE_LLM_CACHE_MIN_TOKENS", "1024"))
+FAKE_LLM_CACHE_PREFIXES = 4096
+
+TOKEN_RE = re.compile(r"\s*\S+")
+
+
+# Deterministic stand-in for the OpenAI chat API, used offline and in benchmarks.
+class FakeLLM:
+    def __init__(self, ttft: float = FAKE_LLM_TTFT, token_delay: float = FAKE_LLM_TOKEN_DELAY,
+                 failure_rate: float = FAKE_LLM_FAILURE_RATE, seed: int = 0):
+        self.ttft = ttft
+        self.token_delay = token_delay
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        # Upstream calls received, so benchmarks can tell how many requests reached "OpenAI".
+        self.calls = 0
+        self._prefixes: "OrderedDict[bytes, None]" = OrderedDict()
+        self._prefix_lock = threading.Lock()
+
+    def reply_for(self, messages: List[Dict]) -> str:
+        question = messages[-1]["content"] if messages else ""
+        reply = (
+            f"This is a canned NGMC answer to: {question}. "
+            "Please check https://www.ngmc.org for the latest official information."
+        )
+        title = " ".join(question.split()[:3]) or "NGMC Query"
+        return json.dumps({"reply": reply, "title": title})
+
+    def tokens(self, text: str) -> List[str]:
+        return TOKEN_RE.findall(text)
+
+    def prompt_tokens(self, messages: List[Dict]) -> Tuple[int, int]:
+        # (prompt tokens, of which served from the simulated prefix cache)
+        digest, total, cached = hashlib.sha1(), 0, 0
+        with self._prefix_lock:
+            for message in messages:
+                content = str(message["content"])
+                digest.update(json.dumps([message["role"], content]).encode())
+                key = digest.digest()
+                hit = key in self._prefixes and cached == total
+                total += len(self.tokens(content))
+                if hit:
+                    cached = total
+                self._prefixes[key] = None
+                self._prefixes.move_to_end(key)
+            while len(self._prefixes) > FAKE_LLM_CACHE_PREFIXES:
+                self._prefixes.popitem(last=False)
+        if cached < FAKE_LLM_CACHE_MIN_TOKENS:
+            return total, 0
+        return total, cached - (cached - FAKE_LLM_CACHE_MIN_TOKENS) % 128
+
+    def maybe_fail(self):
+        if self.failure_rate and self.rng.random() < self.failure_rate:
+            raise ConnectionError("fake LLM: injected failure")
+
+    def complete(self, messages: List[Dict]) -> str:
+        self.calls += 1
+        self.maybe_fail()
+        text = self.reply_for(messages)
+        time.sleep(self.ttft + self.token_delay * max(len(self.tokens(text)) - 1, 0))
+        return text
+
+    def stream(self, messages: List[Dict]) -> Iterator[str]:
+        self.calls += 1
+        self.maybe_fail()
+        time.sleep(self.ttft)
+        for i, token in enumerate(self.tokens(self.reply_for(messages))):
+            if i:
+                time.sleep(self.token_delay)
+            yield token
+
+    async def acomplete(self, messages: List[Dict]) -> str:
+        self.calls += 1
+        self.maybe_fail()
+        text = self.reply_for(messages)
+        await asyncio.sleep(self.ttft + self.token_delay * max(len(self.tokens(text)) - 1, 0))
+        return text
+
+    async def astream(self, messages: List[Dict]) -> AsyncIterator[str]:
+        self.calls += 1
+        self.maybe_fail()
+        await asyncio.sleep(self.ttft)
+        for i, token in enumerate(self.tokens(self.reply_for(messages))):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            yield token
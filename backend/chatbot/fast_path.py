@@ -0,0 +1,386 @@
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Set
+
+from .metrics import Counter, timed_call
+from .pdf_index import get_pdf_index
+from .retrieval import LINKS_JSON_PATH, STOPWORDS, catalogue_version, load_catalogue
+
+# Link lookups ("UG 5th sem exam timetable", "BCA syllabus", "fee structure 2020")
+# answered straight from ngmc_college_links.json: the query and every catalogue key are
+# parsed into the same facets (programme, SF/aided, semester, session, test, month, year,
+# course) and the matching links are formatted as the reply. Only used for first turns
+# where every content word of the query is accounted for, nothing negates or questions
+# it, and few links match; anything else goes to the LLM. So does a query the PDF index
+# can answer better: one asking for what a document says (a date, an amount), or one
+# whose best excerpt comes from a document other than the links found.
+FAST_PATH = os.environ.get("FAST_PATH", "1") != "0"
+FAST_PATH_MIN_CONFIDENCE = float(os.environ.get("FAST_PATH_MIN_CONFIDENCE", "1.0"))
+FAST_PATH_MAX_LINKS = int(os.environ.get("FAST_PATH_MAX_LINKS", "4"))
+
+QUERY_TOKEN_RE = re.compile(r"[a-z]+|\d+")
+
+MONTHS = {
+    "january": 1, "jan": 1, "february": 2, "feb": 2, "march": 3, "mar": 3, "april": 4, "apr": 4,
+    "may": 5, "june": 6, "jun": 6, "july": 7, "jul": 7, "august": 8, "aug": 8,
+    "september": 9, "sep": 9, "sept": 9, "october": 10, "oct": 10, "november": 11, "nov": 11,
+    "december": 12, "dec": 12,
+}
+MONTH_NAMES = ["", "January", "February", "March", "April", "May", "June", "July", "August",
+               "September", "October", "November", "December"]
+ROMAN = {"i": 1, "ii": 2, "iii": 3, "iv": 4}
+
+# Words that say which category is meant, by catalogue category.
+CATEGORY_WORDS = {
+    "seating_arrangements": {"seating", "seat", "arrangement", "arrangements", "hall"},
+    "fee_structure": {"fee", "fees", "structure", "payment", "tuition"},
+    "syllabus": {"syllabus", "syllabi", "curriculum"},
+    "exam_schedule": {"exam", "exams", "examination", "timetable", "tt", "schedule", "time", "table"},
+}
+# When several match ("exam seating arrangement"), the more specific category wins.
+CATEGORY_PRIORITY = ["seating_arrangements", "fee_structure", "syllabus", "exam_schedule"]
+CATEGORY_LABELS = {
+    "exam_schedule": "Exam Timetable",
+    "fee_structure": "Fee Structure",
+    "seating_arrangements": "Seating Arrangement",
+    "syllabus": "Syllabus",
+}
+# Words that turn a link lookup into a question about the document ("when is the exam",
+# "not the timetable", "I don't need ..."): such queries always go to the LLM.
+BLOCKING_WORDS = {"not", "no", "never", "nor", "without", "except", "don", "dont", "didn", "isn",
+                  "when", "why", "how", "where"}
+# Words asking for what a document says rather than for its link: the LLM answers from
+# the PDF excerpt instead.
+CONTENT_WORDS = {"much", "many", "date", "dates", "day", "days", "deadline",
+                 "amount", "amounts", "cost", "costs", "price", "total", "rs", "rupees"}
+FILLER_WORDS = (set(STOPWORDS) | {
+    "download", "find", "share", "kindly", "ngmc", "college", "latest", "current", "details",
+    "list", "all", "this", "that", "it", "with", "by", "from", "at", "be", "will", "hi", "hello",
+}) - BLOCKING_WORDS
+
+# Spellings students use for course names, rewritten to the abbreviations in the keys.
+COURSE_ALIASES = [
+    (re.compile(r"\bcomputer science\b"), "cs"),
+    (re.compile(r"\bcomputer applications?\b"), "ca"),
+    (re.compile(r"\binformation technology\b"), "it"),
+    (re.compile(r"\bcomputer technology\b"), "ct"),
+    (re.compile(r"\bartificial intelligence\b"), "ai"),
+    (re.compile(r"\bmachine learning\b"), "ml"),
+    (re.compile(r"\bdata analytics\b"), "da"),
+    (re.compile(r"\b(mathematics|math)\b"), "maths"),
+    (re.compile(r"\bb\s*\.?\s*com\b"), "bcom"),
+    (re.compile(r"\bm\s*\.?\s*com\b"), "mcom"),
+    (re.compile(r"\bb\s*\.?\s*sc\b"), "bsc"),
+    (re.compile(r"\bm\s*\.?\s*sc\b"), "msc"),
+    (re.compile(r"\bb\s*\.\s*a\b"), "ba"),
+    (re.compile(r"\bm\s*\.\s*a\b"), "ma"),
+]
+
+fast_path_total = Counter("ngmc_fast_path_total", "Queries checked by the link-lookup fast path", ["outcome", "category"])
+
+
+def ordinal(n: int) -> str:
+    suffix = "th" if 10 <= n % 100 <= 20 else {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th")
+    return f"{n}{suffix}"
+
+
+def compact(text: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", text.lower())
+
+
+class Entry:
+    __slots__ = ("category", "key", "url", "programmes", "sf", "aided", "semesters", "session",
+                 "test", "month", "years", "date", "course")
+
+    def __init__(self, category: str, key: str, url: str):
+        self.category = category
+        self.key = key
+        self.url = url
+        name = re.sub(r"\.pdf$", "", key, flags=re.I)
+        upper = name.upper()
+        words = set(re.findall(r"[A-Z]+|\d+", upper.replace("_", " ")))
+        self.programmes = {p for p in ("UG", "PG") if p in words}
+        self.sf = "SF" in words
+        self.aided = "AIDED" in words
+        semesters = re.findall(r"(\d)\s*-?\s*TT", upper)
+        span = re.search(r"(\d)-(\d)-SEM", upper)
+        if span:
+            semesters = list(range(int(span.group(1)), int(span.group(2)) + 1))
+        self.semesters = {int(s) for s in semesters}
+        self.session = "FN" if re.search(r"F_?N\b", upper) else "AN" if re.search(r"(?<![A-Z])AN(?![A-Z])", upper) else None
+        test = re.search(r"TEST-(I{1,3}|IV)\b", upper)
+        self.test = ROMAN[test.group(1).lower()] if test else None
+        date = re.search(r"(\d{2})_(\d{2})_(\d{4})", name)
+        self.date = f"{date.group(1)}-{date.group(2)}-{date.group(3)}" if date else None
+        month = next((MONTHS[w.lower()] for w in re.findall(r"[A-Za-z]+", name) if w.lower() in MONTHS and len(w) > 3), None)
+        self.month = month or (int(date.group(2)) if date else None)
+        self.years = {int(y) for y in re.findall(r"(?<!\d)(20\d{2})(?!\d)", name)}
+        self.course = compact(name) if category == "syllabus" and not self.years else None
+
+    def describe(self) -> str:
+        if self.category == "exam_schedule":
+            parts = []
+            if self.programmes:
+                parts.append("/".join(sorted(self.programmes)) + (" SF" if self.sf else ""))
+            if self.semesters:
+                parts.append(f"{ordinal(min(self.semesters))} semester")
+            if self.session:
+                parts.append("forenoon" if self.session == "FN" else "afternoon")
+            if self.test:
+                parts.append(f"Test {self.test}")
+            if self.month and self.years:
+                parts.append(f"{MONTH_NAMES[self.month]} {max(self.years)}")
+            if parts and self.programmes:
+                return ", ".join(parts)
+        if self.category == "seating_arrangements" and self.date:
+            test = f"Test {self.test} " if self.test else ""
+            return f"{'SF ' if self.sf else ''}{test}seating arrangement, {self.date}"
+        return pretty_key(self.key)
+
+
+def pretty_key(key: str) -> str:
+    name = re.sub(r"\.pdf$", "", key, flags=re.I)
+    name = name.replace("B_Sc_", "B.Sc ").replace("M_Sc_", "M.Sc ").replace("B_A", "B.A")
+    return re.sub(r"\s+", " ", re.sub(r"[-_]+", " ", name)).strip()
+
+
+class Query:
+    def __init__(self, text: str):
+        lowered = text.lower()
+        for pattern, replacement in COURSE_ALIASES:
+            lowered = pattern.sub(replacement, lowered)
+        self.tokens = QUERY_TOKEN_RE.findall(lowered)
+        self.explained: Set[int] = set()
+        self.category = None
+        self.programme = None
+        self.sf = None
+        self.semesters: Set[int] = set()
+        self.session = None
+        self.test = None
+        self.month = None
+        self.year = None
+        self.course = None
+        self._parse()
+
+    def _mark(self, *indexes):
+        self.explained.update(indexes)
+
+    def _parse(self):
+        tokens = self.tokens
+        found = set()
+        for i, tok in enumerate(tokens):
+            nxt = tokens[i + 1] if i + 1 < len(tokens) else ""
+            after = tokens[i + 2] if i + 2 < len(tokens) else ""
+            for category, words in CATEGORY_WORDS.items():
+                if tok in words:
+                    found.add(category)
+                    self._mark(i)
+            if tok in ("ug", "undergraduate"):
+                self.programme = "UG"
+                self._mark(i)
+            elif tok in ("pg", "postgraduate"):
+                self.programme = "PG"
+                self._mark(i)
+            elif tok == "sf" or (tok == "self" and nxt in ("financing", "finance")):
+                self.sf = True
+                self._mark(i, i + 1) if tok == "self" else self._mark(i)
+            elif tok == "aided":
+                self.sf = False
+                self._mark(i)
+            elif tok in ("fn", "forenoon", "morning"):
+                self.session = "FN"
+                self._mark(i)
+            elif tok == "afternoon":
+                self.session = "AN"
+                self._mark(i)
+            elif tok in MONTHS:
+                self.month = MONTHS[tok]
+                self._mark(i)
+            elif tok.isdigit() and len(tok) == 4 and tok.startswith("20"):
+                self.year = int(tok)
+                self._mark(i)
+            elif tok.isdigit() or tok in ROMAN:
+                n = int(tok) if tok.isdigit() else ROMAN[tok]
+                # "5th sem", "5 semester", "3rd year", "test 1" / "test i"
+                unit, unit_at = (after, i + 2) if nxt in ("st", "nd", "rd", "th") else (nxt, i + 1)
+                if unit in ("sem", "semester", "semesters") and 1 <= n <= 8:
+                    self.semesters = {n}
+                    self._mark(i, unit_at, i + 1)
+                elif unit in ("year", "yr", "years") and 1 <= n <= 4:
+                    self.semesters = {2 * n - 1, 2 * n}
+                    self._mark(i, unit_at, i + 1)
+                elif i > 0 and tokens[i - 1] in ("test", "cia", "internal"):
+                    self.test = n
+                    self._mark(i - 1, i)
+            elif tok in ("semester", "sem") and nxt.isdigit():
+                self.semesters = {int(nxt)}
+                self._mark(i, i + 1)
+            elif tok in ("test", "internal", "cia", "exam"):
+                self._mark(i)
+        for category in CATEGORY_PRIORITY:
+            if category in found:
+                self.category = category
+                break
+
+    def match_course(self, courses: Set[str]):
+        # Longest catalogue course name spelled by consecutive query words ("bcom ca").
+        best = None
+        for start in range(len(self.tokens)):
+            joined = ""
+            for end in range(start, len(self.tokens)):
+                joined += self.tokens[end]
+                if joined in courses and (best is None or len(joined) > len(best[0])):
+                    best = (joined, start, end)
+        if best:
+            self.course = best[0]
+            self._mark(*range(best[1], best[2] + 1))
+
+    def confidence(self) -> float:
+        if any(tok in BLOCKING_WORDS for tok in self.tokens):
+            return 0.0
+        words = [i for i, tok in enumerate(self.tokens) if tok not in FILLER_WORDS or i in self.explained]
+        if not words:
+            return 0.0
+        return sum(1 for i in words if i in self.explained) / len(words)
+
+
+class LinkLookup:
+    def __init__(self, catalogue: Dict[str, Dict[str, str]], version=None):
+        self.version = version
+        self.entries: Dict[str, List[Entry]] = {
+            category: [Entry(category, key, url) for key, url in links.items()]
+            for category, links in catalogue.items()
+        }
+        self.courses = {e.course for e in self.entries.get("syllabus", []) if e.course}
+
+    def _select(self, query: Query, category: str) -> List[Entry]:
+        entries = self.entries.get(category, [])
+        # A facet only narrows the search where the category's keys carry it; otherwise
+        # the word stays unexplained and lowers the confidence.
+        if query.programme:
+            if any(e.programmes for e in entries):
+                entries = [e for e in entries if query.programme in e.programmes]
+            else:
+                self._unexplain(query, ("ug", "pg", "undergraduate", "postgraduate"))
+        if query.sf is not None and any(e.sf for e in entries):
+            entries = [e for e in entries if e.sf == query.sf]
+        if query.semesters:
+            if any(e.semesters for e in entries):
+                entries = [e for e in entries if e.semesters & query.semesters]
+            else:
+                self._unexplain(query, ("sem", "semester", "year", "yr"))
+        if query.session and any(e.session for e in entries):
+            entries = [e for e in entries if e.session in (query.session, None)]
+        if query.test and any(e.test for e in entries):
+            entries = [e for e in entries if e.test == query.test]
+        if query.month:
+            entries = [e for e in entries if e.month == query.month]
+        if query.year:
+            entries = [e for e in entries if query.year in e.years]
+        if category == "syllabus":
+            entries = [e for e in entries if query.course and e.course == query.course]
+        return sorted(entries, key=lambda e: -max(e.years, default=0))
+
+    @staticmethod
+    def _unexplain(query: Query, words):
+        query.explained -= {i for i, tok in enumerate(query.tokens) if tok in words}
+
+    def resolve(self, query: Query) -> Optional[List[Entry]]:
+        # The links that answer the query, or None when it is not a confident lookup.
+        if query.category is None:
+            return None
+        if query.category == "syllabus":
+            query.match_course(self.courses)
+        entries = self._select(query, query.category)
+        if not entries or len(entries) > FAST_PATH_MAX_LINKS or query.confidence() < FAST_PATH_MIN_CONFIDENCE:
+            return None
+        return entries
+
+    def answer(self, query: Query) -> Optional[Dict]:
+        entries = self.resolve(query)
+        return None if entries is None else reply_for(query, entries)
+
+
+def subject(query: Query, entries: List[Entry]) -> str:
+    label = CATEGORY_LABELS[query.category]
+    if query.category == "syllabus":
+        return f"{pretty_key(entries[0].key)} {label}"
+    parts = []
+    if query.programme:
+        parts.append(query.programme)
+    if query.sf:
+        parts.append("SF")
+    if len(query.semesters) == 1:
+        parts.append(f"Sem {min(query.semesters)}")
+    elif query.semesters:
+        parts.append(f"Year {max(query.semesters) // 2}")
+    if query.year and query.category == "fee_structure":
+        parts.append(str(query.year))
+    return " ".join(parts + [label])
+
+
+def reply_for(query: Query, entries: List[Entry]) -> Dict:
+    return {"reply": format_reply(query, entries), "title": make_title(query, entries)}
+
+
+def make_title(query: Query, entries: List[Entry]) -> str:
+    # Same limit the prompt gives the LLM: under four words where possible.
+    words = subject(query, entries).split()
+    for optional in ("Exam", "SF", "Structure"):
+        if len(words) > 4 and optional in words:
+            words.remove(optional)
+    return " ".join(words[:4])
+
+
+def format_reply(query: Query, entries: List[Entry]) -> str:
+    what = subject(query, entries)
+    intro = f"Here is the **{what}**:" if len(entries) == 1 else f"Here are the **{what}** links:"
+    names = [e.describe() for e in entries]
+    if len(set(names)) < len(names):
+        names = [pretty_key(e.key) for e in entries]
+    lines = [f"- **{name}**: {e.url}" for name, e in zip(names, entries)]
+    return "\n".join([intro] + lines + ["", "For the latest updates, check https://www.ngmc.org"])
+
+
+_lookup = None
+_lookup_lock = threading.Lock()
+
+
+def get_link_lookup(path: str = LINKS_JSON_PATH) -> LinkLookup:
+    # Rebuilt whenever the catalogue file changes, like retrieval.get_link_index().
+    global _lookup
+    version = catalogue_version(path)
+    lookup = _lookup
+    if lookup is not None and lookup.version == version:
+        return lookup
+    with _lookup_lock:
+        if _lookup is None or _lookup.version != version:
+            _lookup = LinkLookup(load_catalogue(path), version)
+        return _lookup
+
+
+@timed_call("fast_path")
+def fast_answer(user_message: str) -> Optional[Dict]:
+    # {"reply", "title"} like a parsed LLM response, or None to ask the LLM.
+    if not FAST_PATH:
+        return None
+    query = Query(user_message)
+    entries = get_link_lookup().resolve(query)
+    if entries is not None and pdf_answers(query, entries, user_message):
+        # The PDF has the answer itself; the LLM quotes it instead of only linking it.
+        fast_path_total.inc(outcome="pdf", category=query.category)
+        return None
+    fast_path_total.inc(outcome="fallback" if entries is None else "answered", category=query.category or "")
+    return None if entries is None else reply_for(query, entries)
+
+
+def pdf_answers(query: Query, entries: List[Entry], user_message: str) -> bool:
+    # A plain lookup keeps its links even when the PDF index matches the same document.
+    index = get_pdf_index()
+    hits = index.search(user_message, 1) if index is not None else []
+    if not hits:
+        return False
+    _, category, key = hits[0][:3]
+    return bool(CONTENT_WORDS.intersection(query.tokens)) or not any(
+        e.category == category and e.key == key for e in entries)
@@ -0,0 +1,305 @@
+import os
+import time
+import socket
+import asyncio
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from .database import db
+from .llm import LLMError
+from .metrics import Counter, Gauge, current_endpoint
+from .models import CHAT_RECENT_MESSAGES
+from .rate_limit import RateLimited
+from .utils import LLM_ERROR_REPLY
+from .write_behind import write_behind
+
+# Chat turns run in the background: a submit endpoint stores the turn in the `jobs`
+# collection and returns its id at once, worker threads claim and answer jobs, and
+# clients poll (or long-poll) for the result. A claimed job is leased: if its worker dies,
+# the lease runs out and another worker picks it up, so queued and running turns survive
+# restarts. The reply and the ids of the documents a turn writes are stored on the job
+# before the turn is saved, so a rerun never saves a turn twice.
+JOBS_WORKERS = int(os.environ.get("JOBS_WORKERS", "2"))  # per process; 0: this process only submits
+JOBS_POLL_INTERVAL = float(os.environ.get("JOBS_POLL_INTERVAL", "0.5"))
+JOBS_LEASE_SECONDS = float(os.environ.get("JOBS_LEASE_SECONDS", "300"))
+JOBS_MAX_ATTEMPTS = int(os.environ.get("JOBS_MAX_ATTEMPTS", "3"))
+JOBS_RETRY_DELAY = float(os.environ.get("JOBS_RETRY_DELAY", "5"))  # doubled after each failed attempt
+JOBS_MAX_WAIT = float(os.environ.get("JOBS_MAX_WAIT", "25"))
+JOBS_RESULT_TTL = float(os.environ.get("JOBS_RESULT_TTL", str(7 * 24 * 3600)))
+IDEMPOTENCY_KEY_MAX_CHARS = 200
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+JOB_FIELDS = {'user_id': 1, 'chat_id': 1, 'new_chat': 1, 'message': 1, 'status': 1, 'result': 1,
+              'error': 1, 'created_at': 1, 'finished_at': 1}
+
+jobs_total = Counter("ngmc_jobs_total", "Chat-turn jobs by outcome", ["outcome"])
+
+
+class JobConflict(Exception):
+    # The idempotency key was already used for a different turn.
+    pass
+
+
+def new_job(user_id, message: str, chat_id=None, key: Optional[str] = None) -> Dict:
+    now = datetime.now()
+    job = {
+        '_id': ObjectId(),
+        'user_id': user_id,
+        # A new chat's id is allocated now, so the client gets it with the job id.
+        'chat_id': chat_id or ObjectId(),
+        'new_chat': chat_id is None,
+        'message': message,
+        'status': QUEUED,
+        'attempts': 0,
+        # When the job may next be claimed: now, after a retry delay, or when a lease ends.
+        'run_at': now,
+        'created_at': now,
+    }
+    if key:
+        job['key'] = key
+    return job
+
+
+def same_turn(job: Dict, message: str, chat_id) -> bool:
+    return job['message'] == message and job['new_chat'] == (chat_id is None) and (chat_id is None or job['chat_id'] == chat_id)
+
+
+def job_view(job: Dict) -> Dict:
+    view = {
+        'jobId': str(job['_id']),
+        'status': job['status'],
+        'chatId': str(job['chat_id']),
+        'created_at': job['created_at'].isoformat(),
+    }
+    if job['status'] == DONE:
+        view['reply'] = job['result']['reply']
+        if job['new_chat']:
+            view['title'] = job['result']['title']
+    elif job['status'] == FAILED:
+        view['error'] = job.get('error') or LLM_ERROR_REPLY
+    return view
+
+
+def job_query(job_id, user_id) -> Optional[Dict]:
+    if not ObjectId.is_valid(job_id):
+        return None
+    return {'_id': ObjectId(job_id), 'user_id': user_id}
+
+
+def finished(job: Optional[Dict]) -> bool:
+    return job is None or job['status'] in (DONE, FAILED)
+
+
+class JobQueue:
+    def __init__(self, workers: int = JOBS_WORKERS, interval: float = JOBS_POLL_INTERVAL):
+        self.workers = workers
+        self.interval = interval
+        self.running = 0
+        self._threads = []
+        self._stopped = False
+        self._lock = threading.Lock()
+        self._work = threading.Condition()
+        self._finished = threading.Condition()
+        self._prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+    def collection(self):
+        return db.jobs
+
+    def submit(self, user_id, message: str, chat_id=None, key: Optional[str] = None) -> Tuple[Dict, bool]:
+        # (job, created); with a key already used for the same turn, the existing job.
+        job = new_job(user_id, message, chat_id, key)
+        try:
+            self.collection().insert_one(job)
+        except DuplicateKeyError:
+            return self._existing(self.collection().find_one({'user_id': user_id, 'key': key}), message, chat_id)
+        jobs_total.inc(outcome="submitted")
+        self.wake()
+        return job, True
+
+    async def asubmit(self, user_id, message: str, chat_id=None, key: Optional[str] = None) -> Tuple[Dict, bool]:
+        from .async_database import db as adb
+        job = new_job(user_id, message, chat_id, key)
+        try:
+            await adb.jobs.insert_one(job)
+        except DuplicateKeyError:
+            return self._existing(await adb.jobs.find_one({'user_id': user_id, 'key': key}), message, chat_id)
+        jobs_total.inc(outcome="submitted")
+        self.wake()
+        return job, True
+
+    def _existing(self, job, message, chat_id) -> Tuple[Dict, bool]:
+        if job is None or not same_turn(job, message, chat_id):
+            raise JobConflict("Idempotency key was already used for a different message")
+        jobs_total.inc(outcome="deduplicated")
+        return job, False
+
+    def wait(self, job_id, user_id, timeout: float = 0.0) -> Optional[Dict]:
+        # The job (None if it is not this user's), once finished or after `timeout` seconds.
+        query = job_query(job_id, user_id)
+        if query is None:
+            return None
+        deadline = time.monotonic() + min(max(timeout, 0.0), JOBS_MAX_WAIT)
+        while True:
+            job = self.collection().find_one(query, JOB_FIELDS)
+            remaining = deadline - time.monotonic()
+            if finished(job) or remaining <= 0:
+                return job
+            # Woken early when a worker in this process finishes a job; jobs finished by
+            # other processes are seen on the next poll.
+            with self._finished:
+                self._finished.wait(min(remaining, self.interval))
+
+    async def await_job(self, job_id, user_id, timeout: float = 0.0) -> Optional[Dict]:
+        from .async_database import db as adb
+        query = job_query(job_id, user_id)
+        if query is None:
+            return None
+        deadline = time.monotonic() + min(max(timeout, 0.0), JOBS_MAX_WAIT)
+        while True:
+            job = await adb.jobs.find_one(query, JOB_FIELDS)
+            remaining = deadline - time.monotonic()
+            if finished(job) or remaining <= 0:
+                return job
+            await asyncio.sleep(min(remaining, self.interval))
+
+    def start(self):
+        if self.workers <= 0 or self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            self._stopped = False
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, args=(f"{self._prefix}:{i}",), name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        # Jobs still running are picked up again once their lease ends.
+        self._stopped = True
+        self.wake()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def wake(self):
+        with self._work:
+            self._work.notify_all()
+
+    def _run(self, worker: str):
+        current_endpoint.set("jobs")
+        while not self._stopped:
+            try:
+                job = self.claim(worker)
+            except Exception as e:
+                print(f"Job claim failed: {e}")
+                job = None
+            if job is None:
+                with self._work:
+                    self._work.wait(self.interval)
+                continue
+            with self._lock:
+                self.running += 1
+            try:
+                self.run(job)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                with self._finished:
+                    self._finished.notify_all()
+
+    def claim(self, worker: str) -> Optional[Dict]:
+        now = datetime.now()
+        return self.collection().find_one_and_update(
+            {'status': {'$in': [QUEUED, RUNNING]}, 'run_at': {'$lte': now}},
+            {'$set': {'status': RUNNING, 'worker': worker, 'run_at': now + timedelta(seconds=JOBS_LEASE_SECONDS)},
+             '$inc': {'attempts': 1}},
+            sort=[('run_at', 1)], return_document=ReturnDocument.AFTER)
+
+    def _update(self, job: Dict, fields: Dict, inc: Optional[Dict] = None) -> bool:
+        # Only while this attempt still holds the job: a worker whose lease ran out and
+        # whose job was claimed again must not overwrite the new attempt.
+        update = {'$set': fields}
+        if inc:
+            update['$inc'] = inc
+        result = self.collection().update_one(
+            {'_id': job['_id'], 'worker': job['worker'], 'attempts': job['attempts']}, update)
+        return result.matched_count == 1
+
+    def _finish(self, job: Dict, status: str, **fields):
+        fields.update(status=status, finished_at=datetime.now(),
+                      expires=datetime.now(timezone.utc) + timedelta(seconds=JOBS_RESULT_TTL))
+        if self._update(job, fields):
+            jobs_total.inc(outcome=status)
+
+    def _retry(self, job: Dict, delay: float, error: str, counts: bool = True):
+        if counts and job['attempts'] >= JOBS_MAX_ATTEMPTS:
+            self._finish(job, FAILED, error=error)
+            return
+        run_at = datetime.now() + timedelta(seconds=delay)
+        # A turn turned away by the LLM concurrency limit does not use up an attempt.
+        if self._update(job, {'status': QUEUED, 'run_at': run_at}, None if counts else {'attempts': -1}):
+            jobs_total.inc(outcome="retried")
+
+    def run(self, job: Dict):
+        if job['attempts'] > JOBS_MAX_ATTEMPTS:
+            # Its earlier attempts never finished (their worker died each time).
+            self._finish(job, FAILED, error=LLM_ERROR_REPLY)
+            return
+        try:
+            self.run_turn(job)
+        except RateLimited as e:
+            self._retry(job, e.retry_after, LLM_ERROR_REPLY, counts=False)
+        except LLMError:
+            self._retry(job, JOBS_RETRY_DELAY * 2 ** (job['attempts'] - 1), LLM_ERROR_REPLY)
+        except Exception as e:
+            print(f"Job {job['_id']} failed: {e}")
+            self._retry(job, JOBS_RETRY_DELAY * 2 ** (job['attempts'] - 1), "Something went wrong. Please try again.")
+
+    def run_turn(self, job: Dict):
+        from .models import Chat, User
+        from .views import answer_new_chat, answer_turn, save_new_chat, save_turn
+
+        user = User.get(job['user_id'])
+        chat = None if job['new_chat'] else Chat.get(job['chat_id'])
+        if user is None or (not job['new_chat'] and (chat is None or str(chat.user_id) != str(user.id))):
+            self._finish(job, FAILED, error="Chat not found")
+            return
+
+        parsed, message_ids = job.get('result'), job.get('message_ids')
+        if parsed is None:
+            parsed = answer_new_chat(job['message']) if job['new_chat'] else answer_turn(chat, job['message'])
+            message_ids = [ObjectId(), ObjectId()]
+            if not self._update(job, {'result': parsed, 'message_ids': message_ids}):
+                return
+
+        if not self.saved(job['chat_id'], message_ids[1]):
+            if job['new_chat']:
+                save_new_chat(user, job['message'], parsed, chat_id=job['chat_id'], message_ids=message_ids)
+            else:
+                save_turn(chat, job['message'], parsed, message_ids=message_ids)
+            write_behind.settle(str(job['chat_id']))
+            if write_behind.is_pending(str(job['chat_id'])):
+                raise RuntimeError("turn not written yet")
+        self._finish(job, DONE)
+
+    def saved(self, chat_id, reply_id) -> bool:
+        # Both writes of the turn: the message itself and the chat's embedded tail (the
+        # collections are flushed separately). Saving again is safe, only wasted work.
+        if db.conversations.find_one({'_id': reply_id}, {'_id': 1}) is None:
+            return False
+        return not CHAT_RECENT_MESSAGES or db.chats.find_one({'_id': chat_id, 'recent._id': reply_id}, {'_id': 1}) is not None
+
+    def state(self) -> Dict[str, int]:
+        return {"running": self.running, "workers": len(self._threads)}
+
+
+job_queue = JobQueue()
+
+Gauge("ngmc_job_workers", "Job worker threads in this process and how many are running a turn",
+      lambda: job_queue.state(), ["state"])
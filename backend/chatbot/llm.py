@@ -0,0 +1,472 @@
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import threading
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+from .fake_llm import FakeLLM, FAKE_LLM_TTFT, FAKE_LLM_SMALL_TTFT
+from .metrics import Counter, Gauge, record_llm_usage
+
+try:
+    from openai import APIConnectionError  # APITimeoutError is a subclass
+except ImportError:
+    APIConnectionError = ConnectionError
+
+# LLM providers behind one interface. A router picks a tier per query: short link
+# lookups (exam schedule, fees, seating, syllabus) go to the small model, everything
+# else to the large one; the other tier is the fallback. Each backend has its own
+# timeout, retries with jittered backoff and a circuit breaker.
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "openai")  # default provider; "fake"/"stub" runs offline
+LLM_MODEL = os.environ.get("LLM_MODEL", "gpt-4")
+LLM_SMALL_MODEL = os.environ.get("LLM_SMALL_MODEL", "gpt-4o-mini")
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "30"))
+LLM_SMALL_TIMEOUT = float(os.environ.get("LLM_SMALL_TIMEOUT", "15"))
+LLM_MAX_TOKENS = int(os.environ.get("LLM_MAX_TOKENS", "1200"))
+LLM_TEMPERATURE = float(os.environ.get("LLM_TEMPERATURE", "0.7"))
+LLM_ROUTING = os.environ.get("LLM_ROUTING", "1") != "0"
+LLM_ROUTE_MAX_WORDS = int(os.environ.get("LLM_ROUTE_MAX_WORDS", "16"))
+LLM_RETRIES = int(os.environ.get("LLM_RETRIES", "2"))
+LLM_BACKOFF = float(os.environ.get("LLM_BACKOFF", "0.25"))
+LLM_BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", "4"))
+LLM_BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.environ.get("LLM_BREAKER_COOLDOWN", "30"))
+USD_TO_INR = float(os.environ.get("USD_TO_INR", "84"))
+# "auto" asks for response_format=json_object on the models that support it; "1"/"0" force it.
+LLM_JSON_MODE = os.environ.get("LLM_JSON_MODE", "auto")
+JSON_MODE_MODELS = ("gpt-4o", "gpt-4-turbo", "gpt-4.1", "gpt-3.5-turbo")
+
+# USD per 1K tokens: (prompt, completion[, cached prompt]); cached prompt tokens cost the
+# prompt price when the third price is missing. LLM_PRICING='{"model": [prompt, completion]}'
+# adds or overrides entries.
+MODEL_PRICING = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4o": (0.0025, 0.01, 0.00125),
+    "gpt-4o-mini": (0.00015, 0.0006, 0.000075),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+}
+MODEL_PRICING.update({model: tuple(price) for model, price in json.loads(os.environ.get("LLM_PRICING", "{}")).items()})
+
+# Intents answered by pointing at the right college link.
+LINK_INTENTS = {
+    "exam_schedule": re.compile(r"\b(exam|exams|examination|timetable|time table|schedule|hall ticket)\b"),
+    "fee": re.compile(r"\b(fee|fees|fee structure|tuition)\b"),
+    "seating": re.compile(r"\b(seating|seat allotment|seating arrangement)\b"),
+    "syllabus": re.compile(r"\b(syllabus|syllabi|curriculum)\b"),
+}
+# Questions that want reasoning rather than a link stay on the large model.
+OPEN_ENDED_RE = re.compile(r"\b(why|explain|compare|difference|should i|advice|suggest|help me)\b")
+
+llm_calls_total = Counter("ngmc_llm_calls_total", "LLM calls by backend and outcome", ["backend", "outcome"])
+llm_retries_total = Counter("ngmc_llm_retries_total", "LLM calls retried after a transient error", ["backend"])
+llm_fallbacks_total = Counter("ngmc_llm_fallbacks_total", "Queries answered by a fallback backend", ["backend"])
+llm_routes_total = Counter("ngmc_llm_routes_total", "Queries routed per tier", ["tier", "intent"])
+
+
+class LLMError(Exception):
+    # Every backend on the route failed; callers must not store a reply.
+    pass
+
+
+def usage_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    prompt_price, completion_price, *cached = MODEL_PRICING.get(model, (0.0, 0.0))
+    cached_price = cached[0] if cached else prompt_price
+    return ((prompt_tokens - cached_tokens) / 1000 * prompt_price + cached_tokens / 1000 * cached_price
+            + completion_tokens / 1000 * completion_price)
+
+
+def cached_tokens(usage) -> int:
+    # Prompt tokens the provider served from its prefix cache (part of prompt_tokens).
+    details = getattr(usage, "prompt_tokens_details", None)
+    return getattr(details, "cached_tokens", None) or 0
+
+
+def json_mode(model: str) -> bool:
+    if LLM_JSON_MODE != "auto":
+        return LLM_JSON_MODE != "0"
+    return model.startswith(JSON_MODE_MODELS)
+
+
+TRANSIENT_ERRORS = (TimeoutError, asyncio.TimeoutError, ConnectionError, APIConnectionError)
+
+
+def retryable(error: Exception) -> bool:
+    # Timeouts, connection errors, 408/429 and 5xx are transient; anything else (a 4xx,
+    # a bug in our code) fails the same way on every attempt.
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    status = getattr(error, "status_code", None)
+    return isinstance(status, int) and (status in (408, 429) or status >= 500)
+
+
+def backoff(attempt: int) -> float:
+    # "Full jitter": spreads the retries of many concurrent callers.
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF * 2 ** attempt))
+
+
+class CircuitBreaker:
+    # Opens after `failures` consecutive errors; after `cooldown` seconds a single trial
+    # call is let through and closes it again on success.
+    def __init__(self, failures: int = LLM_BREAKER_FAILURES, cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self._errors = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial or time.monotonic() - self._opened_at < self.cooldown:
+                return False
+            self._trial = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self._errors = 0
+            self._opened_at = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self._errors += 1
+            if self._trial or self._errors >= self.failures:
+                self._opened_at = time.monotonic()
+            self._trial = False
+
+    def release(self):
+        # The call was abandoned (client disconnect, cancellation): neither success nor
+        # failure, but a trial call must not keep the breaker shut for good.
+        with self._lock:
+            self._trial = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+
+class Backend:
+    provider = ""
+
+    def __init__(self, model: str, tier: str, timeout: float):
+        self.model = model
+        self.tier = tier
+        self.timeout = timeout
+        self.breaker = CircuitBreaker()
+
+    @property
+    def name(self) -> str:
+        return f"{self.provider}:{self.model}"
+
+    def params(self) -> Dict:
+        return {"model": self.model, "max_tokens": LLM_MAX_TOKENS, "temperature": LLM_TEMPERATURE}
+
+    def record_usage(self, prompt_tokens: int, completion_tokens: int, cached: int = 0):
+        usd = usage_cost(self.model, prompt_tokens, completion_tokens, cached)
+        record_llm_usage(prompt_tokens, completion_tokens, usd * USD_TO_INR, model=self.model, cached_tokens=cached)
+        print(
+            f"[LOG] Tokens used ({self.model}) → prompt={prompt_tokens} (cached={cached}), "
+            f"completion={completion_tokens}, total={prompt_tokens + completion_tokens}, "
+            f"cost≈₹{round(usd * USD_TO_INR, 2)}"
+        )
+
+    def complete(self, messages: List[Dict]) -> str:
+        raise NotImplementedError
+
+    def stream(self, messages: List[Dict]) -> Iterator[str]:
+        raise NotImplementedError
+
+    async def acomplete(self, messages: List[Dict]) -> str:
+        raise NotImplementedError
+
+    async def astream(self, messages: List[Dict]) -> AsyncIterator[str]:
+        raise NotImplementedError
+        yield
+
+
+class OpenAIBackend(Backend):
+    provider = "openai"
+
+    def __init__(self, model: str, tier: str, timeout: float):
+        super().__init__(model, tier, timeout)
+        from openai import AsyncOpenAI, OpenAI
+        # Retries are ours (with jitter and the breaker), not the SDK's.
+        self.client = OpenAI(api_key=os.environ.get("CHAT_GPT_API"), timeout=timeout, max_retries=0)
+        self.async_client = AsyncOpenAI(api_key=os.environ.get("CHAT_GPT_API"), timeout=timeout, max_retries=0)
+
+    def params(self) -> Dict:
+        params = super().params()
+        if json_mode(self.model):
+            params["response_format"] = {"type": "json_object"}
+        return params
+
+    def complete(self, messages: List[Dict]) -> str:
+        response = self.client.chat.completions.create(messages=messages, **self.params())
+        self.record_usage(response.usage.prompt_tokens, response.usage.completion_tokens, cached_tokens(response.usage))
+        return response.choices[0].message.content.strip()
+
+    def stream(self, messages: List[Dict]) -> Iterator[str]:
+        stream = self.client.chat.completions.create(
+            messages=messages, **self.params(), stream=True, stream_options={"include_usage": True}
+        )
+        for chunk in stream:
+            if chunk.usage:
+                self.record_usage(chunk.usage.prompt_tokens, chunk.usage.completion_tokens, cached_tokens(chunk.usage))
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def acomplete(self, messages: List[Dict]) -> str:
+        response = await self.async_client.chat.completions.create(messages=messages, **self.params())
+        self.record_usage(response.usage.prompt_tokens, response.usage.completion_tokens, cached_tokens(response.usage))
+        return response.choices[0].message.content.strip()
+
+    async def astream(self, messages: List[Dict]) -> AsyncIterator[str]:
+        stream = await self.async_client.chat.completions.create(
+            messages=messages, **self.params(), stream=True, stream_options={"include_usage": True}
+        )
+        async for chunk in stream:
+            if chunk.usage:
+                self.record_usage(chunk.usage.prompt_tokens, chunk.usage.completion_tokens, cached_tokens(chunk.usage))
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class StubBackend(Backend):
+    # Deterministic local model (chatbot.fake_llm). Token counts are approximated and
+    # priced like the model it stands in for, so offline runs still report cost.
+    provider = "stub"
+
+    def __init__(self, model: str, tier: str, timeout: float):
+        super().__init__(model, tier, timeout)
+        self.fake = FakeLLM(ttft=FAKE_LLM_SMALL_TTFT if tier == "small" else FAKE_LLM_TTFT)
+
+    def _usage(self, messages: List[Dict], reply: str):
+        prompt_tokens, cached = self.fake.prompt_tokens(messages)
+        self.record_usage(prompt_tokens, len(self.fake.tokens(reply)), cached)
+
+    def _check_timeout(self):
+        if self.fake.ttft > self.timeout:
+            raise TimeoutError(f"{self.name}: no response within {self.timeout}s")
+
+    def complete(self, messages: List[Dict]) -> str:
+        self._check_timeout()
+        reply = self.fake.complete(messages)
+        self._usage(messages, reply)
+        return reply
+
+    def stream(self, messages: List[Dict]) -> Iterator[str]:
+        self._check_timeout()
+        deltas = []
+        for delta in self.fake.stream(messages):
+            deltas.append(delta)
+            yield delta
+        self._usage(messages, "".join(deltas))
+
+    async def acomplete(self, messages: List[Dict]) -> str:
+        self._check_timeout()
+        reply = await self.fake.acomplete(messages)
+        self._usage(messages, reply)
+        return reply
+
+    async def astream(self, messages: List[Dict]) -> AsyncIterator[str]:
+        self._check_timeout()
+        deltas = []
+        async for delta in self.fake.astream(messages):
+            deltas.append(delta)
+            yield delta
+        self._usage(messages, "".join(deltas))
+
+
+PROVIDERS = {"openai": OpenAIBackend, "stub": StubBackend, "fake": StubBackend}
+TIERS = {
+    "large": (LLM_MODEL, LLM_TIMEOUT),
+    "small": (LLM_SMALL_MODEL, LLM_SMALL_TIMEOUT),
+}
+_backends: Dict[str, Backend] = {}
+_backends_lock = threading.Lock()
+
+
+def register_provider(name: str, backend_class):
+    PROVIDERS[name] = backend_class
+
+
+def backend_for(tier: str) -> Backend:
+    # Tier models may name their provider ("stub:gpt-4o-mini"); otherwise LLM_BACKEND.
+    with _backends_lock:
+        backend = _backends.get(tier)
+        if backend is None:
+            model, timeout = TIERS[tier]
+            provider, _, name = model.rpartition(":")
+            backend = _backends[tier] = PROVIDERS[provider or LLM_BACKEND](name, tier, timeout)
+        return backend
+
+
+def stub_calls() -> int:
+    # Upstream calls made to stub backends (benchmarks).
+    return sum(b.fake.calls for b in _backends.values() if isinstance(b, StubBackend))
+
+
+def classify(query: str) -> Optional[str]:
+    # Link-lookup intent of a short question, or None for anything open-ended.
+    text = query.lower()
+    if len(text.split()) > LLM_ROUTE_MAX_WORDS or OPEN_ENDED_RE.search(text):
+        return None
+    for intent, pattern in LINK_INTENTS.items():
+        if pattern.search(text):
+            return intent
+    return None
+
+
+def user_query(messages: List[Dict]) -> str:
+    for message in reversed(messages):
+        if message["role"] == "user":
+            return str(message["content"])
+    return ""
+
+
+def route(messages: List[Dict]) -> List[Backend]:
+    intent = classify(user_query(messages)) if LLM_ROUTING else None
+    tier = "small" if intent else "large"
+    llm_routes_total.inc(tier=tier, intent=intent or "open")
+    order = [tier, "large" if tier == "small" else "small"]
+    if TIERS["small"] == TIERS["large"]:
+        order = order[:1]
+    return [backend_for(t) for t in order]
+
+
+def route_key(backends: List[Backend]) -> Dict:
+    # Part of the single-flight key: the same messages on another route are another call.
+    return {"route": [backend.name for backend in backends], "max_tokens": LLM_MAX_TOKENS, "temperature": LLM_TEMPERATURE}
+
+
+def _failed(backend: Backend, error: Exception, attempt: int):
+    backend.breaker.failure()
+    llm_calls_total.inc(backend=backend.name, outcome="error")
+    print(f"LLM {backend.name} failed (attempt {attempt + 1}): {error!r}")
+
+
+def _succeeded(backend: Backend, backends: List[Backend]):
+    backend.breaker.success()
+    llm_calls_total.inc(backend=backend.name, outcome="ok")
+    if backend is not backends[0]:
+        llm_fallbacks_total.inc(backend=backend.name)
+
+
+def complete(messages: List[Dict], backends: List[Backend] = None) -> str:
+    backends = backends or route(messages)
+    for backend in backends:
+        for attempt in range(LLM_RETRIES + 1):
+            if not backend.breaker.allow():
+                llm_calls_total.inc(backend=backend.name, outcome="circuit_open")
+                break
+            try:
+                reply = backend.complete(messages)
+            except Exception as e:
+                _failed(backend, e, attempt)
+                if not retryable(e) or attempt == LLM_RETRIES:
+                    break
+                llm_retries_total.inc(backend=backend.name)
+                time.sleep(backoff(attempt))
+                continue
+            except BaseException:
+                backend.breaker.release()
+                raise
+            _succeeded(backend, backends)
+            return reply
+    raise LLMError(f"all LLM backends failed: {', '.join(b.name for b in backends)}")
+
+
+async def acomplete(messages: List[Dict], backends: List[Backend] = None) -> str:
+    backends = backends or route(messages)
+    for backend in backends:
+        for attempt in range(LLM_RETRIES + 1):
+            if not backend.breaker.allow():
+                llm_calls_total.inc(backend=backend.name, outcome="circuit_open")
+                break
+            try:
+                reply = await asyncio.wait_for(backend.acomplete(messages), backend.timeout)
+            except Exception as e:
+                _failed(backend, e, attempt)
+                if not retryable(e) or attempt == LLM_RETRIES:
+                    break
+                llm_retries_total.inc(backend=backend.name)
+                await asyncio.sleep(backoff(attempt))
+                continue
+            except BaseException:
+                backend.breaker.release()
+                raise
+            _succeeded(backend, backends)
+            return reply
+    raise LLMError(f"all LLM backends failed: {', '.join(b.name for b in backends)}")
+
+
+def stream(messages: List[Dict]) -> Iterator[str]:
+    # Retries and fallbacks only until the first token; after that a failure ends the
+    # stream with LLMError, since the client has already shown part of the reply.
+    backends = route(messages)
+    for backend in backends:
+        for attempt in range(LLM_RETRIES + 1):
+            if not backend.breaker.allow():
+                llm_calls_total.inc(backend=backend.name, outcome="circuit_open")
+                break
+            started = False
+            try:
+                for delta in backend.stream(messages):
+                    started = True
+                    yield delta
+            except Exception as e:
+                _failed(backend, e, attempt)
+                if started:
+                    raise LLMError(f"{backend.name} failed mid-stream") from e
+                if not retryable(e) or attempt == LLM_RETRIES:
+                    break
+                llm_retries_total.inc(backend=backend.name)
+                time.sleep(backoff(attempt))
+                continue
+            except BaseException:
+                # GeneratorExit when the client disconnects mid-stream.
+                backend.breaker.release()
+                raise
+            _succeeded(backend, backends)
+            return
+    raise LLMError(f"all LLM backends failed: {', '.join(b.name for b in backends)}")
+
+
+async def astream(messages: List[Dict]) -> AsyncIterator[str]:
+    backends = route(messages)
+    for backend in backends:
+        for attempt in range(LLM_RETRIES + 1):
+            if not backend.breaker.allow():
+                llm_calls_total.inc(backend=backend.name, outcome="circuit_open")
+                break
+            started = False
+            try:
+                async for delta in backend.astream(messages):
+                    started = True
+                    yield delta
+            except Exception as e:
+                _failed(backend, e, attempt)
+                if started:
+                    raise LLMError(f"{backend.name} failed mid-stream") from e
+                if not retryable(e) or attempt == LLM_RETRIES:
+                    break
+                llm_retries_total.inc(backend=backend.name)
+                await asyncio.sleep(backoff(attempt))
+                continue
+            except BaseException:
+                # GeneratorExit / CancelledError when the client disconnects mid-stream.
+                backend.breaker.release()
+                raise
+            _succeeded(backend, backends)
+            return
+    raise LLMError(f"all LLM backends failed: {', '.join(b.name for b in backends)}")
+
+
+Gauge("ngmc_llm_circuit_open", "1 while a backend's circuit breaker is open",
+      lambda: {b.name: int(b.breaker.is_open) for b in list(_backends.values())}, ["backend"])
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+from chatbot.database import chats_collection, conversations_collection
+from chatbot.models import CHAT_RECENT_MESSAGES, recent_doc, Conversation
+from chatbot.write_behind import write_behind
+
+
+class Command(BaseCommand):
+    help = "Embed the latest messages, message count and last activity in existing chat documents"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Recompute chats that already have embedded messages")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        if not CHAT_RECENT_MESSAGES:
+            self.stderr.write("CHAT_RECENT_MESSAGES is 0; nothing to embed")
+            return
+
+        write_behind.settle_all()
+        query = {} if options["all"] else {"message_count": {"$exists": False}}
+        last_id = None
+        updated = 0
+        while True:
+            page = dict(query)
+            if last_id is not None:
+                page["_id"] = {"$gt": last_id}
+            chats = list(chats_collection.find(page, {"_id": 1, "created_at": 1}).sort("_id", 1).limit(options["batch_size"]))
+            if not chats:
+                break
+            last_id = chats[-1]["_id"]
+
+            requests = []
+            for chat in chats:
+                latest = list(conversations_collection.find({"chat_id": chat["_id"]}).sort("_id", -1).limit(CHAT_RECENT_MESSAGES))
+                latest.reverse()
+                recent = [recent_doc(Conversation(c["chat_id"], c["role"], c["message"], c["_id"], c["created_at"])) for c in latest]
+                requests.append(UpdateOne({"_id": chat["_id"]}, {"$set": {
+                    "recent": recent,
+                    "message_count": conversations_collection.count_documents({"chat_id": chat["_id"]}),
+                    "last_activity": recent[-1]["created_at"] if recent else chat["created_at"],
+                }}))
+            if not options["dry_run"]:
+                chats_collection.bulk_write(requests, ordered=False)
+            updated += len(requests)
+            self.stdout.write(f"{'Would update' if options['dry_run'] else 'Updated'} {updated} chats")
+
+        self.stdout.write(self.style.SUCCESS(f"Backfill done: {updated} chats"))
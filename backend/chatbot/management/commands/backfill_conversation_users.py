@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from pymongo import UpdateMany
+from chatbot.database import chats_collection, conversations_collection
+from chatbot.write_behind import write_behind
+
+
+class Command(BaseCommand):
+    help = "Copy each chat's user_id onto its stored messages so they show up in search"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        write_behind.settle_all()
+        last_id = None
+        chats_seen = 0
+        updated = 0
+        while True:
+            page = {"user_id": {"$ne": None}}
+            if last_id is not None:
+                page["_id"] = {"$gt": last_id}
+            chats = list(chats_collection.find(page, {"_id": 1, "user_id": 1}).sort("_id", 1).limit(options["batch_size"]))
+            if not chats:
+                break
+            last_id = chats[-1]["_id"]
+            chats_seen += len(chats)
+
+            # Also fixes messages written as user_id None before the chat was claimed.
+            stale = [({"chat_id": chat["_id"], "user_id": {"$ne": chat["user_id"]}}, chat["user_id"]) for chat in chats]
+            if options["dry_run"]:
+                updated += sum(conversations_collection.count_documents(query) for query, _ in stale)
+            else:
+                requests = [UpdateMany(query, {"$set": {"user_id": user_id}}) for query, user_id in stale]
+                updated += conversations_collection.bulk_write(requests, ordered=False).modified_count
+            self.stdout.write(f"{chats_seen} chats, {'would update' if options['dry_run'] else 'updated'} {updated} messages")
+
+        self.stdout.write(self.style.SUCCESS(f"Backfill done: {updated} messages"))
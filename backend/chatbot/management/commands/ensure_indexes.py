@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+from chatbot.database import mongo, INDEXES
+
+
+class Command(BaseCommand):
+    help = "Create the MongoDB indexes the app relies on (safe to run on every deploy)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--timeout", type=float, default=30, help="Seconds to wait for MongoDB to become reachable")
+
+    def handle(self, *args, **options):
+        try:
+            mongo.ping(options["timeout"])
+        except Exception as e:
+            raise CommandError(f"MongoDB unreachable: {e}")
+        mongo.ensure_indexes()
+        self.stdout.write(f"{len(INDEXES)} indexes ensured")
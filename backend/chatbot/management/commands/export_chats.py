@@ -0,0 +1,40 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from chatbot.export import EXPORT_FORMATS, EXPORT_BATCH_CHATS, export_pieces, buffered, gzipped
+from chatbot.models import User
+
+
+class Command(BaseCommand):
+    help = "Stream chats and their conversations to a JSON or NDJSON file (or stdout), optionally gzipped"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only export this user's chats (email)")
+        parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="ndjson")
+        parser.add_argument("--gzip", action="store_true")
+        parser.add_argument("--output", help="File to write; stdout when omitted")
+        parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_CHATS)
+
+    def handle(self, *args, **options):
+        user = None
+        if options["user"]:
+            user = User.get_by_email(options["user"])
+            if user is None:
+                raise CommandError(f"No user with email {options['user']}")
+
+        chunks = buffered(export_pieces(options["format"], user, options["batch_size"]))
+        if options["gzip"]:
+            chunks = gzipped(chunks)
+
+        out = open(options["output"], "wb") if options["output"] else sys.stdout.buffer
+        written = 0
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+                written += len(chunk)
+        finally:
+            if options["output"]:
+                out.close()
+            else:
+                out.flush()
+        if options["output"]:
+            self.stdout.write(self.style.SUCCESS(f"Exported {written} bytes to {options['output']}"))
@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from chatbot.pdf_index import PdfReader, PDF_INDEX_DIR, PYPDF_MISSING, directory_fetch, ingest_pdfs
+from chatbot.scraper import SCRAPE_INTERVAL_SECONDS
+
+
+class Command(BaseCommand):
+    help = "Download the PDFs in ngmc_college_links.json and rebuild the full-text index when any changed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from-dir", help="Read PDFs from this directory (by file name) instead of downloading")
+        parser.add_argument("--index-dir", default=PDF_INDEX_DIR)
+        parser.add_argument("--force", action="store_true", help="Re-extract every PDF and rebuild the index")
+        parser.add_argument("--loop", action="store_true", help="Keep running and re-check every --interval seconds")
+        parser.add_argument("--interval", type=float, default=SCRAPE_INTERVAL_SECONDS)
+
+    def handle(self, *args, **options):
+        if PdfReader is None:
+            raise CommandError(PYPDF_MISSING)
+        fetch = directory_fetch(options["from_dir"]) if options["from_dir"] else None
+        while True:
+            summary = ingest_pdfs(index_dir=options["index_dir"], fetch=fetch, force=options["force"])
+            self.stdout.write(", ".join(f"{k}={v}" for k, v in sorted(summary.items())))
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,21 @@
+import time
+from django.core.management.base import BaseCommand
+from chatbot.jobs import job_queue, JOBS_WORKERS
+
+
+class Command(BaseCommand):
+    help = "Run background chat-turn job workers until interrupted"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=max(JOBS_WORKERS, 1), help="Worker threads in this process")
+
+    def handle(self, *args, **options):
+        job_queue.workers = options["workers"]
+        job_queue.start()
+        self.stdout.write(f"{job_queue.workers} job workers running")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            # Turns still running are picked up by another worker once their lease ends.
+            job_queue.stop()
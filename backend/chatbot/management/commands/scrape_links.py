@@ -0,0 +1,28 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from chatbot.scraper import scrape_links, SCRAPE_INTERVAL_SECONDS
+from chatbot.pdf_index import PdfReader, PYPDF_MISSING, ingest_pdfs
+
+
+class Command(BaseCommand):
+    help = "Scrape the NGMC pages and rewrite ngmc_college_links.json only when links changed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Keep running and scrape every --interval seconds")
+        parser.add_argument("--interval", type=float, default=SCRAPE_INTERVAL_SECONDS)
+        parser.add_argument("--pdfs", action="store_true", help="Also refresh the PDF full-text index after each scrape")
+
+    def handle(self, *args, **options):
+        if options["pdfs"] and PdfReader is None:
+            raise CommandError(PYPDF_MISSING)
+        while True:
+            _, changes = scrape_links()
+            for category, change in sorted(changes.items()):
+                for kind in ("added", "removed", "changed"):
+                    for key in change[kind]:
+                        self.stdout.write(f"{kind:>8} {category}: {key}")
+            if options["pdfs"]:
+                ingest_pdfs()
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,266 @@
+import time
+import inspect
+import threading
+import functools
+import contextvars
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+# Minimal in-process Prometheus instrumentation: counters and fixed-bucket
+# histograms, rendered in the text exposition format by /metrics/.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Endpoint currently being served, so stage timers deep in the call stack can label by it.
+current_endpoint = contextvars.ContextVar("current_endpoint", default="none")
+
+_registry = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + [f'{n}="{v}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(n, "") for n in self.labelnames), 0.0)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_labels(self.labelnames, key)} {value:g}"
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted((key, [list(s[0]), s[1], s[2]]) for key, s in self._series.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, [('le', le)])} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {total:.6f}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {count}"
+
+
+class Gauge:
+    # Value read from a callback at scrape time (cache sizes, hit counters kept elsewhere).
+    def __init__(self, name, help, callback, labelnames=()):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        for key, value in sorted(self.callback().items()):
+            key = key if isinstance(key, tuple) else (key,)
+            yield f"{self.name}{_labels(self.labelnames, key)} {value:g}"
+
+
+request_latency = Histogram("ngmc_request_latency_seconds", "End-to-end view latency", ["endpoint"])
+requests_total = Counter("ngmc_requests_total", "Requests served", ["endpoint", "status"])
+stage_latency = Histogram("ngmc_stage_latency_seconds", "Latency of one stage of the request path", ["stage", "op", "endpoint"])
+errors_total = Counter("ngmc_errors_total", "Errors raised inside a stage", ["stage", "endpoint"])
+llm_tokens_total = Counter("ngmc_llm_tokens_total", "LLM tokens used", ["kind", "model", "endpoint"])
+llm_cost_total = Counter("ngmc_llm_cost_rupees_total", "Estimated LLM cost in rupees", ["model", "endpoint"])
+
+
+def observe_stage(stage, op, seconds):
+    stage_latency.observe(seconds, stage=stage, op=op, endpoint=current_endpoint.get())
+
+
+def count_error(stage):
+    errors_total.inc(stage=stage, endpoint=current_endpoint.get())
+
+
+@contextmanager
+def timed(stage, op=""):
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        count_error(stage)
+        raise
+    finally:
+        observe_stage(stage, op, time.perf_counter() - started)
+
+
+def timed_call(stage, op=""):
+    # Decorator form of timed(); works on plain/async functions and (async) generators.
+    def decorator(func):
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def agen_wrapper(*args, **kwargs):
+                agen = func(*args, **kwargs)
+                while True:
+                    with timed(stage, op):
+                        try:
+                            item = await agen.__anext__()
+                        except StopAsyncIteration:
+                            return
+                    yield item
+            return agen_wrapper
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def gen_wrapper(*args, **kwargs):
+                gen = func(*args, **kwargs)
+                while True:
+                    with timed(stage, op):
+                        try:
+                            item = next(gen)
+                        except StopIteration:
+                            return
+                    yield item
+            return gen_wrapper
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with timed(stage, op):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(stage, op):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument(endpoint):
+    # Per-view latency and status counts; also labels every stage timed during the view.
+    def decorator(view):
+        def record(started, status):
+            request_latency.observe(time.perf_counter() - started, endpoint=endpoint)
+            requests_total.inc(endpoint=endpoint, status=str(status))
+
+        if inspect.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                token = current_endpoint.set(endpoint)
+                started = time.perf_counter()
+                status = 500
+                try:
+                    response = await view(request, *args, **kwargs)
+                    status = response.status_code
+                    return response
+                finally:
+                    record(started, status)
+                    current_endpoint.reset(token)
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            token = current_endpoint.set(endpoint)
+            started = time.perf_counter()
+            status = 500
+            try:
+                response = view(request, *args, **kwargs)
+                status = response.status_code
+                return response
+            finally:
+                record(started, status)
+                current_endpoint.reset(token)
+        return wrapper
+    return decorator
+
+
+def bind_endpoint(events):
+    # Streaming bodies run after the view returned; keep their stage timers labelled.
+    endpoint = current_endpoint.get()
+
+    if hasattr(events, "__aiter__"):
+        async def agen():
+            iterator = events.__aiter__()
+            while True:
+                token = current_endpoint.set(endpoint)
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    current_endpoint.reset(token)
+                yield item
+        return agen()
+
+    def gen():
+        iterator = iter(events)
+        while True:
+            token = current_endpoint.set(endpoint)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                current_endpoint.reset(token)
+            yield item
+    return gen()
+
+
+def record_llm_usage(prompt_tokens, completion_tokens, rupees, model="", cached_tokens=0):
+    # kind="cached" counts the prompt tokens the provider's prefix cache served; they are
+    # included in kind="prompt".
+    endpoint = current_endpoint.get()
+    llm_tokens_total.inc(prompt_tokens, kind="prompt", model=model, endpoint=endpoint)
+    llm_tokens_total.inc(cached_tokens, kind="cached", model=model, endpoint=endpoint)
+    llm_tokens_total.inc(completion_tokens, kind="completion", model=model, endpoint=endpoint)
+    llm_cost_total.inc(rupees, model=model, endpoint=endpoint)
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
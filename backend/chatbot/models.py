@@ -1,8 +1,33 @@
-from .database import users_collection, chats_collection, conversations_collection
+import os
+from .database import users_collection, chats_collection, conversations_collection, lazy_conversations_collection
 from bson import ObjectId
+from bson.raw_bson import RawBSONDocument
+from .metrics import timed_call
+from .auth import hash_password, forget_user
+from .write_behind import write_behind
 from datetime import datetime
 
+# Latest messages embedded in each chat document (0 keeps chats unembedded).
+CHAT_RECENT_MESSAGES = int(os.environ.get("CHAT_RECENT_MESSAGES", "20"))
+# Chats whose conversations are loaded together by the list endpoints.
+LIST_CHUNK_CHATS = int(os.environ.get("LIST_CHUNK_CHATS", "20"))
+
+# Projections: only the fields the models read are fetched.
+USER_FIELDS = {'userName': 1, 'email': 1, 'password': 1, 'created_at': 1}
+CHAT_FIELDS = {'title': 1, 'user_id': 1, 'created_at': 1, 'summary': 1, 'summary_until': 1,
+               'recent': 1, 'message_count': 1, 'last_activity': 1}
+CONVERSATION_FIELDS = {'chat_id': 1, 'role': 1, 'message': 1, 'created_at': 1}
+
+def chat_list_fields(recent=None):
+    # List views skip the rolling summary; recent=n keeps only the last n embedded messages.
+    fields = {'title': 1, 'user_id': 1, 'created_at': 1, 'message_count': 1, 'last_activity': 1, 'recent': 1}
+    if recent is not None:
+        fields['recent'] = {'$slice': -recent}
+    return fields
+
 class User:
+    __slots__ = ('id', 'userName', 'email', 'password', 'created_at')
+    
     def __init__(self, userName, email, password, _id=None, created_at=None):
         self.id = _id
         self.userName = userName
@@ -11,136 +36,327 @@ class User:
         self.created_at = created_at or datetime.now()
     
     @classmethod
+    @timed_call("mongo", "User.create")
     def create(cls, userName, email, password):
         user_data = {
             'userName': userName,
             'email': email,
-            'password': password,
+            'password': hash_password(password),
             'created_at': datetime.now()
         }
         result = users_collection.insert_one(user_data)
-        return cls(userName, email, password, result.inserted_id, user_data['created_at'])
+        return cls(userName, email, user_data['password'], result.inserted_id, user_data['created_at'])
     
     @classmethod
+    @timed_call("mongo", "User.get_by_email")
     def get_by_email(cls, email):
-        user_data = users_collection.find_one({'email': email})
+        user_data = users_collection.find_one({'email': email}, USER_FIELDS)
         if user_data:
             return cls(user_data['userName'], user_data['email'], user_data.get('password', ''), user_data['_id'], user_data['created_at'])
         return None
     
     @classmethod
-    def get_by_email_password(cls, email, password):
-        user_data = users_collection.find_one({'email': email, 'password': password})
+    @timed_call("mongo", "User.get")
+    def get(cls, user_id):
+        user_data = users_collection.find_one({'_id': ObjectId(user_id)}, USER_FIELDS)
         if user_data:
             return cls(user_data['userName'], user_data['email'], user_data.get('password', ''), user_data['_id'], user_data['created_at'])
         return None
     
     @classmethod
-    def get(cls, user_id):
-        user_data = users_collection.find_one({'_id': ObjectId(user_id)})
-        if user_data:
-            return cls(user_data['userName'], user_data['email'], user_data.get('password', ''), user_data['_id'], user_data['created_at'])
-        return None
+    @timed_call("mongo", "User.set_password")
+    def set_password(cls, user, password):
+        user.password = hash_password(password)
+        users_collection.update_one({'_id': user.id}, {'$set': {'password': user.password}})
+        forget_user(user.id, user.email)
+        return user
 
 class Chat:
-    def __init__(self, title, user_id, _id=None, created_at=None):
+    __slots__ = ('id', 'title', 'user_id', 'created_at', 'summary', 'summary_until',
+                 'recent', 'message_count', 'last_activity', '_saved')
+    
+    def __init__(self, title, user_id, _id=None, created_at=None, summary='', summary_until=None,
+                 recent=None, message_count=None, last_activity=None):
         self.id = _id
         self.title = title
         self.user_id = user_id
         self.created_at = created_at or datetime.now()
+        self.summary = summary
+        self.summary_until = summary_until
+        # Newest messages (oldest first) embedded in the chat document, with the total
+        # message count. None for chats stored without them and not yet backfilled.
+        self.recent = recent
+        self.message_count = message_count
+        self.last_activity = last_activity
+        self.mark_saved()
     
     @classmethod
-    def create(cls, title, user_id=None):
+    def from_doc(cls, chat_data):
+        recent = None
+        if 'message_count' in chat_data and 'recent' in chat_data:
+            recent = [Conversation.from_doc(m, chat_data['_id']) for m in chat_data['recent']]
+        return cls(chat_data['title'], chat_data.get('user_id'), chat_data['_id'], chat_data['created_at'],
+                   chat_data.get('summary', ''), chat_data.get('summary_until'),
+                   recent, chat_data.get('message_count'), chat_data.get('last_activity'))
+    
+    def has_full_history(self):
+        return self.recent is not None and self.message_count <= len(self.recent)
+    
+    # Fields save() writes; only the ones changed since load/create are sent.
+    SAVED_FIELDS = ('title', 'user_id', 'created_at')
+    
+    def mark_saved(self):
+        self._saved = {field: getattr(self, field) for field in self.SAVED_FIELDS}
+    
+    def dirty_fields(self):
+        return {field: getattr(self, field) for field in self.SAVED_FIELDS if getattr(self, field) != self._saved[field]}
+    
+    @classmethod
+    @timed_call("mongo", "Chat.create")
+    def create(cls, title, user_id=None, _id=None):
         chat_data = {
+            '_id': _id or ObjectId(),
             'title': title,
             'user_id': user_id,
             'created_at': datetime.now()
         }
-        result = chats_collection.insert_one(chat_data)
-        return cls(title, user_id, result.inserted_id, chat_data['created_at'])
+        if CHAT_RECENT_MESSAGES:
+            chat_data.update({'recent': [], 'message_count': 0, 'last_activity': chat_data['created_at']})
+        write_behind.insert('chats', chat_data, keys=(str(chat_data['_id']), str(user_id)))
+        return cls.from_doc(dict(chat_data))
     
     @classmethod
+    @timed_call("mongo", "Chat.get")
     def get(cls, chat_id):
-        chat_data = chats_collection.find_one({'_id': ObjectId(chat_id)})
+        write_behind.settle(str(chat_id))
+        chat_data = chats_collection.find_one({'_id': ObjectId(chat_id)}, CHAT_FIELDS)
         if chat_data:
-            return cls(chat_data['title'], chat_data.get('user_id'), chat_data['_id'], chat_data['created_at'])
+            return cls.from_doc(chat_data)
         return None
     
     @classmethod
-    def all(cls):
-        chats = []
-        for chat_data in chats_collection.find().sort('_id', -1):
-            chats.append(cls(chat_data['title'], chat_data.get('user_id'), chat_data['_id'], chat_data['created_at']))
-        return chats
+    @timed_call("mongo", "Chat.iter_all")
+    def iter_all(cls, recent=None):
+        write_behind.settle_all()
+        for chat_data in chats_collection.find({}, chat_list_fields(recent)).sort('_id', -1):
+            yield cls.from_doc(chat_data)
+    
+    @classmethod
+    def all(cls, recent=None):
+        return list(cls.iter_all(recent))
+    
+    @classmethod
+    @timed_call("mongo", "Chat.iter_by_user")
+    def iter_by_user(cls, user_id, recent=None):
+        write_behind.settle(str(user_id))
+        for chat_data in chats_collection.find({'user_id': user_id}, chat_list_fields(recent)).sort('_id', -1):
+            yield cls.from_doc(chat_data)
+    
+    @classmethod
+    def filter_by_user(cls, user_id, recent=None):
+        return list(cls.iter_by_user(user_id, recent))
     
     @classmethod
-    def filter_by_user(cls, user_id):
+    @timed_call("mongo", "Chat.page_by_user")
+    def page_by_user(cls, user_id, before=None, limit=20, recent=None):
+        write_behind.settle(str(user_id))
+        query = {'user_id': user_id}
+        if before:
+            query['_id'] = {'$lt': ObjectId(before)}
         chats = []
-        for chat_data in chats_collection.find({'user_id': user_id}).sort('_id', -1):
-            chats.append(cls(chat_data['title'], chat_data['user_id'], chat_data['_id'], chat_data['created_at']))
+        for chat_data in chats_collection.find(query, chat_list_fields(recent)).sort('_id', -1).limit(limit):
+            chats.append(cls.from_doc(chat_data))
         return chats
     
+    @timed_call("mongo", "Chat.save")
     def save(self):
-        chats_collection.update_one(
-            {'_id': self.id},
-            {'$set': {'title': self.title, 'user_id': self.user_id, 'created_at': self.created_at}}
-        )
+        write_behind.update('chats', self.id, self.dirty_fields(), keys=(str(self.id), str(self.user_id)))
+        self.mark_saved()
+    
+    @classmethod
+    @timed_call("mongo", "Chat.update_summary")
+    def update_summary(cls, chat_id, summary, summary_until):
+        write_behind.update('chats', chat_id, {'summary': summary, 'summary_until': summary_until}, keys=(str(chat_id),))
+    
+    @timed_call("mongo", "Chat.push_recent")
+    def push_recent(self, conversations):
+        # Keeps the embedded tail, count and last activity in step with bulk_create (which
+        # gives the conversations their ids). Guarded on the last message, so a replayed
+        # write (write-behind retry, rerun job) neither counts nor embeds the turn twice.
+        if self.recent is None or not conversations or not CHAT_RECENT_MESSAGES:
+            return
+        write_behind.modify('chats', self.id, {
+            '$push': {'recent': {'$each': [recent_doc(conv) for conv in conversations], '$slice': -CHAT_RECENT_MESSAGES}},
+            '$inc': {'message_count': len(conversations)},
+            '$set': {'last_activity': conversations[-1].created_at}
+        }, keys=(str(self.id), str(self.user_id)), guard={'recent._id': {'$ne': conversations[-1].id}})
+        self.recent = (self.recent + list(conversations))[-CHAT_RECENT_MESSAGES:]
+        self.message_count += len(conversations)
+        self.last_activity = conversations[-1].created_at
+
+def recent_doc(conv):
+    return {'_id': conv.id, 'role': conv.role, 'message': conv.message, 'created_at': conv.created_at}
 
 class Conversation:
+    __slots__ = ('id', 'chat_id', 'role', 'created_at', '_body')
+    
     def __init__(self, chat_id, role, message, _id=None, created_at=None):
         self.id = _id
         self.chat_id = chat_id
         self.role = role
-        self.message = message
+        self._body = message
         self.created_at = created_at or datetime.now()
     
     @classmethod
-    def bulk_create(cls, conversations):
-        docs = []
+    def from_doc(cls, conv_data, chat_id=None):
+        conv = cls.__new__(cls)
+        conv.id = conv_data['_id']
+        conv.chat_id = chat_id if chat_id is not None else conv_data['chat_id']
+        conv.role = conv_data['role']
+        conv.created_at = conv_data['created_at']
+        # A raw BSON document keeps the body encoded until .message is read.
+        conv._body = conv_data if isinstance(conv_data, RawBSONDocument) else conv_data['message']
+        return conv
+    
+    @property
+    def message(self):
+        body = self._body
+        return body['message'] if isinstance(body, RawBSONDocument) else body
+    
+    @message.setter
+    def message(self, value):
+        self._body = value
+    
+    @classmethod
+    @timed_call("mongo", "Conversation.bulk_create")
+    def bulk_create(cls, conversations, user_id=None):
+        # user_id is stored on each message for per-user search (chatbot.search).
         for conv in conversations:
-            docs.append({
+            conv.id = conv.id or ObjectId()
+            write_behind.insert('conversations', {
+                '_id': conv.id,
                 'chat_id': conv.chat_id,
+                'user_id': user_id,
                 'role': conv.role,
                 'message': conv.message,
                 'created_at': conv.created_at
-            })
-        conversations_collection.insert_many(docs)
+            }, keys=(str(conv.chat_id), str(user_id)))
     
     @classmethod
+    @timed_call("mongo", "Conversation.filter_by_chat")
     def filter_by_chat(cls, chat):
+        write_behind.settle(str(chat.id))
         conversations = []
-        for conv_data in conversations_collection.find({'chat_id': chat.id}).sort('created_at', 1):
-            conversations.append(cls(
-                conv_data['chat_id'],
-                conv_data['role'],
-                conv_data['message'],
-                conv_data['_id'],
-                conv_data['created_at']
-            ))
+        for conv_data in lazy_conversations_collection.find({'chat_id': chat.id}, CONVERSATION_FIELDS).sort('created_at', 1):
+            conversations.append(cls.from_doc(conv_data))
         return conversations
     
     @classmethod
+    @timed_call("mongo", "Conversation.group_by_chats")
+    def group_by_chats(cls, chats):
+        # Chats whose whole history is embedded need no query.
+        grouped = {chat.id: list(chat.recent) for chat in chats if chat.has_full_history()}
+        missing = [chat.id for chat in chats if chat.id not in grouped]
+        grouped.update((chat_id, []) for chat_id in missing)
+        if not missing:
+            return grouped
+        write_behind.settle(*(str(chat_id) for chat_id in missing))
+        for conv_data in lazy_conversations_collection.find({'chat_id': {'$in': missing}}, CONVERSATION_FIELDS).sort('created_at', 1):
+            grouped[conv_data['chat_id']].append(cls.from_doc(conv_data))
+        return grouped
+    
+    @classmethod
+    def iter_by_chats(cls, chats, chunk=LIST_CHUNK_CHATS):
+        # (chat, conversations) in the order of `chats`, loaded `chunk` chats at a time so
+        # only one chunk of messages is held in memory.
+        batch = []
+        for chat in chats:
+            batch.append(chat)
+            if len(batch) == chunk:
+                grouped = cls.group_by_chats(batch)
+                yield from ((chat, grouped[chat.id]) for chat in batch)
+                batch = []
+        if batch:
+            grouped = cls.group_by_chats(batch)
+            yield from ((chat, grouped[chat.id]) for chat in batch)
+    
+    @classmethod
+    @timed_call("mongo", "Conversation.last_by_chats")
+    def last_by_chats(cls, chats):
+        last = {chat.id: chat.recent[-1] for chat in chats if chat.recent}
+        chat_ids = [chat.id for chat in chats if chat.recent is None]
+        if not chat_ids:
+            return last
+        write_behind.settle(*(str(chat_id) for chat_id in chat_ids))
+        pipeline = [
+            {'$match': {'chat_id': {'$in': chat_ids}}},
+            {'$sort': {'_id': -1}},
+            {'$group': {'_id': '$chat_id', 'last': {'$first': '$$ROOT'}}},
+        ]
+        for row in conversations_collection.aggregate(pipeline):
+            conv_data = row['last']
+            last[row['_id']] = cls.from_doc(conv_data)
+        return last
+    
+    @classmethod
+    @timed_call("mongo", "Conversation.filter_by_chat_last_n")
     def filter_by_chat_last_n(cls, chat, n):
+        write_behind.settle(str(chat.id))
+        conversations = []
+        for conv_data in conversations_collection.find({'chat_id': chat.id}, CONVERSATION_FIELDS).sort('_id', -1).limit(n):
+            conversations.append(cls.from_doc(conv_data))
+        return conversations
+    
+    @classmethod
+    @timed_call("mongo", "Conversation.recent")
+    def recent(cls, n):
         conversations = []
-        for conv_data in conversations_collection.find({'chat_id': chat.id}).sort('_id', -1).limit(n):
-            conversations.append(cls(
-                conv_data['chat_id'],
-                conv_data['role'],
-                conv_data['message'],
-                conv_data['_id'],
-                conv_data['created_at']
-            ))
+        for conv_data in conversations_collection.find({}, CONVERSATION_FIELDS).sort('_id', -1).limit(n):
+            conversations.append(cls.from_doc(conv_data))
         return conversations
     
     @classmethod
+    @timed_call("mongo", "Conversation.all")
     def all(cls):
+        write_behind.settle_all()
+        conversations = []
+        for conv_data in lazy_conversations_collection.find({}, CONVERSATION_FIELDS).sort('created_at', -1):
+            conversations.append(cls.from_doc(conv_data))
+        return conversations
+    
+    @classmethod
+    @timed_call("mongo", "Conversation.iter_newest_first")
+    def iter_newest_first(cls, chat, after=None):
+        # Lazy, batched walk from the newest message back, stopping wherever the caller stops.
+        # Messages embedded in the chat document are used first; older ones are queried.
+        before = None
+        if chat.recent is not None:
+            for conv in reversed(chat.recent):
+                if after and conv.id <= after:
+                    return
+                yield conv
+            if chat.has_full_history():
+                return
+            before = chat.recent[0].id if chat.recent else None
+        write_behind.settle(str(chat.id))
+        query = {'chat_id': chat.id}
+        if after or before:
+            query['_id'] = {}
+            if after:
+                query['_id']['$gt'] = after
+            if before:
+                query['_id']['$lt'] = before
+        for conv_data in conversations_collection.find(query, CONVERSATION_FIELDS).sort('_id', -1).batch_size(20):
+            yield cls.from_doc(conv_data)
+    
+    @classmethod
+    @timed_call("mongo", "Conversation.filter_by_chat_range")
+    def filter_by_chat_range(cls, chat, after, upto):
+        write_behind.settle(str(chat.id))
+        query = {'chat_id': chat.id, '_id': {'$lte': upto}}
+        if after:
+            query['_id']['$gt'] = after
         conversations = []
-        for conv_data in conversations_collection.find().sort('created_at', -1):
-            conversations.append(cls(
-                conv_data['chat_id'],
-                conv_data['role'],
-                conv_data['message'],
-                conv_data['_id'],
-                conv_data['created_at']
-            ))
+        for conv_data in conversations_collection.find(query, CONVERSATION_FIELDS).sort('_id', 1):
+            conversations.append(cls.from_doc(conv_data))
         return conversations
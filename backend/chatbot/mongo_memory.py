@@ -0,0 +1,85 @@
+# Async facade over a mongomock database, mirroring the pymongo AsyncCollection API
+# closely enough for chatbot.async_models. Only used with MONGODB_BACKEND=memory.
+
+
+class AsyncCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def sort(self, *args, **kwargs):
+        self._cursor = self._cursor.sort(*args, **kwargs)
+        return self
+
+    def skip(self, n):
+        self._cursor = self._cursor.skip(n)
+        return self
+
+    def batch_size(self, n):
+        self._cursor = self._cursor.batch_size(n)
+        return self
+
+    def limit(self, n):
+        self._cursor = self._cursor.limit(n)
+        return self
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._cursor)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def to_list(self, length=None):
+        docs = list(self._cursor)
+        return docs if length is None else docs[:length]
+
+
+class AsyncCollection:
+    def __init__(self, collection):
+        self._collection = collection
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self._collection.find(*args, **kwargs))
+
+    async def aggregate(self, *args, **kwargs):
+        return AsyncCursor(self._collection.aggregate(*args, **kwargs))
+
+    def __getattr__(self, name):
+        method = getattr(self._collection, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+
+        return call
+
+
+class AsyncDatabase:
+    def __init__(self, db):
+        self._db = db
+
+    def __getattr__(self, name):
+        return AsyncCollection(getattr(self._db, name))
+
+    def __getitem__(self, name):
+        return AsyncCollection(self._db[name])
+
+    async def command(self, *args, **kwargs):
+        return self._db.command(*args, **kwargs)
+
+
+def patch_bulk_updates():
+    # pymongo >= 4.11 passes sort= to BulkOperationBuilder.add_update, which mongomock
+    # does not accept yet; drop it so UpdateOne works in bulk_write.
+    from mongomock.collection import BulkOperationBuilder
+
+    add_update = BulkOperationBuilder.add_update
+    if getattr(add_update, "_accepts_sort", False):
+        return
+
+    def patched(self, *args, sort=None, **kwargs):
+        return add_update(self, *args, **kwargs)
+
+    patched._accepts_sort = True
+    BulkOperationBuilder.add_update = patched
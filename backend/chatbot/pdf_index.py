@@ -0,0 +1,371 @@
+import os
+import io
+import json
+import math
+import mmap
+import time
+import shutil
+import struct
+import hashlib
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .metrics import timed_call
+from .retrieval import BASE_DIR, CATEGORY_TERMS, LINKS_JSON_PATH, load_catalogue, tokenize
+
+# Full text of the PDFs linked from ngmc_college_links.json (timetables, fee sheets,
+# syllabi), so answers can quote the document instead of only linking it. Ingestion
+# downloads each PDF, extracts its text once (cached by content hash) and writes a new
+# index generation:
+#   chunks.bin   UTF-8 text of every chunk, back to back
+#   chunks.idx   CHUNK_RECORD per chunk: offset, length, document, token count, page
+#   postings.bin POSTING_RECORD (chunk, term frequency) runs, one run per term
+#   terms.json   term -> [byte offset, count] into postings.bin
+#   docs.json    (category, key, url) per document and corpus statistics
+# The three binary files are memory-mapped at query time, so a lookup reads only the
+# postings of the query's terms and the text of the chunks it returns.
+PDF_INDEX_DIR = os.environ.get("PDF_INDEX_DIR", os.path.join(BASE_DIR, ".pdf_index"))
+PDF_CHUNK_WORDS = int(os.environ.get("PDF_CHUNK_WORDS", "120"))
+PDF_CHUNK_OVERLAP_LINES = int(os.environ.get("PDF_CHUNK_OVERLAP_LINES", "2"))
+PDF_TOP_K = int(os.environ.get("PDF_TOP_K", "3"))
+PDF_CONTEXT_CHARS = int(os.environ.get("PDF_CONTEXT_CHARS", "2000"))
+PDF_MIN_SCORE = float(os.environ.get("PDF_MIN_SCORE", "2.0"))
+PDF_MAX_BYTES = int(os.environ.get("PDF_MAX_BYTES", str(20 * 1024 * 1024)))
+PDF_FETCH_WORKERS = int(os.environ.get("PDF_FETCH_WORKERS", "4"))
+# Chunks of a document whose file name also matches the query ("UG 5TT" for "UG 5th
+# sem") rank above the same words in an unrelated document.
+PDF_KEY_BOOST = float(os.environ.get("PDF_KEY_BOOST", "0.5"))
+
+CHUNK_RECORD = struct.Struct("<QIIIH")
+POSTING_RECORD = struct.Struct("<IH")
+KEEP_GENERATIONS = 2
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+PYPDF_MISSING = "PDF text extraction needs pypdf (pip install -r requirements.txt)"
+
+
+def is_pdf_url(url: str) -> bool:
+    return url.lower().split("?")[0].endswith(".pdf")
+
+
+def extract_pages(data: bytes) -> List[str]:
+    if PdfReader is None:
+        raise RuntimeError(PYPDF_MISSING)
+    reader = PdfReader(io.BytesIO(data))
+    return [page.extract_text() or "" for page in reader.pages]
+
+
+def chunk_pages(pages: List[str], words: int = PDF_CHUNK_WORDS, overlap: int = PDF_CHUNK_OVERLAP_LINES):
+    # (page number, text) pieces of about `words` words, cut at line breaks so table rows
+    # stay whole; the last `overlap` lines repeat at the start of the next piece.
+    for page_no, text in enumerate(pages, start=1):
+        lines = [" ".join(line.split()) for line in text.splitlines()]
+        lines = [line for line in lines if line]
+        start = 0
+        while start < len(lines):
+            end, count = start, 0
+            while end < len(lines) and (count < words or end == start):
+                count += len(lines[end].split())
+                end += 1
+            yield page_no, "\n".join(lines[start:end])
+            if end >= len(lines):
+                break
+            start = max(end - overlap, start + 1)
+
+
+def read_json(path: str, default):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return default
+
+
+def write_json(path: str, value):
+    from .scraper import write_atomic
+    write_atomic(path, json.dumps(value, ensure_ascii=False))
+
+
+def fetch_pdf(session, url: str, validators: Dict[str, str]):
+    # (bytes, or None when unchanged since `validators`, new validators)
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    from .scraper import SCRAPE_TIMEOUT
+    with session.get(url, headers=headers, timeout=SCRAPE_TIMEOUT, stream=True) as response:
+        if response.status_code == 304:
+            return None, validators
+        response.raise_for_status()
+        data = bytearray()
+        for block in response.iter_content(64 * 1024):
+            data += block
+            if len(data) > PDF_MAX_BYTES:
+                raise ValueError(f"larger than PDF_MAX_BYTES ({PDF_MAX_BYTES})")
+        return bytes(data), {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+
+
+def directory_fetch(directory: str) -> Callable:
+    # fetch() reading <directory>/<file name of the URL> instead of downloading; for
+    # fixtures and for PDFs copied in by hand.
+    def fetch(url, validators):
+        name = os.path.basename(url.split("?")[0])
+        with open(os.path.join(directory, name), "rb") as f:
+            return f.read(), {}
+    return fetch
+
+
+def write_generation(index_dir: str, entries: List[Tuple[str, str, str, List[str]]]) -> Tuple[str, int]:
+    # entries: (category, key, url, pages). Returns (generation name, chunk count).
+    name = f"gen-{time.time_ns()}"
+    path = os.path.join(index_dir, name)
+    os.makedirs(path)
+    docs, postings, lengths = [], defaultdict(list), []
+    with open(os.path.join(path, "chunks.bin"), "wb") as text_out, open(os.path.join(path, "chunks.idx"), "wb") as idx_out:
+        offset = 0
+        for doc_id, (category, key, url, pages) in enumerate(entries):
+            docs.append([category, key, url])
+            for page_no, text in chunk_pages(pages):
+                chunk_id = len(lengths)
+                encoded = text.encode("utf-8")
+                tokens = tokenize(text)
+                text_out.write(encoded)
+                idx_out.write(CHUNK_RECORD.pack(offset, len(encoded), doc_id, len(tokens), min(page_no, 0xFFFF)))
+                offset += len(encoded)
+                lengths.append(len(tokens))
+                for term, tf in Counter(tokens).items():
+                    postings[term].append((chunk_id, min(tf, 0xFFFF)))
+    terms = {}
+    with open(os.path.join(path, "postings.bin"), "wb") as out:
+        offset = 0
+        for term in sorted(postings):
+            plist = postings[term]
+            out.write(b"".join(POSTING_RECORD.pack(chunk_id, tf) for chunk_id, tf in plist))
+            terms[term] = [offset, len(plist)]
+            offset += len(plist) * POSTING_RECORD.size
+    with open(os.path.join(path, "terms.json"), "w", encoding="utf-8") as f:
+        json.dump(terms, f, ensure_ascii=False)
+    with open(os.path.join(path, "docs.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "docs": docs,
+            "chunks": len(lengths),
+            "avg_len": (sum(lengths) / len(lengths)) if lengths else 0.0,
+        }, f, ensure_ascii=False)
+    return name, len(lengths)
+
+
+def prune(index_dir: str, keep: set):
+    generations = sorted(d for d in os.listdir(index_dir) if d.startswith("gen-"))
+    for old in generations[:-KEEP_GENERATIONS]:
+        shutil.rmtree(os.path.join(index_dir, old), ignore_errors=True)
+    extracted = os.path.join(index_dir, "extracted")
+    for name in os.listdir(extracted):
+        if name.endswith(".json") and name[:-5] not in keep:
+            os.remove(os.path.join(extracted, name))
+
+
+def ingest_pdfs(json_path: str = LINKS_JSON_PATH, index_dir: str = PDF_INDEX_DIR,
+                fetch: Optional[Callable] = None, force: bool = False) -> Dict:
+    # Fetches every PDF in the catalogue; only new or changed files (by ETag/Last-Modified,
+    # then by sha256 of the bytes) are extracted again. A new index generation is written
+    # only when something changed. fetch(url, validators) -> (bytes or None, validators).
+    from .scraper import make_session
+    if PdfReader is None:
+        # Otherwise every PDF would fail on its own and the index would silently stay empty.
+        raise RuntimeError(PYPDF_MISSING)
+    started = time.perf_counter()
+    extracted_dir = os.path.join(index_dir, "extracted")
+    os.makedirs(extracted_dir, exist_ok=True)
+    manifest_path = os.path.join(index_dir, "manifest.json")
+    manifest = read_json(manifest_path, {})
+    targets = [
+        (category, key, url)
+        for category, links in load_catalogue(json_path).items()
+        for key, url in links.items() if is_pdf_url(url)
+    ]
+
+    if fetch is None:
+        session = make_session(PDF_FETCH_WORKERS)
+        fetch = lambda url, validators: fetch_pdf(session, url, validators)
+
+    def process(target):
+        category, key, url = target
+        known = manifest.get(url, {})
+        cached = known.get("sha256") and os.path.exists(os.path.join(extracted_dir, known["sha256"] + ".json"))
+        validators = {} if force or not cached else known.get("validators", {})
+        try:
+            data, validators = fetch(url, validators)
+            if data is None:
+                return url, dict(known, category=category, key=key), "unchanged"
+            sha = hashlib.sha256(data).hexdigest()
+            entry = {"sha256": sha, "validators": validators, "category": category, "key": key}
+            if cached and sha == known["sha256"] and not force:
+                return url, dict(entry, pages=known.get("pages", 0)), "unchanged"
+            pages = extract_pages(data)
+            write_json(os.path.join(extracted_dir, sha + ".json"), pages)
+            return url, dict(entry, pages=len(pages)), "changed" if known else "added"
+        except Exception as e:
+            print(f"PDF ingest failed for {key} ({url}): {e}")
+            return url, known if cached else None, "failed"
+
+    with ThreadPoolExecutor(max_workers=PDF_FETCH_WORKERS) as pool:
+        results = list(pool.map(process, targets))
+
+    new_manifest = {url: entry for url, entry, _ in results if entry}
+    outcome = Counter(status for _, _, status in results)
+    removed = sorted(set(manifest) - set(new_manifest))
+    current = read_current(index_dir)
+    summary = dict(outcome, removed=len(removed), generation=current)
+
+    renamed = any(
+        (entry["category"], entry["key"]) != (manifest.get(url, {}).get("category"), manifest.get(url, {}).get("key"))
+        for url, entry in new_manifest.items()
+    )
+    if current is None or outcome["added"] or outcome["changed"] or removed or renamed or force:
+        entries = []
+        for url, entry in new_manifest.items():
+            pages = read_json(os.path.join(extracted_dir, entry["sha256"] + ".json"), [])
+            entries.append((entry["category"], entry["key"], url, pages))
+        name, chunks = write_generation(index_dir, entries)
+        from .scraper import write_atomic
+        write_atomic(os.path.join(index_dir, "CURRENT"), name)
+        summary.update(generation=name, chunks=chunks)
+    write_json(manifest_path, new_manifest)
+    prune(index_dir, {entry["sha256"] for entry in new_manifest.values()})
+
+    print(
+        f"PDF index: {len(targets)} PDFs, +{outcome['added']} ~{outcome['changed']} "
+        f"={outcome['unchanged']} !{outcome['failed']} -{len(removed)} "
+        f"in {time.perf_counter() - started:.2f}s → {summary['generation']}"
+    )
+    return summary
+
+
+def read_current(index_dir: str = PDF_INDEX_DIR) -> Optional[str]:
+    try:
+        with open(os.path.join(index_dir, "CURRENT"), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _map(path: str):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class PdfIndex:
+    def __init__(self, path: str, version=None):
+        self.version = version
+        meta = read_json(os.path.join(path, "docs.json"), {})
+        self.docs = [tuple(doc) for doc in meta.get("docs", [])]
+        self.total = meta.get("chunks", 0)
+        self.avg_len = meta.get("avg_len", 0.0) or 1.0
+        self.terms = read_json(os.path.join(path, "terms.json"), {})
+        self.text = _map(os.path.join(path, "chunks.bin"))
+        self.records = _map(os.path.join(path, "chunks.idx"))
+        self.postings = _map(os.path.join(path, "postings.bin"))
+        self.doc_terms = [
+            set(tokenize(key)) | set(tokenize(CATEGORY_TERMS.get(category, category)))
+            for category, key, _ in self.docs
+        ]
+
+    def __len__(self):
+        return self.total
+
+    def chunk(self, chunk_id: int):
+        offset, length, doc_id, tokens, page = CHUNK_RECORD.unpack_from(self.records, chunk_id * CHUNK_RECORD.size)
+        return doc_id, page, tokens, offset, length
+
+    def chunk_text(self, offset: int, length: int) -> str:
+        return bytes(self.text[offset:offset + length]).decode("utf-8")
+
+    def search(self, query: str, k: int = PDF_TOP_K, min_score: float = PDF_MIN_SCORE):
+        # [(score, category, key, url, page, text)], best first.
+        terms = set(tokenize(query))
+        scores = defaultdict(float)
+        for term in terms:
+            entry = self.terms.get(term)
+            if not entry:
+                continue
+            offset, count = entry
+            idf = math.log(1 + (self.total - count + 0.5) / (count + 0.5))
+            for chunk_id, tf in POSTING_RECORD.iter_unpack(self.postings[offset:offset + count * POSTING_RECORD.size]):
+                scores[chunk_id] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * self._length(chunk_id) / self.avg_len))
+        ranked = []
+        for chunk_id, score in scores.items():
+            doc_id, page, _, offset, length = self.chunk(chunk_id)
+            score *= 1 + PDF_KEY_BOOST * len(terms & self.doc_terms[doc_id])
+            if score >= min_score:
+                ranked.append((score, chunk_id, doc_id, page, offset, length))
+        ranked.sort(key=lambda item: (-item[0], item[1]))
+        return [
+            (score,) + self.docs[doc_id] + (page, self.chunk_text(offset, length))
+            for score, _, doc_id, page, offset, length in ranked[:k]
+        ]
+
+    def _length(self, chunk_id: int) -> int:
+        return CHUNK_RECORD.unpack_from(self.records, chunk_id * CHUNK_RECORD.size)[3]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def pdf_index_version(index_dir: str = PDF_INDEX_DIR):
+    try:
+        stat = os.stat(os.path.join(index_dir, "CURRENT"))
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
+
+
+def get_pdf_index(index_dir: str = PDF_INDEX_DIR) -> Optional[PdfIndex]:
+    # Like retrieval.get_link_index(): reopened when ingestion publishes a new generation.
+    global _index
+    version = pdf_index_version(index_dir)
+    if version is None:
+        return None
+    index = _index
+    if index is not None and index.version == version:
+        return index
+    with _index_lock:
+        if _index is None or _index.version != version:
+            name = read_current(index_dir)
+            _index = PdfIndex(os.path.join(index_dir, name), version) if name else None
+            if _index is not None:
+                print(f"PDF index opened: {name}, {len(_index)} chunks from {len(_index.docs)} PDFs")
+        return _index
+
+
+def format_excerpts(results, max_chars: int = PDF_CONTEXT_CHARS) -> str:
+    parts, used = [], 0
+    for _, category, key, url, page, text in results:
+        room = max_chars - used
+        if room <= 0:
+            break
+        text = text[:room]
+        used += len(text)
+        parts.append(f"[{key}, page {page}] {url}\n{text}")
+    return "\n\n".join(parts)
+
+
+@timed_call("retrieval", "pdf")
+def retrieve_pdf_excerpts(query: str, k: int = PDF_TOP_K) -> str:
+    index = get_pdf_index()
+    if index is None:
+        return ""
+    return format_excerpts(index.search(query, k))
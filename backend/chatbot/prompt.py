@@ -0,0 +1,154 @@
+import os
+import time
+import threading
+from typing import Dict, List, NamedTuple
+from .models import Conversation
+from .metrics import timed_call
+from .retrieval import catalogue_version, get_link_index, retrieve_links
+from .pdf_index import retrieve_pdf_excerpts
+
+PROMPT_TTL_SECONDS = float(os.environ.get("PROMPT_TTL_SECONDS", "60"))
+RECENT_CONVERSATIONS = 5
+
+PROMPT_INTRO = """
+You are an intelligent AI assistant for Nallamuthu Gounder Mahalingam College (NGMC), Pollachi.
+Provide accurate, helpful, and engaging information about the college.
+Official site: https://www.ngmc.org
+ 
+Always be helpful, accurate, and maintain a professional yet friendly tone.
+
+Dont repeat the same answer if asked multiple times.
+ 
+Use the following web-scraped data for reference:
+"""
+
+PROMPT_RECENT = """The last 5 conversations for context:
+"""
+
+PROMPT_RULES = """
+You may get 2 types of queries:
+1. General queries about NGMC college, courses, admissions, facilities, etc.
+for this you need to answer in a conversational manner.
+2. Specific queries about exam schedules, fee structures, seating arrangements, syllabus, etc.
+for this you need to  answer with simple and direct answers with relevant links from the provided data.
+Links and document excerpts for the current query are given after the conversation history.
+
+for new line user \n use it.
+for bold text use **text**.
+
+ALWAYS output in JSON format with two keys: "reply" and "title". 
+
+LIMITS:
+- "reply" should be concise, ideally under 500 words.
+- "title" should be a brief summary of the reply, ideally under 4 words.
+"""
+
+def webScrabedData(files=("staff.txt",)):
+    current_dir=os.path.dirname(os.path.abspath(__file__))
+    contents=""
+    for filename in files:
+        filepath=os.path.join(current_dir,filename)
+        if os.path.isfile(filepath):
+            with open(filepath,"r",errors="ignore") as f:
+                contents+=f.read()+"\n"
+        else:
+            contents+=f"[{filename} not found]\n"
+    return contents.strip()
+
+NEW_CHAT_FORMAT = "Output JSON with reply and title only"
+CONTINUE_CHAT_FORMAT = "Output JSON with reply only"
+
+def format_recent(conversations):
+    return "\n".join(f"[{conv.role}] {conv.message}" for conv in reversed(conversations))
+
+class Prompt(NamedTuple):
+    # static is byte-identical across requests (until staff data changes); volatile is
+    # this turn's part: recent conversations, retrieved links and excerpts, output format.
+    static: str
+    volatile: str
+
+def system(content: str) -> Dict:
+    return {"role": "system", "content": content}
+
+def assemble(prompt: Prompt, user_message: str, history=(), summary: str = "") -> List[Dict]:
+    # Message order, most stable first, so provider-side prefix caching reuses as much as
+    # it can: the static prefix (shared by every request), the chat's summary and history
+    # (append-only within a chat), then this turn's context, and the query exactly once,
+    # as the user turn.
+    messages = [system(prompt.static)]
+    if summary:
+        messages.append(system(f"Summary of the earlier conversation:\n{summary}"))
+    messages.extend(history)
+    messages.append(system(prompt.volatile))
+    messages.append({"role": "user", "content": user_message})
+    return messages
+
+class PromptBuilder:
+    # Renders the shared parts of the prompt on first use and re-renders them after
+    # PROMPT_TTL_SECONDS or when ngmc_college_links.json changes.
+    def __init__(self, ttl=PROMPT_TTL_SECONDS):
+        self.ttl = ttl
+        self._prompt = None
+        self._expires = 0.0
+        self._version = None
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.last_build_ms = 0.0
+
+    def _fresh(self):
+        return self._prompt is not None and time.monotonic() < self._expires and self._version == catalogue_version()
+
+    def _render(self, recent):
+        return PROMPT_INTRO + webScrabedData() + PROMPT_RULES, PROMPT_RECENT + format_recent(recent) if recent else ""
+
+    def _store(self, prompt, started):
+        self._prompt = prompt
+        self._version = catalogue_version()
+        self._expires = time.monotonic() + self.ttl
+        self.builds += 1
+        self.last_build_ms = (time.perf_counter() - started) * 1000
+        print(f"[LOG] System prompt built in {self.last_build_ms:.1f}ms (build #{self.builds})")
+
+    def get(self):
+        # (static prefix, recent conversations)
+        if self._fresh():
+            return self._prompt
+        with self._lock:
+            if not self._fresh():
+                started = time.perf_counter()
+                self._store(self._render(Conversation.recent(RECENT_CONVERSATIONS)), started)
+            return self._prompt
+
+    async def aensure_fresh(self):
+        if self._fresh():
+            return
+        from .async_models import Conversation as AsyncConversation
+        started = time.perf_counter()
+        recent = await AsyncConversation.recent(RECENT_CONVERSATIONS)
+        with self._lock:
+            if not self._fresh():
+                self._store(self._render(recent), started)
+
+    @timed_call("prompt", "build")
+    def build(self, user_message: str, output_format: str) -> Prompt:
+        static, recent = self.get()
+        parts = [recent] if recent else []
+        links = retrieve_links(user_message)
+        if links:
+            parts.append("Relevant college links for this query:\n" + links)
+        excerpts = retrieve_pdf_excerpts(user_message)
+        if excerpts:
+            parts.append("Excerpts from those documents (answer from them when they cover the question, and give the link):\n" + excerpts)
+        parts.append(output_format)
+        return Prompt(static, "\n\n".join(parts))
+
+prompt_builder = PromptBuilder()
+
+def build_prompt(user_message: str, output_format: str) -> Prompt:
+    return prompt_builder.build(user_message, output_format)
+
+# The link index is file-backed and cheap to build, so it is warmed at import;
+# the Mongo-backed part of the prompt waits for the first request.
+_started = time.perf_counter()
+get_link_index()
+print(f"[LOG] Link index ready in {(time.perf_counter() - _started) * 1000:.1f}ms")
@@ -0,0 +1,321 @@
+import os
+import math
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Tuple
+
+from .metrics import Counter, Gauge
+
+# Admission control for the chat endpoints. Token buckets per authenticated user and per
+# client IP turn away clients that send too much (429 + Retry-After), and a limit on
+# concurrent upstream LLM calls, with a short bounded queue, keeps one burst from taking
+# every worker. Bucket state is in-process by default; RATE_LIMIT_BACKEND=mongo shares it
+# between workers and servers. The LLM limit is per process.
+RATE_LIMIT = os.environ.get("RATE_LIMIT", "1") != "0"
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_USER_PER_MINUTE = float(os.environ.get("RATE_LIMIT_USER_PER_MINUTE", "20"))
+RATE_LIMIT_USER_BURST = int(os.environ.get("RATE_LIMIT_USER_BURST", "10"))
+RATE_LIMIT_IP_PER_MINUTE = float(os.environ.get("RATE_LIMIT_IP_PER_MINUTE", "120"))
+RATE_LIMIT_IP_BURST = int(os.environ.get("RATE_LIMIT_IP_BURST", "30"))
+# Set it behind a reverse proxy / load balancer that sets X-Forwarded-For: there every
+# request has the proxy's REMOTE_ADDR, and the per-IP bucket becomes one limit for the
+# whole site. Never set it without such a proxy, or clients could pick their own IP.
+RATE_LIMIT_TRUST_FORWARDED = os.environ.get("RATE_LIMIT_TRUST_FORWARDED", "0") != "0"
+RATE_LIMIT_MEMORY_KEYS = int(os.environ.get("RATE_LIMIT_MEMORY_KEYS", "100000"))
+LLM_CONCURRENCY = int(os.environ.get("LLM_CONCURRENCY", "64"))  # 0: no limit
+LLM_QUEUE = int(os.environ.get("LLM_QUEUE", "128"))
+LLM_QUEUE_TIMEOUT = float(os.environ.get("LLM_QUEUE_TIMEOUT", "10"))
+
+RATE_LIMITED_REPLY = "Too many requests right now. Please wait a moment and try again."
+
+logger = logging.getLogger(__name__)
+
+rate_limited_total = Counter("ngmc_rate_limited_total", "Requests turned away with 429", ["scope"])
+
+
+class RateLimited(Exception):
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"{scope} limit reached, retry in {retry_after:.1f}s")
+        self.scope = scope
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+def gcra(tat: float, now: float, per_minute: float, burst: int) -> Tuple[bool, float, float]:
+    # Token bucket as a single timestamp (generic cell rate algorithm): tat is when the
+    # bucket would be full again. Returns (allowed, new tat, seconds until allowed).
+    interval = 60.0 / per_minute
+    tat = max(tat, now)
+    allow_at = tat + interval - burst * interval
+    if now < allow_at:
+        return False, tat, allow_at - now
+    return True, tat + interval, 0.0
+
+
+class MemoryBuckets:
+    # One process's buckets; the least recently used keys beyond max_keys are dropped
+    # (a dropped key is simply a full bucket again).
+    def __init__(self, max_keys: int = RATE_LIMIT_MEMORY_KEYS):
+        self.max_keys = max_keys
+        self._tats: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, per_minute: float, burst: int) -> Tuple[bool, float]:
+        now = time.time()
+        with self._lock:
+            allowed, tat, retry_after = gcra(self._tats.get(key, now), now, per_minute, burst)
+            self._tats[key] = tat
+            self._tats.move_to_end(key)
+            while len(self._tats) > self.max_keys:
+                self._tats.popitem(last=False)
+        return allowed, retry_after
+
+    async def atake(self, key: str, per_minute: float, burst: int) -> Tuple[bool, float]:
+        return self.take(key, per_minute, burst)
+
+
+class MongoBuckets:
+    # Buckets shared by every worker through a `rate_limits` collection: read the
+    # timestamp, compute, then compare-and-set; a lost race is simply retried. Documents
+    # expire through a TTL index once their bucket would be full again.
+    ATTEMPTS = 5
+
+    def __init__(self):
+        self._indexed = False
+
+    def _collection(self):
+        from .database import db
+        collection = db.rate_limits
+        if not self._indexed:
+            collection.create_index("expires", expireAfterSeconds=0)
+            self._indexed = True
+        return collection
+
+    def _acollection(self):
+        from .async_database import db
+        return db.rate_limits
+
+    @staticmethod
+    def _update(doc, key, now, per_minute, burst):
+        allowed, tat, retry_after = gcra(doc["tat"] if doc else now, now, per_minute, burst)
+        expires = datetime.fromtimestamp(tat, timezone.utc) + timedelta(seconds=1)
+        if doc is None:
+            return allowed, retry_after, None, {"_id": key, "tat": tat, "expires": expires}
+        return allowed, retry_after, {"_id": key, "tat": doc["tat"]}, {"$set": {"tat": tat, "expires": expires}}
+
+    def take(self, key: str, per_minute: float, burst: int) -> Tuple[bool, float]:
+        from pymongo.errors import DuplicateKeyError
+        collection = self._collection()
+        for _ in range(self.ATTEMPTS):
+            now = time.time()
+            allowed, retry_after, match, change = self._update(collection.find_one({"_id": key}), key, now, per_minute, burst)
+            if not allowed:
+                return False, retry_after
+            try:
+                if match is None:
+                    collection.insert_one(change)
+                    return True, 0.0
+                if collection.update_one(match, change).modified_count:
+                    return True, 0.0
+            except DuplicateKeyError:
+                pass
+        return True, 0.0  # heavy contention on one key: let it through rather than stall
+
+    async def atake(self, key: str, per_minute: float, burst: int) -> Tuple[bool, float]:
+        from pymongo.errors import DuplicateKeyError
+        if not self._indexed:
+            await asyncio.to_thread(self._collection)
+        collection = self._acollection()
+        for _ in range(self.ATTEMPTS):
+            now = time.time()
+            allowed, retry_after, match, change = self._update(await collection.find_one({"_id": key}), key, now, per_minute, burst)
+            if not allowed:
+                return False, retry_after
+            try:
+                if match is None:
+                    await collection.insert_one(change)
+                    return True, 0.0
+                if (await collection.update_one(match, change)).modified_count:
+                    return True, 0.0
+            except DuplicateKeyError:
+                pass
+        return True, 0.0
+
+
+BUCKET_STORES: Dict[str, Callable] = {
+    "memory": MemoryBuckets,
+    "mongo": MongoBuckets,
+}
+
+
+def register_bucket_store(name: str, factory: Callable):
+    # factory() -> object with take(key, per_minute, burst) and atake(...), both
+    # returning (allowed, retry_after_seconds).
+    BUCKET_STORES[name] = factory
+
+
+_buckets = None
+
+
+def buckets():
+    global _buckets
+    if _buckets is None:
+        _buckets = BUCKET_STORES[RATE_LIMIT_BACKEND]()
+    return _buckets
+
+
+_forwarded_warned = False
+
+
+def client_ip(request) -> str:
+    global _forwarded_warned
+    forwarded = request.META.get("HTTP_X_FORWARDED_FOR", "")
+    if forwarded and RATE_LIMIT_TRUST_FORWARDED:
+        return forwarded.split(",")[0].strip()
+    if forwarded and not _forwarded_warned:
+        _forwarded_warned = True
+        logger.warning("Requests arrive through a proxy (X-Forwarded-For) but RATE_LIMIT_TRUST_FORWARDED "
+                       "is off, so every client shares the proxy's per-IP bucket")
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def _bucket(request, user):
+    if user is None:
+        return "ip", f"ip:{client_ip(request)}", RATE_LIMIT_IP_PER_MINUTE, RATE_LIMIT_IP_BURST
+    return "user", f"user:{user.id}", RATE_LIMIT_USER_PER_MINUTE, RATE_LIMIT_USER_BURST
+
+
+def check_rate(request, user=None):
+    # Per-IP before authentication (user=None), per-user after. Raises RateLimited.
+    if not RATE_LIMIT:
+        return
+    scope, key, per_minute, burst = _bucket(request, user)
+    allowed, retry_after = buckets().take(key, per_minute, burst)
+    if not allowed:
+        rate_limited_total.inc(scope=scope)
+        raise RateLimited(scope, retry_after)
+
+
+async def acheck_rate(request, user=None):
+    if not RATE_LIMIT:
+        return
+    scope, key, per_minute, burst = _bucket(request, user)
+    allowed, retry_after = await buckets().atake(key, per_minute, burst)
+    if not allowed:
+        rate_limited_total.inc(scope=scope)
+        raise RateLimited(scope, retry_after)
+
+
+class _Waiter:
+    __slots__ = ("event", "loop", "future", "granted")
+
+    def __init__(self, loop=None):
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+        self.granted = False
+
+
+class Admission:
+    # At most `limit` holders; up to `queue` more wait in arrival order for at most
+    # `timeout` seconds. Anyone beyond that is rejected at once. A released slot goes
+    # straight to the oldest waiter, whether it is a thread or a coroutine.
+    def __init__(self, name: str, limit: int, queue: int, timeout: float):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self._active = 0
+        self._waiters = deque()
+        self._hold = 1.0  # moving average of how long a slot is held, for Retry-After
+        self._lock = threading.Lock()
+
+    def _enter(self, loop=None):
+        with self._lock:
+            if self.limit <= 0 or (self._active < self.limit and not self._waiters):
+                self._active += 1
+                return None
+            if len(self._waiters) >= self.queue:
+                raise self._rejected()
+            waiter = _Waiter(loop)
+            self._waiters.append(waiter)
+            return waiter
+
+    def _rejected(self) -> RateLimited:
+        rate_limited_total.inc(scope=self.name)
+        return RateLimited(self.name, self._hold * (len(self._waiters) + 1) / max(self.limit, 1))
+
+    def _abandon(self, waiter) -> bool:
+        # True when the slot was handed over just as the waiter gave up: it owns it now.
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            return False
+
+    def _release(self, held: float):
+        with self._lock:
+            self._hold = 0.8 * self._hold + 0.2 * held
+            if not self._waiters:
+                self._active -= 1
+                return
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+        if waiter.future is not None:
+            waiter.loop.call_soon_threadsafe(waiter.future.set_result, None)
+        else:
+            waiter.event.set()
+
+    def acquire(self) -> float:
+        waiter = self._enter()
+        if waiter is not None and not waiter.event.wait(self.timeout) and not self._abandon(waiter):
+            with self._lock:
+                raise self._rejected()
+        return time.perf_counter()
+
+    async def aacquire(self) -> float:
+        waiter = self._enter(asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.timeout)
+            except asyncio.TimeoutError:
+                if not self._abandon(waiter):
+                    with self._lock:
+                        raise self._rejected() from None
+            except asyncio.CancelledError:
+                if self._abandon(waiter):
+                    self._release(0.0)
+                raise
+        return time.perf_counter()
+
+    def release(self, started: float):
+        self._release(time.perf_counter() - started)
+
+    @contextmanager
+    def slot(self):
+        started = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(started)
+
+    @asynccontextmanager
+    async def aslot(self):
+        started = await self.aacquire()
+        try:
+            yield
+        finally:
+            self.release(started)
+
+    def state(self) -> Dict[str, int]:
+        with self._lock:
+            return {"active": self._active, "waiting": len(self._waiters)}
+
+
+llm_slots = Admission("llm", LLM_CONCURRENCY, LLM_QUEUE, LLM_QUEUE_TIMEOUT)
+
+Gauge("ngmc_llm_slots", "Upstream LLM calls holding or waiting for a slot", lambda: llm_slots.state(), ["state"])
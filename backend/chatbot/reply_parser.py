@@ -0,0 +1,196 @@
+import json
+import re
+from json.decoder import scanstring
+from typing import Dict, Iterable
+
+# Pulls "reply" and "title" out of the model's output in one left-to-right pass, chunk by
+# chunk as it streams. It copes with code fences, prose before or after the object, keys
+# in any order, a missing title ("reply only" prompts), raw newlines inside strings, and
+# output cut off mid-string. Output that is not a JSON object at all is used as the reply.
+DEFAULT_TITLE = "NGMC Query Response"
+
+SEEK, OBJECT, STRING, DONE = range(4)
+KEY, VALUE = range(2)
+
+STRUCTURE_RE = re.compile(r'[{}\[\]":,]')
+# A run of string content json's C scanner can decode in one go: no quote, no incomplete
+# or unknown escape, and no high surrogate (its low half may still be on the way). The
+# alternatives start with different characters and the match never fails, so it does
+# not backtrack.
+STRING_RUN_RE = re.compile(r'(?:[^"\\]+|\\["\\/bfnrt]|\\u(?![dD][89abAB])[0-9a-fA-F]{4})*')
+FENCE_RE = re.compile(r"^\s*```[\w-]*[ \t]*\n?|\n?```\s*$")
+ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+def strip_fences(text: str) -> str:
+    return FENCE_RE.sub("", text.strip()).strip()
+
+
+def decode_escape(buf: str, i: int):
+    # (decoded text, characters consumed) for the escape starting at buf[i] == "\\",
+    # or ("", 0) when the rest of it has not arrived yet.
+    if i + 1 >= len(buf):
+        return "", 0
+    c = buf[i + 1]
+    if c != "u":
+        return ESCAPES.get(c, c), 2
+    if i + 6 > len(buf):
+        return "", 0
+    try:
+        code = int(buf[i + 2:i + 6], 16)
+    except ValueError:
+        return buf[i:i + 6], 6
+    if 0xD800 <= code < 0xDC00:
+        if i + 12 > len(buf):
+            return "", 0
+        if buf[i + 6:i + 8] == "\\u":
+            try:
+                low = int(buf[i + 8:i + 12], 16)
+            except ValueError:
+                low = 0
+            if 0xDC00 <= low < 0xE000:
+                return chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)), 12
+        return "\ufffd", 6
+    return chr(code), 6
+
+
+class ReplyParser:
+    __slots__ = ("fields", "state", "depth", "expect", "key", "target", "values", "done_fields",
+                 "_key_parts", "_tail", "_raw", "_flushed")
+
+    def __init__(self, fields: Iterable[str] = ("reply", "title")):
+        self.fields = frozenset(fields)
+        self.state = SEEK
+        self.depth = 0
+        self.expect = KEY
+        self.key = None
+        self.target = None
+        self.values: Dict[str, list] = {}
+        self.done_fields = set()
+        self._key_parts = []
+        self._tail = ""
+        self._raw = []
+        self._flushed = False
+
+    def feed(self, chunk: str) -> str:
+        # Returns the reply text decoded from this chunk (possibly "").
+        self._raw.append(chunk)
+        if self.state == DONE:
+            return ""
+        buf = self._tail + chunk
+        out = []
+        pos, n = 0, len(buf)
+        while pos < n and self.state != DONE:
+            if self.state == SEEK:
+                i = buf.find("{", pos)
+                if i < 0:
+                    pos = n
+                    break
+                self.state, self.depth, self.expect, self.key = OBJECT, 1, KEY, None
+                pos = i + 1
+            elif self.state == OBJECT:
+                m = STRUCTURE_RE.search(buf, pos)
+                if m is None:
+                    pos = n
+                    break
+                c, pos = m.group(), m.end()
+                if c == '"':
+                    self._start_string()
+                elif c in "{[":
+                    self.depth += 1
+                elif c in "}]":
+                    self.depth -= 1
+                    if self.depth == 0:
+                        # An object without a reply (a "{name}" in prose, say): keep looking.
+                        self.state = DONE if "reply" in self.done_fields else SEEK
+                elif self.depth == 1:
+                    self.expect = VALUE if c == ":" else KEY
+            else:
+                end = STRING_RUN_RE.match(buf, pos).end()
+                if end > pos:
+                    self._emit(scanstring(buf[pos:end] + '"', 0, False)[0], out)
+                pos = end
+                if end == n:
+                    break
+                if buf[end] == '"':
+                    pos = end + 1
+                    self._end_string()
+                    continue
+                text, size = decode_escape(buf, end)
+                if size == 0:
+                    break
+                self._emit(text, out)
+                pos = end + size
+        self._tail = buf[pos:]
+        return "".join(out)
+
+    def _start_string(self):
+        self.state = STRING
+        self.target = None
+        if self.depth != 1:
+            return
+        if self.expect == KEY:
+            self.target = KEY
+            self._key_parts = []
+        elif self.key in self.fields and self.key not in self.values:
+            self.target = self.key
+            self.values[self.key] = []
+
+    def _end_string(self):
+        self.state = OBJECT
+        if self.target == KEY:
+            self.key = "".join(self._key_parts)
+        elif self.target is not None:
+            self.done_fields.add(self.target)
+        self.target = None
+
+    def _emit(self, text: str, out: list):
+        if self.target == KEY:
+            self._key_parts.append(text)
+        elif self.target is not None:
+            self.values[self.target].append(text)
+            if self.target == "reply":
+                out.append(text)
+
+    def close(self) -> str:
+        # Call once the output is complete. Returns any reply text not yet handed out by
+        # feed(): the fallback reply when there was no usable "reply" field.
+        if self._flushed:
+            return ""
+        self._flushed = True
+        in_field = self.state == STRING and self.target in self.fields
+        if in_field and self._tail:
+            # Cut off inside an escape: keep what is there rather than lose it.
+            self.values[self.target].append(self._tail)
+            self.done_fields.add(self.target)
+            return self._tail if self.target == "reply" else ""
+        if in_field:
+            self.done_fields.add(self.target)
+        if not self._has_reply():
+            return self.result()["reply"]
+        return ""
+
+    def _has_reply(self) -> bool:
+        return bool("".join(self.values.get("reply", ())).strip())
+
+    def result(self, default_title: str = DEFAULT_TITLE) -> Dict:
+        if not self._has_reply():
+            return {"reply": strip_fences("".join(self._raw)), "title": default_title}
+        title = "".join(self.values.get("title", ())).strip()
+        return {"reply": "".join(self.values["reply"]), "title": title or default_title}
+
+
+def parse_reply(text: str, default_title: str = DEFAULT_TITLE) -> Dict:
+    # Well-formed output (always, in JSON mode) goes through the C decoder.
+    try:
+        doc = json.loads(text)
+    except ValueError:
+        doc = None
+    if isinstance(doc, dict) and isinstance(doc.get("reply"), str) and doc["reply"].strip():
+        title = doc.get("title")
+        title = title.strip() if isinstance(title, str) else ""
+        return {"reply": doc["reply"], "title": title or default_title}
+    parser = ReplyParser()
+    parser.feed(text)
+    parser.close()
+    return parser.result(default_title)
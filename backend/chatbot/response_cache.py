@@ -0,0 +1,146 @@
+import os
+import re
+import math
+import time
+import threading
+from collections import OrderedDict, Counter, defaultdict
+from typing import Dict, Optional
+
+from .metrics import Gauge
+from .retrieval import catalogue_version, tokenize
+from .pdf_index import pdf_index_version
+
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "1000"))
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_SIMILARITY = float(os.environ.get("RESPONSE_CACHE_SIMILARITY", "0.9"))
+
+NORMALIZE_RE = re.compile(r"[^a-z0-9]+")
+
+
+def normalize(text: str) -> str:
+    return NORMALIZE_RE.sub(" ", text.lower()).strip()
+
+
+def ngram_vector(normalized: str, n: int = 3) -> Counter:
+    # Built from the retrieval tokens so "sem"/"semester" and "fees"/"fee" line up.
+    padded = f" {' '.join(tokenize(normalized))} "
+    return Counter(padded[i:i + n] for i in range(max(len(padded) - n + 1, 1)))
+
+
+def discriminators(normalized: str) -> frozenset:
+    # Numbers and short codes (ug/pg/sf/bca, 3/5, 2025) change the answer even when
+    # the rest of the sentence is identical, so similar matches must agree on them.
+    return frozenset(tok for tok in tokenize(normalized) if tok.isdigit() or len(tok) <= 3)
+
+
+class _Entry:
+    __slots__ = ("value", "vector", "norm", "keys", "expires")
+
+    def __init__(self, value, vector, keys, expires):
+        self.value = value
+        self.vector = vector
+        self.norm = math.sqrt(sum(c * c for c in vector.values()))
+        self.keys = keys
+        self.expires = expires
+
+
+class ResponseCache:
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL, threshold=RESPONSE_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._postings: Dict[str, set] = defaultdict(set)
+        self._lock = threading.Lock()
+        self._version = (catalogue_version(), pdf_index_version())
+        self.hits_exact = 0
+        self.hits_similar = 0
+        self.misses = 0
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        for gram in entry.vector:
+            keys = self._postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[gram]
+
+    def _check_version(self):
+        # Cached answers quote links and documents, so a refreshed catalogue or PDF index
+        # invalidates all of them.
+        version = (catalogue_version(), pdf_index_version())
+        if version != self._version:
+            self._entries.clear()
+            self._postings.clear()
+            self._version = version
+
+    def _similar(self, vector, keys, now) -> Optional[str]:
+        dots = defaultdict(int)
+        for gram, count in vector.items():
+            for key in self._postings.get(gram, ()):
+                dots[key] += count * self._entries[key].vector[gram]
+        norm = math.sqrt(sum(c * c for c in vector.values()))
+        best, best_score = None, self.threshold
+        for key, dot in dots.items():
+            entry = self._entries[key]
+            if entry.expires < now or entry.keys != keys:
+                continue
+            score = dot / (norm * entry.norm)
+            if score >= best_score:
+                best, best_score = key, score
+        return best
+
+    def get(self, text: str):
+        normalized = normalize(text)
+        now = time.monotonic()
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(normalized)
+            if entry is not None and entry.expires < now:
+                self._drop(normalized)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(normalized)
+                self.hits_exact += 1
+                return entry.value
+
+            key = self._similar(ngram_vector(normalized), discriminators(normalized), now)
+            if key is not None:
+                self._entries.move_to_end(key)
+                self.hits_similar += 1
+                return self._entries[key].value
+
+            self.misses += 1
+            return None
+
+    def set(self, text: str, value):
+        normalized = normalize(text)
+        vector = ngram_vector(normalized)
+        with self._lock:
+            self._check_version()
+            if normalized in self._entries:
+                self._drop(normalized)
+            self._entries[normalized] = _Entry(value, vector, discriminators(normalized), time.monotonic() + self.ttl)
+            for gram in vector:
+                self._postings[gram].add(normalized)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._postings.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits_exact": self.hits_exact,
+                "hits_similar": self.hits_similar,
+                "misses": self.misses,
+            }
+
+
+response_cache = ResponseCache()
+Gauge("ngmc_response_cache", "Response cache entries and hit/miss counters", response_cache.stats, ["stat"])
@@ -0,0 +1,140 @@
+import os
+import re
+import json
+import math
+import threading
+from collections import defaultdict, Counter
+from typing import Dict, List, Tuple
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LINKS_JSON_PATH = os.environ.get("LINKS_JSON_PATH", os.path.join(BASE_DIR, "ngmc_college_links.json"))
+RETRIEVAL_TOP_K = int(os.environ.get("RETRIEVAL_TOP_K", "8"))
+
+TOKEN_RE = re.compile(r"[a-z]+|\d+")
+
+STOPWORDS = {
+    "a", "an", "the", "of", "for", "to", "in", "on", "and", "or", "is", "are", "was",
+    "what", "when", "where", "which", "how", "me", "my", "i", "give", "show", "send",
+    "please", "pls", "can", "you", "get", "link", "links", "pdf", "file", "st", "nd",
+    "rd", "th", "about", "do", "does", "need", "want", "wp", "content", "uploads",
+}
+
+# Abbreviations used in the PDF file names mapped to the words students type.
+SYNONYMS = {
+    "tt": "timetable",
+    "time": "timetable",
+    "table": "timetable",
+    "schedule": "timetable",
+    "fees": "fee",
+    "sem": "semester",
+    "seat": "seating",
+    "hall": "seating",
+    "curriculum": "syllabus",
+    "fn": "forenoon",
+}
+
+CATEGORY_TERMS = {
+    "exam_schedule": "exam schedule timetable test",
+    "fee_structure": "fee structure payment",
+    "seating_arrangements": "seating arrangement exam hall",
+    "syllabus": "syllabus course",
+}
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    # "UG-5TT-F_N" and "UG 5th sem" both end up as ug / 5 / ...
+    tokens = []
+    for tok in TOKEN_RE.findall(text.lower().replace("_", " ")):
+        tok = SYNONYMS.get(tok, tok)
+        if tok in STOPWORDS:
+            continue
+        tokens.append(tok)
+    return tokens
+
+
+class LinkIndex:
+    def __init__(self, catalogue: Dict[str, Dict[str, str]], version=None):
+        self.version = version
+        self.docs: List[Tuple[str, str, str]] = []
+        self.doc_len: List[int] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+
+        for category, links in catalogue.items():
+            category_tokens = tokenize(CATEGORY_TERMS.get(category, category))
+            for key, url in links.items():
+                doc_id = len(self.docs)
+                self.docs.append((category, key, url))
+                tokens = tokenize(key) + category_tokens
+                self.doc_len.append(len(tokens))
+                for term, tf in Counter(tokens).items():
+                    self.postings[term].append((doc_id, tf))
+
+        total = len(self.docs)
+        self.avgdl = (sum(self.doc_len) / total) if total else 0.0
+        self.idf = {
+            term: math.log(1 + (total - len(plist) + 0.5) / (len(plist) + 0.5))
+            for term, plist in self.postings.items()
+        }
+
+    def __len__(self):
+        return len(self.docs)
+
+    def search(self, query: str, k: int = RETRIEVAL_TOP_K) -> List[Tuple[float, str, str, str]]:
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = self.idf[term]
+            for doc_id, tf in plist:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[doc_id] / self.avgdl)
+                scores[doc_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+        return [(score,) + self.docs[doc_id] for doc_id, score in ranked]
+
+
+def load_catalogue(path: str = LINKS_JSON_PATH) -> Dict[str, Dict[str, str]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Link catalogue unavailable ({path}): {e}")
+        return {}
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def catalogue_version(path: str = LINKS_JSON_PATH):
+    try:
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
+
+
+def get_link_index(path: str = LINKS_JSON_PATH) -> LinkIndex:
+    # A stat() per request is enough to notice a fresh scrape and rebuild.
+    global _index
+    version = catalogue_version(path)
+    index = _index
+    if index is not None and index.version == version:
+        return index
+    with _index_lock:
+        if _index is None or _index.version != version:
+            _index = LinkIndex(load_catalogue(path), version)
+            print(f"Link index built: {len(_index)} entries")
+        return _index
+
+
+def format_links(results) -> str:
+    return "\n".join(f"{category}: {key}: {url}" for _, category, key, url in results)
+
+
+def retrieve_links(query: str, k: int = RETRIEVAL_TOP_K) -> str:
+    return format_links(get_link_index().search(query, k))
@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .retrieval import BASE_DIR, LINKS_JSON_PATH
+
+LINKS_TXT_PATH = os.path.join(BASE_DIR, "links.txt")
+SCRAPE_STATE_PATH = os.environ.get("SCRAPE_STATE_PATH", os.path.join(BASE_DIR, ".scrape_state.json"))
+SCRAPE_TIMEOUT = float(os.environ.get("SCRAPE_TIMEOUT", "15"))
+SCRAPE_INTERVAL_SECONDS = float(os.environ.get("SCRAPE_INTERVAL_SECONDS", str(6 * 60 * 60)))
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
+}
+
+
+def absolute(href: str, origin: str) -> str:
+    return f"{origin}{href}" if href.startswith("/") else href
+
+
+def key_from_url(href: str) -> str:
+    return os.path.splitext(os.path.basename(href))[0]
+
+
+def parse_pdf_links(html: str, origin: str) -> Dict[str, str]:
+    soup = BeautifulSoup(html, "html.parser")
+    links = {}
+    for a_tag in soup.find_all("a"):
+        href = a_tag.get("href")
+        if href and href.lower().endswith(".pdf"):
+            href = absolute(href, origin)
+            links[key_from_url(href)] = href
+    return links
+
+
+def parse_open_links(html: str, origin: str) -> Dict[str, str]:
+    soup = BeautifulSoup(html, "html.parser")
+    links = {}
+    for a_tag in soup.find_all("a"):
+        if "open" in a_tag.text.lower():
+            link = a_tag.get("href")
+            if link:
+                link = absolute(link, origin)
+                links[key_from_url(link)] = link
+    return links
+
+
+def parse_syllabus_links(html: str, origin: str) -> Dict[str, str]:
+    soup = BeautifulSoup(html, "html.parser")
+    links = {}
+    for a_tag in soup.find_all("a"):
+        if "open" in a_tag.text.lower():
+            link = a_tag.get("href")
+            if link:
+                name_tag = a_tag.find_previous(lambda tag: tag.name in ["h3", "h4", "span", "strong"] and tag.text.strip())
+                name = name_tag.text.strip() if name_tag else f"link_{len(links)+1}"
+                links[name] = absolute(link, origin)
+    return links
+
+
+# (category, page, origin used for relative links, parser)
+SOURCES = [
+    ("exam_schedule", "https://coe.ngmc.ac.in/exam-schedule/", "https://coe.ngmc.ac.in", parse_pdf_links),
+    ("fee_structure", "https://www.ngmc.org/admissions/fee-structure/", "https://www.ngmc.org", parse_pdf_links),
+    ("seating_arrangements", "https://coe.ngmc.ac.in/seating-arrangements/", "https://coe.ngmc.ac.in", parse_open_links),
+    ("syllabus", "https://www.ngmc.org/syllabus-list-2/", "https://www.ngmc.org", parse_syllabus_links),
+]
+
+
+def make_session(pool_size: int = len(SOURCES)) -> requests.Session:
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    retry = Retry(total=2, backoff_factor=0.5, status_forcelist=[502, 503, 504], allowed_methods=["GET"])
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def read_json(path: str, default):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return default
+
+
+def write_atomic(path: str, content: str):
+    # Write next to the target and rename over it so readers never see a partial file.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def fetch_page(session: requests.Session, url: str, validators: Dict[str, str]):
+    # Returns (html or None when unchanged, new validators).
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    response = session.get(url, headers=headers, timeout=SCRAPE_TIMEOUT)
+    if response.status_code == 304:
+        return None, validators
+    response.raise_for_status()
+    return response.text, {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+
+
+def diff_links(old: Dict[str, Dict[str, str]], new: Dict[str, Dict[str, str]]) -> Dict[str, Dict[str, list]]:
+    changes = {}
+    for category in set(old) | set(new):
+        before, after = old.get(category, {}), new.get(category, {})
+        added = sorted(set(after) - set(before))
+        removed = sorted(set(before) - set(after))
+        changed = sorted(key for key in set(before) & set(after) if before[key] != after[key])
+        if added or removed or changed:
+            changes[category] = {"added": added, "removed": removed, "changed": changed}
+    return changes
+
+
+def render_links_txt(links: Dict[str, Dict[str, str]]) -> str:
+    # Plain-text view of the catalogue, as clean_json_to_txt used to produce it.
+    lines = []
+    for category, entries in links.items():
+        lines.append(f"{category}: ")
+        for key, url in entries.items():
+            lines.append(f"        {key}: {url}")
+    return "\n".join(lines)
+
+
+def scrape_links(json_path: str = LINKS_JSON_PATH, txt_path: Optional[str] = LINKS_TXT_PATH,
+                 state_path: str = SCRAPE_STATE_PATH, fetch: Optional[Callable] = None):
+    # fetch(url, validators) -> (html or None, validators); defaults to a pooled session,
+    # and can be swapped for recorded pages.
+    previous = read_json(json_path, {})
+    state = read_json(state_path, {})
+
+    if fetch is None:
+        session = make_session()
+        fetch = lambda url, validators: fetch_page(session, url, validators)
+
+    def scrape(source):
+        category, url, origin, parser = source
+        old_links = previous.get(category, {})
+        # Without the links, a 304 would leave the category empty for good: fetch it in full.
+        old_validators = state.get(category, {}) if old_links else {}
+        try:
+            html, validators = fetch(url, old_validators)
+        except Exception as e:
+            print(f"Scrape failed for {category} ({url}): {e}")
+            return category, old_links, old_validators
+        if html is None:
+            return category, old_links, validators
+        links = parser(html, origin)
+        if not links and old_links:
+            # A page that lists nothing is a redesign or an error page, not a real empty
+            # list; keep the old links and refetch in full next time.
+            print(f"Scrape of {category} ({url}) found no links; keeping the {len(old_links)} known")
+            return category, old_links, old_validators
+        return category, links, validators
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(SOURCES)) as pool:
+        results = list(pool.map(scrape, SOURCES))
+
+    all_links = {category: links for category, links, _ in results}
+    new_state = {category: validators for category, _, validators in results}
+    changes = diff_links(previous, all_links)
+
+    if changes:
+        write_atomic(json_path, json.dumps(all_links, indent=4, ensure_ascii=False))
+        if txt_path:
+            write_atomic(txt_path, render_links_txt(all_links))
+    if new_state != state:
+        write_atomic(state_path, json.dumps(new_state, indent=4))
+
+    counts = ", ".join(f"{category}({len(links)})" for category, links in all_links.items())
+    summary = ", ".join(
+        f"{category} +{len(c['added'])}/-{len(c['removed'])}/~{len(c['changed'])}" for category, c in sorted(changes.items())
+    ) or "no changes"
+    print(f"Scraped {counts} in {time.perf_counter() - started:.2f}s → {summary}")
+    return all_links, changes
+
+
+_scheduler = None
+
+
+def start_scrape_scheduler(interval: float = SCRAPE_INTERVAL_SECONDS):
+    # Daemon thread that scrapes right away and then every `interval` seconds.
+    global _scheduler
+    if _scheduler is not None or interval <= 0:
+        return _scheduler
+
+    def loop():
+        while True:
+            try:
+                scrape_links()
+            except Exception as e:
+                print(f"Scheduled scrape failed: {e}")
+            time.sleep(interval)
+
+    _scheduler = threading.Thread(target=loop, name="scrape-links", daemon=True)
+    _scheduler.start()
+    return _scheduler
@@ -0,0 +1,209 @@
+import os
+import re
+import math
+from typing import Dict, List, Optional, Tuple
+
+from .database import MONGODB_BACKEND, chats_collection, conversations_collection
+from .models import CONVERSATION_FIELDS
+from .metrics import timed_call
+from .write_behind import write_behind
+
+# Search over one user's own messages. With MongoDB it is a $text query on the
+# conversations_search index (user_id equality prefix + text on message, see
+# chatbot.database), so only that user's index entries are scanned. Scores are Mongo's
+# textScore; snippets and highlight offsets are cut here. mongomock has no $text, so the
+# memory backend scans the user's messages with a simple tf score instead.
+SEARCH_PAGE_SIZE = int(os.environ.get("SEARCH_PAGE_SIZE", "10"))
+SEARCH_MAX_PAGE_SIZE = int(os.environ.get("SEARCH_MAX_PAGE_SIZE", "50"))
+SEARCH_MAX_RESULTS = int(os.environ.get("SEARCH_MAX_RESULTS", "200"))
+SEARCH_MAX_QUERY_CHARS = int(os.environ.get("SEARCH_MAX_QUERY_CHARS", "200"))
+SEARCH_SNIPPET_CHARS = int(os.environ.get("SEARCH_SNIPPET_CHARS", "160"))
+
+TEXT_SEARCH = MONGODB_BACKEND != "memory"
+SEARCH_FIELDS = {'chat_id': 1, 'role': 1, 'message': 1, 'created_at': 1, 'score': {'$meta': 'textScore'}}
+SEARCH_SORT = [('score', {'$meta': 'textScore'}), ('_id', -1)]
+
+QUERY_RE = re.compile(r'(-?)"([^"]*)"|(-?)(\w+)')
+WORD_RE = re.compile(r"\w+")
+# Roughly the words MongoDB's english text index drops; they are never highlighted.
+STOPWORDS = frozenset("""a an and are as at be but by for from has have i in is it its me my
+of on or our so that the this to was we were what when where which who will with you your""".split())
+
+
+class SearchError(ValueError):
+    pass
+
+
+def stem(word: str) -> str:
+    # Crude suffix stripping so "timetables" highlights "timetable", as the text index
+    # (which stems) would match it. Only used for highlighting and the memory backend.
+    word = word.lower()
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    for suffix in ("ing", "ed"):
+        if len(word) - len(suffix) >= 3 and word.endswith(suffix):
+            return word[:-len(suffix)]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        word = word[:-1]
+    if len(word) > 3 and word.endswith("e"):
+        word = word[:-1]
+    return word
+
+
+class Query:
+    __slots__ = ("text", "terms", "phrases", "excluded")
+
+    def __init__(self, text: str):
+        text = text.strip() if isinstance(text, str) else ""
+        if not text:
+            raise SearchError("query is required")
+        if len(text) > SEARCH_MAX_QUERY_CHARS:
+            raise SearchError(f"query is longer than {SEARCH_MAX_QUERY_CHARS} characters")
+        self.text = text
+        self.terms, self.phrases, self.excluded = set(), [], set()
+        for m in QUERY_RE.finditer(text):
+            negated = m.group(1) or m.group(3)
+            words = WORD_RE.findall(m.group(2)) if m.group(2) is not None else [m.group(4)]
+            stems = {stem(w) for w in words if w.lower() not in STOPWORDS}
+            if negated:
+                self.excluded |= stems
+                continue
+            self.terms |= stems
+            if m.group(2) is not None and m.group(2).strip():
+                self.phrases.append(m.group(2).strip().lower())
+        if not self.terms:
+            raise SearchError("query has no searchable words")
+
+    def filter(self, user_id) -> Dict:
+        return {'user_id': user_id, '$text': {'$search': self.text}}
+
+    def score(self, message: str) -> float:
+        # Memory backend only: every phrase present, no excluded word, then tf per term
+        # damped by message length.
+        lowered = message.lower()
+        if any(phrase not in lowered for phrase in self.phrases):
+            return 0.0
+        counts = {}
+        words = WORD_RE.findall(message)
+        for word in words:
+            s = stem(word)
+            if s in self.excluded:
+                return 0.0
+            if s in self.terms:
+                counts[s] = counts.get(s, 0) + 1
+        if not counts:
+            return 0.0
+        return sum(1 + math.log(n) for n in counts.values()) * (1.1 - min(len(words), 500) / 1000)
+
+
+def snippet(message: str, terms, size: int = SEARCH_SNIPPET_CHARS):
+    # (text, [[start, end], ...]): a window of about `size` characters around the densest
+    # run of matched words, with the matches' offsets inside the returned text.
+    spans = [(m.start(), m.end(), s) for m in WORD_RE.finditer(message) if (s := stem(m.group())) in terms]
+    start, end = 0, len(message)
+    if len(message) > size:
+        best, best_count = 0, -1
+        for i, (s, _, _) in enumerate(spans):
+            left = max(0, s - size // 4)
+            count = len({t for a, b, t in spans[i:] if b <= left + size})
+            if count > best_count:
+                best, best_count = left, count
+        start = best
+        if start > 0:
+            space = message.rfind(" ", max(0, start - 20), start)
+            start = space + 1 if space >= 0 else start
+        end = min(len(message), start + size)
+        if end < len(message):
+            space = message.rfind(" ", start + size // 2, end)
+            end = space if space > 0 else end
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if end < len(message) else ""
+    # Same length as the original, so offsets still line up.
+    text = prefix + message[start:end].translate(str.maketrans("\n\r\t", "   ")) + suffix
+    shift = len(prefix) - start
+    return text, [[a + shift, b + shift] for a, b, _ in spans if a >= start and b <= end]
+
+
+def result(doc, query: Query, titles: Dict) -> Dict:
+    text, highlights = snippet(doc['message'], query.terms)
+    return {
+        'messageId': str(doc['_id']),
+        'chatId': str(doc['chat_id']),
+        'chatTitle': titles.get(doc['chat_id']),
+        'role': doc['role'],
+        'created_at': doc['created_at'].isoformat(),
+        'score': round(doc['score'], 3),
+        'snippet': text,
+        'highlights': highlights,
+    }
+
+
+def ranked(query: Query, docs) -> List[Dict]:
+    scored = []
+    for doc in docs:
+        score = query.score(doc['message'])
+        if score > 0:
+            doc['score'] = score
+            scored.append(doc)
+    # Same order as SEARCH_SORT: score, then newest first.
+    scored.sort(key=lambda doc: doc['_id'], reverse=True)
+    scored.sort(key=lambda doc: doc['score'], reverse=True)
+    return scored
+
+
+def read_page(cursor, limit) -> Tuple[int, int]:
+    # cursor is the opaque offset handed out as nextCursor; pages stop at SEARCH_MAX_RESULTS.
+    try:
+        offset = int(cursor or 0)
+        limit = min(max(int(limit if limit is not None else SEARCH_PAGE_SIZE), 1), SEARCH_MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        raise SearchError("Invalid cursor or limit")
+    if offset < 0 or offset >= SEARCH_MAX_RESULTS:
+        raise SearchError("Invalid cursor")
+    return offset, min(limit, SEARCH_MAX_RESULTS - offset)
+
+
+def page(query: Query, docs, titles, offset, limit) -> Dict:
+    more = len(docs) > limit and offset + limit < SEARCH_MAX_RESULTS
+    return {
+        'results': [result(doc, query, titles) for doc in docs[:limit]],
+        'nextCursor': str(offset + limit) if more else None,
+    }
+
+
+def title_query(user_id, docs):
+    return {'_id': {'$in': list({doc['chat_id'] for doc in docs})}, 'user_id': user_id}
+
+
+@timed_call("mongo", "search")
+def search_messages(user_id, text: str, cursor: Optional[str] = None, limit=None) -> Dict:
+    query = Query(text)
+    offset, limit = read_page(cursor, limit)
+    write_behind.settle(str(user_id))
+    if TEXT_SEARCH:
+        docs = list(conversations_collection.find(query.filter(user_id), SEARCH_FIELDS)
+                    .sort(SEARCH_SORT).skip(offset).limit(limit + 1))
+    else:
+        docs = ranked(query, conversations_collection.find({'user_id': user_id}, CONVERSATION_FIELDS))[offset:offset + limit + 1]
+    titles = {chat['_id']: chat.get('title') for chat in chats_collection.find(title_query(user_id, docs), {'title': 1})} if docs else {}
+    return page(query, docs, titles, offset, limit)
+
+
+@timed_call("mongo", "search")
+async def asearch_messages(user_id, text: str, cursor: Optional[str] = None, limit=None) -> Dict:
+    from .async_database import chats_collection, conversations_collection
+    query = Query(text)
+    offset, limit = read_page(cursor, limit)
+    await write_behind.asettle(str(user_id))
+    if TEXT_SEARCH:
+        docs = await (conversations_collection.find(query.filter(user_id), SEARCH_FIELDS)
+                      .sort(SEARCH_SORT).skip(offset).limit(limit + 1)).to_list()
+    else:
+        docs = await conversations_collection.find({'user_id': user_id}, CONVERSATION_FIELDS).to_list()
+        docs = ranked(query, docs)[offset:offset + limit + 1]
+    titles = {}
+    if docs:
+        async for chat in chats_collection.find(title_query(user_id, docs), {'title': 1}):
+            titles[chat['_id']] = chat.get('title')
+    return page(query, docs, titles, offset, limit)
+
@@ -0,0 +1,95 @@
+import json
+import asyncio
+import hashlib
+import threading
+from typing import Dict, List
+
+from .metrics import Counter
+
+# Identical calls that overlap in time share one execution: the first caller runs it and
+# everyone arriving before it finishes gets the same result (or the same exception).
+# Nothing is kept once the call completes; repeated answers are the response cache's job.
+coalesced_total = Counter("ngmc_single_flight_coalesced_total", "Calls answered by an identical call already in flight", ["name", "mode"])
+flights_total = Counter("ngmc_single_flight_calls_total", "Calls actually executed by a single-flight group", ["name", "mode"])
+
+
+def flight_key(messages: List[Dict], **params) -> str:
+    # Whitespace and case differences do not change what the model is asked.
+    normalized = [(m["role"], " ".join(str(m["content"]).split()).casefold()) for m in messages]
+    payload = json.dumps({"messages": normalized, "params": params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, _Call] = {}
+        self._tasks: Dict[tuple, asyncio.Task] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn, timeout: float = None):
+        # Thread-based callers. Followers wait at most `timeout` seconds; the leader's own
+        # duration is bounded by whatever `fn` enforces.
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            coalesced_total.inc(name=self.name, mode="thread")
+            if not call.done.wait(timeout):
+                raise TimeoutError(f"{self.name}: no result from the in-flight call after {timeout}s")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        flights_total.inc(name=self.name, mode="thread")
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            # Unregister first so callers arriving from now on start a fresh call.
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    async def ado(self, key: str, coro_fn, timeout: float = None):
+        # asyncio callers. The call runs as its own task, so a caller that times out or is
+        # cancelled (client went away) does not cancel it for the others.
+        loop = asyncio.get_running_loop()
+        task_key = (id(loop), key)
+        task = self._tasks.get(task_key)
+        if task is None:
+            flights_total.inc(name=self.name, mode="asyncio")
+            task = loop.create_task(coro_fn())
+            self._tasks[task_key] = task
+            task.add_done_callback(lambda done: self._finished(task_key, done))
+        else:
+            coalesced_total.inc(name=self.name, mode="asyncio")
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"{self.name}: no result from the in-flight call after {timeout}s") from None
+
+    def _finished(self, task_key, task):
+        if self._tasks.get(task_key) is task:
+            del self._tasks[task_key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved even if every waiter already gave up
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls) + len(self._tasks)
@@ -0,0 +1,20 @@
+import os
+
+# The tests run offline: an in-process MongoDB and the fake LLM. Set before any chatbot
+# module is imported, since they read their settings at import time.
+TEST_ENVIRONMENT = {
+    "MONGODB_BACKEND": "memory",
+    "LLM_BACKEND": "fake",
+    "FAKE_LLM_TTFT": "0.01",
+    "FAKE_LLM_TOKEN_DELAY": "0",
+    "RATE_LIMIT": "0",
+    "DJANGO_SETTINGS_MODULE": "config.settings",
+    "DJANGO_SECRET_KEY": "test-only-key",
+}
+
+for name, value in TEST_ENVIRONMENT.items():
+    os.environ.setdefault(name, value)
+
+import django  # noqa: E402
+
+django.setup()
@@ -0,0 +1,99 @@
+import json
+import time
+import uuid
+from datetime import datetime
+from unittest import mock
+
+from bson import ObjectId
+from django.test import Client, SimpleTestCase
+
+from chatbot import auth
+from chatbot.auth import SESSION_TTL_SECONDS, is_hashed, issue_token, read_token, token_matches
+from chatbot.database import users_collection
+from chatbot.models import User
+
+from .test_views import new_user
+
+APIKEY = "Abkr212@ngmc"
+
+
+class TokenTests(SimpleTestCase):
+    def test_round_trip(self):
+        user, _ = new_user()
+        payload = read_token(issue_token(user))
+        self.assertEqual(payload["uid"], str(user.id))
+        self.assertTrue(token_matches(payload, user))
+
+    def test_expired_and_tampered_tokens(self):
+        user, _ = new_user()
+        token = issue_token(user)
+        later = time.time() + SESSION_TTL_SECONDS + 60
+        with mock.patch("django.core.signing.time.time", return_value=later):
+            self.assertIsNone(read_token(token))
+        self.assertIsNone(read_token(token[:-2] + ("AA" if token[-2:] != "AA" else "BB")))
+
+    def test_password_change_revokes_tokens(self):
+        user, _ = new_user()
+        payload = read_token(issue_token(user))
+        User.set_password(user, "another-pass")
+        self.assertFalse(token_matches(payload, user))
+        self.assertFalse(token_matches(payload, None))
+
+    def test_non_string_tokens(self):
+        for token in (None, 1, ["x"], {"uid": "x"}):
+            with self.subTest(token=token):
+                self.assertIsNone(read_token(token))
+
+
+class AuthRequestTests(SimpleTestCase):
+    def setUp(self):
+        self.client = Client()
+        auth.user_cache.clear()
+        auth.login_cache.clear()
+
+    def post(self, path, body, **headers):
+        return self.client.post(path, json.dumps(body), content_type="application/json", headers=headers)
+
+    def check_auth(self, email, password):
+        return self.post("/checkAuth/", {"apikey": APIKEY, "userName": "Student", "email": email, "password": password})
+
+    def test_token_from_check_auth(self):
+        email = f"{uuid.uuid4().hex}@ngmc.test"
+        token = self.check_auth(email, "secret-pass").json()["token"]
+        response = self.post("/getuserchats/", {}, Authorization=f"Bearer {token}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)["user"]["email"], email)
+        self.assertEqual(self.post("/getuserchats/", {"token": token}).status_code, 200)
+
+    def test_token_rejected_after_password_change(self):
+        user, password = new_user()
+        token = self.check_auth(user.email, password).json()["token"]
+        User.set_password(User.get_by_email(user.email), "another-pass")
+        response = self.post("/getuserchats/", {"token": token})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.post("/getuserchats/", {"email": user.email, "password": password}).status_code, 401)
+        self.assertEqual(self.post("/getuserchats/", {"email": user.email, "password": "another-pass"}).status_code, 200)
+
+    def test_plaintext_password_is_upgraded(self):
+        email = f"{uuid.uuid4().hex}@ngmc.test"
+        _id = ObjectId()
+        users_collection.insert_one({"_id": _id, "userName": "Old", "email": email, "password": "plain-pass",
+                                     "created_at": datetime.now()})
+        self.assertEqual(self.post("/getuserchats/", {"email": email, "password": "wrong"}).status_code, 401)
+        self.assertEqual(self.post("/getuserchats/", {"email": email, "password": "plain-pass"}).status_code, 200)
+        stored = users_collection.find_one({"_id": _id})["password"]
+        self.assertTrue(is_hashed(stored))
+        auth.login_cache.clear()
+        self.assertEqual(self.post("/getuserchats/", {"email": email, "password": "plain-pass"}).status_code, 200)
+
+    def test_non_string_credentials_are_401(self):
+        user, password = new_user()
+        for body in ({"token": 123}, {"token": ["x"]}, {"email": 1, "password": password},
+                     {"email": user.email, "password": ["x"]}, {"email": {"$ne": ""}, "password": {"$ne": ""}}):
+            with self.subTest(body=body):
+                self.assertEqual(self.post("/getuserchats/", body).status_code, 401)
+        # checkAuth: a bad access key or password is a 401, a missing email a 400.
+        for field, status in (("apikey", 401), ("email", 400), ("password", 401)):
+            with self.subTest(field=field):
+                body = {"apikey": APIKEY, "userName": "Student", "email": user.email, "password": password, field: 1}
+                self.assertEqual(self.post("/checkAuth/", body).status_code, status)
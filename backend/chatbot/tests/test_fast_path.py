@@ -0,0 +1,68 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest import mock
+
+from chatbot import fast_path, pdf_index
+from chatbot.fast_path import LinkLookup, fast_answer
+from chatbot.pdf_index import PdfIndex, directory_fetch, ingest_pdfs, read_current
+
+from .test_pdf_index import CATALOGUE, FIXTURES
+
+PG_TIMETABLE = "https://coe.ngmc.ac.in/wp-content/uploads/files/timetable/PG-1TT-F_N-TEST-I-AUGUST-2025.pdf"
+
+
+@unittest.skipIf(pdf_index.PdfReader is None, "pypdf is not installed")
+class PdfGateTests(unittest.TestCase):
+    # The fixture index has the UG 5th semester timetable and the 2018 fee structure; the
+    # PG timetable is in the catalogue but not indexed.
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.TemporaryDirectory()
+        json_path = os.path.join(cls.dir.name, "links.json")
+        index_dir = os.path.join(cls.dir.name, "index")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(CATALOGUE, f)
+        ingest_pdfs(json_path, index_dir, fetch=directory_fetch(FIXTURES))
+        cls.index = PdfIndex(os.path.join(index_dir, read_current(index_dir)))
+        catalogue = dict(CATALOGUE, exam_schedule=dict(CATALOGUE["exam_schedule"], **{"PG-1TT-F_N-TEST-I-AUGUST-2025": PG_TIMETABLE}))
+        cls.lookup = LinkLookup(catalogue)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.dir.cleanup()
+
+    def setUp(self):
+        for patcher in (mock.patch.object(fast_path, "get_link_lookup", lambda: self.lookup),
+                        mock.patch.object(fast_path, "get_pdf_index", lambda: self.index)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_link_lookups_stay_on_the_fast_path(self):
+        for query, key in [("UG 5th sem exam timetable", "UG-5TT-TEST-I-AUGUST-2025"),
+                           ("fee structure", "Fee-Structure-2018-2019"),
+                           ("fee structure 2018", "Fee-Structure-2018-2019")]:
+            with self.subTest(query=query):
+                self.assertTrue(self.index.search(query, 1))
+                parsed = fast_answer(query)
+                self.assertIsNotNone(parsed)
+                self.assertIn(key + ".pdf", parsed["reply"])
+
+    @mock.patch.object(fast_path, "FAST_PATH_MIN_CONFIDENCE", 0.5)
+    def test_content_questions_go_to_the_llm(self):
+        for query in ["fee structure 2018 amount", "UG 5th sem exam dates"]:
+            with self.subTest(query=query):
+                self.assertIsNotNone(self.lookup.resolve(fast_path.Query(query)))
+                self.assertIsNone(fast_answer(query))
+
+    def test_excerpt_from_another_document_goes_to_the_llm(self):
+        query = "PG 1st sem exam timetable august 2025"
+        self.assertEqual(self.index.search(query, 1)[0][2], "UG-5TT-TEST-I-AUGUST-2025")
+        self.assertIsNone(fast_answer(query))
+        # Without an excerpt the link is answered directly.
+        self.assertIn(PG_TIMETABLE, fast_answer("PG 1st sem exam timetable")["reply"])
+
+
+if __name__ == "__main__":
+    unittest.main()
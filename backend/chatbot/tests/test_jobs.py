@@ -0,0 +1,117 @@
+import uuid
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from chatbot import views
+from chatbot.database import db
+from chatbot.jobs import DONE, RUNNING, JobQueue
+from chatbot.models import User
+from chatbot.write_behind import write_behind
+
+
+class WorkerDied(BaseException):
+    # Stands in for a worker process dying mid-turn: nothing in run() handles it.
+    pass
+
+
+class LeaseTests(SimpleTestCase):
+    def setUp(self):
+        self.queue = JobQueue(workers=0)
+        self.user = User.create("Student", f"{uuid.uuid4().hex}@ngmc.test", "secret-pass")
+        self.answers = 0
+        patcher = mock.patch.object(views, "answer_new_chat", self.answer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def answer(self, message):
+        self.answers += 1
+        return {"reply": f"Reply {self.answers}", "title": "Exam Timetable"}
+
+    def submit(self):
+        job, _ = self.queue.submit(self.user.id, "UG 5th sem exam timetable")
+        return job
+
+    def expire_lease(self, job):
+        db.jobs.update_one({"_id": job["_id"]}, {"$set": {"run_at": datetime.now() - timedelta(seconds=1)}})
+
+    def job(self, job):
+        return db.jobs.find_one({"_id": job["_id"]})
+
+    def assert_saved_once(self, job, reply):
+        write_behind.settle_all()
+        messages = list(db.conversations.find({"chat_id": job["chat_id"]}))
+        self.assertEqual(sorted(m["role"] for m in messages), ["AI", "user"])
+        self.assertEqual([m["message"] for m in messages if m["role"] == "AI"], [reply])
+        chat = db.chats.find_one({"_id": job["chat_id"]})
+        self.assertEqual(chat["message_count"], 2)
+        self.assertEqual(len(chat["recent"]), 2)
+        self.assertEqual(self.job(job)["status"], DONE)
+        self.assertEqual(self.job(job)["result"]["reply"], reply)
+
+    def test_expired_attempt_cannot_write_over_the_new_one(self):
+        job = self.submit()
+        first = self.queue.claim("worker-a")
+        self.expire_lease(job)
+        second = self.queue.claim("worker-b")
+        self.assertEqual((first["attempts"], second["attempts"]), (1, 2))
+
+        # The first worker comes back after its lease ran out: its result is not stored,
+        # so it saves nothing and does not finish the job.
+        self.queue.run(first)
+        self.assertEqual(self.job(job)["status"], RUNNING)
+        self.assertNotIn("result", self.job(job))
+        self.assertIsNone(db.chats.find_one({"_id": job["chat_id"]}))
+
+        self.queue.run(second)
+        self.assert_saved_once(job, "Reply 2")
+        # Nor can it touch the finished job afterwards.
+        self.assertFalse(self.queue._update(first, {"status": RUNNING}))
+        self.assertEqual(self.job(job)["status"], DONE)
+
+    def test_rerun_after_a_crash_mid_save(self):
+        job = self.submit()
+        first = self.queue.claim("worker-a")
+        save = views.save_new_chat
+
+        def save_then_die(*args, **kwargs):
+            save(*args, **kwargs)
+            raise WorkerDied()
+
+        with mock.patch.object(views, "save_new_chat", save_then_die):
+            with self.assertRaises(WorkerDied):
+                self.queue.run(first)
+        write_behind.settle_all()
+        self.assertEqual(self.job(job)["status"], RUNNING)
+        self.assertTrue(self.queue.saved(job["chat_id"], self.job(job)["message_ids"][1]))
+
+        self.expire_lease(job)
+        second = self.queue.claim("worker-b")
+        self.queue.run(second)
+        # The stored reply is reused (no second LLM call) and the turn is not saved again.
+        self.assertEqual(self.answers, 1)
+        self.assert_saved_once(job, "Reply 1")
+
+    def test_rerun_after_a_crash_before_the_chat_tail_is_written(self):
+        # The messages landed but the chat's embedded tail did not: saved() is False and
+        # the rerun writes the turn again, which must still count it once.
+        job = self.submit()
+        first = self.queue.claim("worker-a")
+        save = views.save_new_chat
+
+        def save_messages_then_die(user, message, parsed, chat_id=None, message_ids=(None, None)):
+            save(user, message, parsed, chat_id=chat_id, message_ids=message_ids)
+            write_behind.settle_all()
+            db.chats.update_one({"_id": chat_id}, {"$set": {"recent": [], "message_count": 0}})
+            raise WorkerDied()
+
+        with mock.patch.object(views, "save_new_chat", save_messages_then_die):
+            with self.assertRaises(WorkerDied):
+                self.queue.run(first)
+        self.assertFalse(self.queue.saved(job["chat_id"], self.job(job)["message_ids"][1]))
+
+        self.expire_lease(job)
+        self.queue.run(self.queue.claim("worker-b"))
+        self.assertEqual(self.answers, 1)
+        self.assert_saved_once(job, "Reply 1")
@@ -0,0 +1,162 @@
+import asyncio
+import json
+import unittest
+import uuid
+from unittest import mock
+
+from django.test import Client, SimpleTestCase
+
+from chatbot import llm
+from chatbot.database import chats_collection
+from chatbot.llm import LLM_RETRIES, CircuitBreaker, LLMError, StubBackend, retryable
+from chatbot.models import User
+
+MESSAGES = [{"role": "user", "content": "when does the UG 5th sem test start"}]
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FailingBackend(StubBackend):
+    # The fake LLM, failing with `error` on its first `failures` calls.
+    def __init__(self, error, failures=float("inf"), name="fake-model", tier="large"):
+        super().__init__(name, tier, timeout=5)
+        self.error = error
+        self.failures = failures
+        self.attempts = 0
+
+    def _attempt(self):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise self.error
+
+    def complete(self, messages):
+        self._attempt()
+        return super().complete(messages)
+
+    async def acomplete(self, messages):
+        self._attempt()
+        return await super().acomplete(messages)
+
+
+def open_breaker(backend):
+    # Open, with the cooldown already over: the next call is the half-open trial.
+    backend.breaker = CircuitBreaker(failures=1, cooldown=0)
+    backend.breaker.failure()
+
+
+@mock.patch.object(llm, "backoff", lambda attempt: 0)
+class RetryTests(unittest.TestCase):
+    def test_transient_errors_are_retried(self):
+        for error in (ConnectionError("reset"), TimeoutError("slow"), StatusError(429), StatusError(503)):
+            with self.subTest(error=error):
+                backend = FailingBackend(error, failures=1)
+                self.assertIn("canned NGMC answer", llm.complete(MESSAGES, [backend]))
+                self.assertEqual(backend.attempts, 2)
+
+    def test_other_errors_are_not_retried(self):
+        for error in (ValueError("bad request body"), StatusError(400), StatusError(401), KeyError("choices")):
+            with self.subTest(error=error):
+                self.assertFalse(retryable(error))
+                backend = FailingBackend(error)
+                with self.assertRaises(LLMError):
+                    llm.complete(MESSAGES, [backend])
+                self.assertEqual(backend.attempts, 1)
+
+    def test_retries_are_bounded(self):
+        backend = FailingBackend(ConnectionError("reset"))
+        with self.assertRaises(LLMError):
+            llm.complete(MESSAGES, [backend])
+        self.assertEqual(backend.attempts, LLM_RETRIES + 1)
+
+    def test_fake_llm_injected_failures(self):
+        backend = StubBackend("fake-model", "large", timeout=5)
+        backend.fake.failure_rate = 1.0
+        with self.assertRaises(LLMError):
+            llm.complete(MESSAGES, [backend])
+        self.assertEqual(backend.fake.calls, LLM_RETRIES + 1)
+
+
+@mock.patch.object(llm, "backoff", lambda attempt: 0)
+class FallbackTests(unittest.TestCase):
+    def test_route_falls_through_to_the_next_backend(self):
+        small = FailingBackend(ValueError("bad"), name="small-model", tier="small")
+        large = FailingBackend(None, failures=0)
+        self.assertIn("canned NGMC answer", llm.complete(MESSAGES, [small, large]))
+        self.assertEqual((small.attempts, large.attempts), (1, 1))
+
+    def test_open_breaker_is_skipped(self):
+        small = FailingBackend(None, failures=0, name="small-model", tier="small")
+        small.breaker = CircuitBreaker(failures=1, cooldown=60)
+        small.breaker.failure()
+        large = FailingBackend(None, failures=0)
+        llm.complete(MESSAGES, [small, large])
+        self.assertEqual((small.attempts, large.attempts), (0, 1))
+
+    def test_all_backends_failing_is_llm_error(self):
+        with self.assertRaises(LLMError):
+            llm.complete(MESSAGES, [FailingBackend(ValueError("a")), FailingBackend(ConnectionError("b"))])
+
+
+class BreakerTests(unittest.IsolatedAsyncioTestCase):
+    def test_half_open_trial(self):
+        breaker = CircuitBreaker(failures=2, cooldown=0)
+        breaker.failure()
+        self.assertFalse(breaker.is_open)
+        breaker.failure()
+        self.assertTrue(breaker.is_open)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # one trial at a time
+        breaker.failure()
+        self.assertTrue(breaker.allow())
+        breaker.success()
+        self.assertFalse(breaker.is_open)
+
+    def test_abandoned_stream_releases_the_trial(self):
+        backend = StubBackend("fake-model", "large", timeout=5)
+        open_breaker(backend)
+        with mock.patch.object(llm, "route", lambda messages: [backend]):
+            deltas = llm.stream(MESSAGES)
+            next(deltas)
+            self.assertFalse(backend.breaker.allow())  # the trial is in flight
+            deltas.close()  # client disconnected
+        self.assertTrue(backend.breaker.is_open)
+        self.assertTrue(backend.breaker.allow())
+
+    async def test_abandoned_async_calls_release_the_trial(self):
+        backend = StubBackend("fake-model", "large", timeout=5)
+        backend.fake.ttft = 1
+        open_breaker(backend)
+        call = asyncio.ensure_future(llm.acomplete(MESSAGES, [backend]))
+        while not backend.fake.calls:
+            await asyncio.sleep(0.001)
+        call.cancel()  # client disconnected
+        with self.assertRaises(asyncio.CancelledError):
+            await call
+        self.assertTrue(backend.breaker.allow())
+
+        backend.fake.ttft = 0
+        open_breaker(backend)
+        with mock.patch.object(llm, "route", lambda messages: [backend]):
+            deltas = llm.astream(MESSAGES)
+            await deltas.__anext__()
+            await deltas.aclose()
+        self.assertTrue(backend.breaker.allow())
+
+
+class UnavailableTests(SimpleTestCase):
+    def test_llm_error_is_a_503_and_nothing_is_saved(self):
+        email = f"{uuid.uuid4().hex}@ngmc.test"
+        User.create("Student", email, "secret-pass")
+        body = {"email": email, "password": "secret-pass", "message": "Explain why the exam was moved"}
+        with mock.patch.object(llm, "complete", side_effect=LLMError("all LLM backends failed")):
+            response = Client().post("/postchat/", json.dumps(body), content_type="application/json")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(chats_collection.count_documents({"user_id": User.get_by_email(email).id}), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from chatbot import pdf_index
+from chatbot.pdf_index import PdfIndex, chunk_pages, directory_fetch, format_excerpts, ingest_pdfs, read_current
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "pdfs")
+CATALOGUE = {
+    "exam_schedule": {
+        "UG-5TT-TEST-I-AUGUST-2025": "https://coe.ngmc.ac.in/wp-content/uploads/files/timetable/UG-5TT-TEST-I-AUGUST-2025.pdf",
+    },
+    "fee_structure": {
+        "Fee-Structure-2018-2019": "http://ngmc.org/wp-content/uploads/2021/04/Fee-Structure-2018-2019.pdf",
+    },
+    # Not a PDF: skipped.
+    "syllabus": {
+        "BA-Economics": "https://www.ngmc.org/syllabus-list-2/?eeFolder=syllabus/BA-Economics&eeFront=1&eeListID=1&ee=1",
+    },
+}
+
+
+@unittest.skipIf(pdf_index.PdfReader is None, "pypdf is not installed")
+class IngestTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.pdfs = os.path.join(self.dir.name, "pdfs")
+        shutil.copytree(FIXTURES, self.pdfs)
+        self.index_dir = os.path.join(self.dir.name, "index")
+        self.json_path = os.path.join(self.dir.name, "links.json")
+        self.write_catalogue(CATALOGUE)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write_catalogue(self, catalogue):
+        with open(self.json_path, "w", encoding="utf-8") as f:
+            json.dump(catalogue, f)
+
+    def ingest(self, **kwargs):
+        return ingest_pdfs(self.json_path, self.index_dir, fetch=directory_fetch(self.pdfs), **kwargs)
+
+    def index(self):
+        return PdfIndex(os.path.join(self.index_dir, read_current(self.index_dir)))
+
+    def test_ingest_and_search(self):
+        summary = self.ingest()
+        self.assertEqual(summary["added"], 2)
+        self.assertEqual(summary["generation"], read_current(self.index_dir))
+        index = self.index()
+        self.assertEqual(sorted(key for _, key, _ in index.docs), ["Fee-Structure-2018-2019", "UG-5TT-TEST-I-AUGUST-2025"])
+
+        score, category, key, url, page, text = index.search("when is the UG 5th sem Tamil exam")[0]
+        self.assertEqual((category, key, page), ("exam_schedule", "UG-5TT-TEST-I-AUGUST-2025", 1))
+        self.assertIn("27.08.2025 AN B.A Tamil Modern Tamil Literature", text)
+        self.assertTrue(url.endswith("UG-5TT-TEST-I-AUGUST-2025.pdf"))
+
+        _, _, key, _, page, text = index.search("are hall tickets required")[0]
+        self.assertEqual((key, page), ("UG-5TT-TEST-I-AUGUST-2025", 2))
+        self.assertEqual(index.search("computer science tuition fee")[0][2], "Fee-Structure-2018-2019")
+        self.assertEqual(index.search("hostel canteen menu"), [])
+
+    def test_unchanged_pdfs_keep_the_generation(self):
+        first = self.ingest()["generation"]
+        summary = self.ingest()
+        self.assertEqual(summary["unchanged"], 2)
+        self.assertEqual(summary["generation"], first)
+
+    def test_changed_pdf_publishes_a_new_generation(self):
+        first = self.ingest()["generation"]
+        shutil.copy(os.path.join(FIXTURES, "Fee-Structure-2018-2019.pdf"),
+                    os.path.join(self.pdfs, "UG-5TT-TEST-I-AUGUST-2025.pdf"))
+        summary = self.ingest()
+        self.assertEqual(summary["changed"], 1)
+        self.assertNotEqual(summary["generation"], first)
+        self.assertEqual(self.index().search("modern tamil literature"), [])
+
+    def test_removed_and_missing_pdfs(self):
+        self.ingest()
+        catalogue = dict(CATALOGUE, fee_structure={})
+        catalogue["exam_schedule"] = dict(CATALOGUE["exam_schedule"], Missing="https://coe.ngmc.ac.in/files/Missing.pdf")
+        self.write_catalogue(catalogue)
+        summary = self.ingest()
+        self.assertEqual((summary["removed"], summary["failed"]), (1, 1))
+        self.assertEqual([key for _, key, _ in self.index().docs], ["UG-5TT-TEST-I-AUGUST-2025"])
+
+    def test_ingest_fails_loudly_without_pypdf(self):
+        with mock.patch.object(pdf_index, "PdfReader", None):
+            with self.assertRaises(RuntimeError):
+                self.ingest()
+        self.assertIsNone(read_current(self.index_dir))
+
+
+class ChunkTests(unittest.TestCase):
+    def test_chunks_cut_at_lines_with_overlap(self):
+        lines = [f"row {i} alpha beta gamma" for i in range(10)]
+        chunks = list(chunk_pages(["\n".join(lines), "second page"], words=10, overlap=1))
+        self.assertEqual(chunks[0], (1, "row 0 alpha beta gamma\nrow 1 alpha beta gamma"))
+        self.assertTrue(chunks[1][1].startswith("row 1 alpha"))
+        self.assertEqual(chunks[-1], (2, "second page"))
+        self.assertTrue(all(page == 1 for page, _ in chunks[:-1]))
+
+    def test_excerpts_are_capped(self):
+        results = [(3.0, "exam_schedule", "A", "https://x/a.pdf", 1, "a" * 50),
+                   (2.0, "exam_schedule", "B", "https://x/b.pdf", 2, "b" * 50)]
+        text = format_excerpts(results, max_chars=70)
+        self.assertIn("[A, page 1] https://x/a.pdf", text)
+        self.assertTrue(text.endswith("https://x/b.pdf\n" + "b" * 20))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import threading
+import time
+import unittest
+import uuid
+from unittest import mock
+
+from django.test import Client, RequestFactory, SimpleTestCase
+
+from chatbot import rate_limit, utils
+from chatbot.models import User
+from chatbot.rate_limit import Admission, MemoryBuckets, RateLimited, client_ip, gcra
+
+
+class GcraTests(unittest.TestCase):
+    def test_burst_then_refill(self):
+        # 60 a minute: one token a second, 5 at once.
+        now, tat = 1000.0, 1000.0
+        for _ in range(5):
+            allowed, tat, retry_after = gcra(tat, now, 60, 5)
+            self.assertEqual((allowed, retry_after), (True, 0.0))
+        allowed, tat_after, retry_after = gcra(tat, now, 60, 5)
+        self.assertFalse(allowed)
+        self.assertEqual(tat_after, tat)  # a rejected request costs nothing
+        self.assertAlmostEqual(retry_after, 1.0)
+        self.assertTrue(gcra(tat, now + 1.0, 60, 5)[0])
+        self.assertFalse(gcra(tat, now + 0.5, 60, 5)[0])
+
+    def test_idle_bucket_refills_to_the_burst_only(self):
+        now, tat = 1000.0, 1000.0
+        for _ in range(5):
+            tat = gcra(tat, now, 60, 5)[1]
+        results = []
+        for _ in range(6):
+            allowed, tat, _ = gcra(tat, now + 3600, 60, 5)
+            results.append(allowed)
+        self.assertEqual(results, [True] * 5 + [False])
+
+    def test_memory_buckets_are_per_key(self):
+        buckets = MemoryBuckets()
+        self.assertEqual([buckets.take("user:a", 60, 2)[0] for _ in range(3)], [True, True, False])
+        self.assertTrue(buckets.take("user:b", 60, 2)[0])
+
+    def test_retry_after_is_whole_seconds(self):
+        self.assertEqual(RateLimited("user", 0.2).retry_after, 1)
+        self.assertEqual(RateLimited("user", 2.1).retry_after, 3)
+
+
+class AdmissionTests(unittest.TestCase):
+    def test_queue_full_is_rejected_at_once(self):
+        admission = Admission("test", limit=1, queue=1, timeout=5)
+        held = admission.acquire()
+        waiter = threading.Thread(target=lambda: admission.release(admission.acquire()))
+        waiter.start()
+        while admission.state()["waiting"] < 1:
+            time.sleep(0.001)
+        started = time.monotonic()
+        with self.assertRaises(RateLimited) as caught:
+            admission.acquire()
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(caught.exception.scope, "test")
+        self.assertGreaterEqual(caught.exception.retry_after, 1)
+        admission.release(held)
+        waiter.join(5)
+        self.assertEqual(admission.state(), {"active": 0, "waiting": 0})
+
+    def test_waiter_times_out(self):
+        admission = Admission("test", limit=1, queue=1, timeout=0.01)
+        held = admission.acquire()
+        with self.assertRaises(RateLimited):
+            admission.acquire()
+        self.assertEqual(admission.state(), {"active": 1, "waiting": 0})
+        admission.release(held)
+        self.assertEqual(admission.state(), {"active": 0, "waiting": 0})
+
+    def test_slot_handed_to_a_waiter_that_is_timing_out(self):
+        admission = Admission("test", limit=1, queue=1, timeout=0.01)
+        held = admission.acquire()
+
+        class LateWaiter(rate_limit._Waiter):
+            # The holder releases just as the wait times out.
+            def __init__(self, loop=None):
+                super().__init__(loop)
+                self.event = mock.Mock(wait=self.wait)
+
+            def wait(self, timeout):
+                admission.release(held)
+                return False
+
+        with mock.patch.object(rate_limit, "_Waiter", LateWaiter):
+            started = admission.acquire()
+        # The waiter owns the slot it was handed, so it must not be counted twice or lost.
+        self.assertEqual(admission.state(), {"active": 1, "waiting": 0})
+        admission.release(started)
+        self.assertEqual(admission.state(), {"active": 0, "waiting": 0})
+
+    def test_abandon(self):
+        admission = Admission("test", limit=1, queue=2, timeout=5)
+        held = admission.acquire()
+        first, second = admission._enter(), admission._enter()
+        admission.release(held)
+        self.assertTrue(admission._abandon(first))  # granted: it owns the slot now
+        self.assertFalse(admission._abandon(second))  # still queued: just leaves
+        self.assertEqual(admission.state(), {"active": 1, "waiting": 0})
+
+
+class AsyncAdmissionTests(unittest.IsolatedAsyncioTestCase):
+    async def test_cancelled_waiter_leaves_the_queue(self):
+        admission = Admission("test", limit=1, queue=1, timeout=5)
+        held = await admission.aacquire()
+        waiting = asyncio.ensure_future(admission.aacquire())
+        await asyncio.sleep(0.01)
+        self.assertEqual(admission.state()["waiting"], 1)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        admission.release(held)
+        self.assertEqual(admission.state(), {"active": 0, "waiting": 0})
+
+
+class ClientIpTests(SimpleTestCase):
+    def test_forwarded_header_is_ignored_with_one_warning(self):
+        request = RequestFactory().post("/postchat/", REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR="203.0.113.7")
+        with mock.patch.object(rate_limit, "_forwarded_warned", False):
+            with self.assertLogs("chatbot.rate_limit", "WARNING") as logs:
+                self.assertEqual(client_ip(request), "10.0.0.1")
+                self.assertEqual(client_ip(request), "10.0.0.1")
+        self.assertEqual(len(logs.records), 1)
+        with mock.patch.object(rate_limit, "RATE_LIMIT_TRUST_FORWARDED", True):
+            self.assertEqual(client_ip(request), "203.0.113.7")
+
+
+class RetryAfterTests(SimpleTestCase):
+    def test_full_llm_queue_is_a_429_with_retry_after(self):
+        email = f"{uuid.uuid4().hex}@ngmc.test"
+        User.create("Student", email, "secret-pass")
+        slots = Admission("llm", limit=1, queue=0, timeout=5)
+        held = slots.acquire()
+        body = {"email": email, "password": "secret-pass", "message": f"Explain why exams moved {uuid.uuid4().hex}"}
+        with mock.patch.object(utils, "llm_slots", slots):
+            response = Client().post("/postchat/", json.dumps(body), content_type="application/json")
+        slots.release(held)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response["Retry-After"]), 1)
+        self.assertEqual(response.json()["retryAfter"], int(response["Retry-After"]))
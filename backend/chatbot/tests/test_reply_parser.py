@@ -0,0 +1,102 @@
+import json
+import random
+import unittest
+
+from chatbot.reply_parser import DEFAULT_TITLE, ReplyParser, parse_reply
+
+REPLY = "Here is the **UG Sem 5 Exam Timetable**:\n- https://coe.ngmc.ac.in/UG-5TT.pdf \"quoted\" é 😀"
+DOC = json.dumps({"reply": REPLY, "title": "Exam Timetable"})
+
+
+def chunked(text, rng):
+    # (reply text streamed by feed()/close(), result()) for text fed in random chunks.
+    parser, out, i = ReplyParser(), [], 0
+    while i < len(text):
+        step = rng.choice((1, 1, 2, 3, 7, 16, 64))
+        out.append(parser.feed(text[i:i + step]))
+        i += step
+    out.append(parser.close())
+    return "".join(out), parser.result()
+
+
+def random_text(rng):
+    alphabet = '{}[]":,\\ nu0aé😀`\n'
+    return "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 80)))
+
+
+def random_string(rng):
+    pool = ['a', ' ', '"', '\\', '\n', '{', '}', 'é', '😀', ' ', '\x01', 'reply', 'title']
+    return "".join(rng.choice(pool) for _ in range(rng.randint(0, 12)))
+
+
+class ReplyParserTests(unittest.TestCase):
+    expected = {"reply": REPLY, "title": "Exam Timetable"}
+
+    def test_json_mode(self):
+        for text in (DOC, json.dumps({"title": "Exam Timetable", "reply": REPLY}, ensure_ascii=False),
+                     json.dumps({"reply": REPLY, "title": "Exam Timetable"}, indent=2)):
+            with self.subTest(text=text[:20]):
+                self.assertEqual(parse_reply(text), self.expected)
+                self.assertEqual(chunked(text, random.Random(0)), (REPLY, self.expected))
+
+    def test_code_fences_and_prose(self):
+        for text in (f"```json\n{DOC}\n```", f"```\n{DOC}```",
+                     f"Sure! {DOC}\nLet me know if you need anything else {{really}}.",
+                     f"```json\n{DOC}\n```\nHope this helps."):
+            with self.subTest(text=text):
+                self.assertEqual(parse_reply(text), self.expected)
+                self.assertEqual(chunked(text, random.Random(1)), (REPLY, self.expected))
+
+    def test_reply_only(self):
+        text = json.dumps({"reply": REPLY})
+        self.assertEqual(parse_reply(text), {"reply": REPLY, "title": DEFAULT_TITLE})
+        self.assertEqual(parse_reply('{"reply": "x", "title": "  "}')["title"], DEFAULT_TITLE)
+
+    def test_not_an_object_is_the_reply(self):
+        for text in ("The exam starts on 27.08.2025.", "[1, 2]", '"just a string"', "null",
+                     '{"answer": "no reply key"}', "```\nplain text\n```"):
+            with self.subTest(text=text):
+                reply = parse_reply(text)["reply"]
+                self.assertEqual(reply, text.strip("`\n") if text.startswith("```") else text)
+                self.assertEqual(chunked(text, random.Random(2))[0], reply)
+
+    def test_partial_prefixes(self):
+        # Output cut off anywhere: never raises, and once the reply field has started the
+        # streamed reply is a prefix of the full one (REPLY has no backslash: anything from
+        # one on is the raw text of an escape cut in half).
+        start = DOC.index(json.dumps(REPLY)[:2]) + 1
+        for end in range(len(DOC) + 1):
+            prefix = DOC[:end]
+            with self.subTest(end=end):
+                streamed, result = chunked(prefix, random.Random(end))
+                self.assertEqual(parse_reply(prefix), result)
+                if end > start:
+                    self.assertTrue(REPLY.startswith(streamed.split("\\")[0]), streamed)
+                    self.assertEqual(result["reply"], streamed)
+
+    def test_random_valid_and_invalid_outputs(self):
+        rng = random.Random(7)
+        for n in range(2000):
+            reply, title = random_string(rng) + "x", random_string(rng)
+            doc = {"reply": reply, "title": title}
+            if rng.random() < 0.3:
+                doc["extra"] = {"reply": "nested", "list": [1, "}", {"a": "{"}]}
+            items = list(doc.items())
+            rng.shuffle(items)
+            text = json.dumps(dict(items), ensure_ascii=rng.random() < 0.5)
+            if rng.random() < 0.3:
+                text = f"```json\n{text}\n```"
+            if rng.random() < 0.3:
+                text = "Here you go: " + text + "\nHope this helps {really}."
+            expected = {"reply": reply, "title": title.strip() or DEFAULT_TITLE}
+            self.assertEqual(chunked(text, rng), (reply, expected), (n, text))
+            self.assertEqual(parse_reply(text), expected, (n, text))
+
+            garbage = random_text(rng)
+            streamed, result = chunked(garbage, rng)
+            self.assertEqual(result, parse_reply(garbage), (n, garbage))
+            self.assertEqual(streamed, result["reply"], (n, garbage))
+
+
+if __name__ == "__main__":
+    unittest.main()
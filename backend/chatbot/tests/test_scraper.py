@@ -0,0 +1,128 @@
+import os
+import json
+import tempfile
+import unittest
+
+from chatbot.scraper import (
+    SOURCES, parse_open_links, parse_pdf_links, parse_syllabus_links, scrape_links,
+)
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "scraper")
+PAGES = {url: category for category, url, _, _ in SOURCES}
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+
+class ParserTests(unittest.TestCase):
+    def test_pdf_links(self):
+        links = parse_pdf_links(fixture("exam_schedule.html"), "https://coe.ngmc.ac.in")
+        self.assertEqual(links, {
+            "PG-1TT-F_N-TEST-I-AUGUST-2025": "https://coe.ngmc.ac.in/wp-content/uploads/files/timetable/PG-1TT-F_N-TEST-I-AUGUST-2025.pdf",
+            "UG-5TT-TEST-I-AUGUST-2025": "https://coe.ngmc.ac.in/wp-content/uploads/files/timetable/UG-5TT-TEST-I-AUGUST-2025.pdf",
+            "B_A-TAMIL-TEST-I-AUGUST-2025": "https://coe.ngmc.ac.in/wp-content/uploads/files/timetable/B_A-TAMIL-TEST-I-AUGUST-2025.PDF",
+        })
+
+    def test_pdf_links_keep_absolute_urls(self):
+        links = parse_pdf_links(fixture("fee_structure.html"), "https://www.ngmc.org")
+        self.assertEqual(links["AIDED-FEES-STRUCTURE-2017-2018"], "http://ngmc.org/wp-content/uploads/2018/06/AIDED-FEES-STRUCTURE-2017-2018.pdf")
+        self.assertEqual(links["Fee-Structure-2018-2019"], "https://www.ngmc.org/wp-content/uploads/2021/04/Fee-Structure-2018-2019.pdf")
+
+    def test_open_links(self):
+        links = parse_open_links(fixture("seating_arrangements.html"), "https://coe.ngmc.ac.in")
+        self.assertEqual(sorted(links), ["AIDED-TEST-I-SEATING-ARRANGEMENT-23_08_2025-AN", "SF-TEST-I-SEATING-ARRANGEMENT-23_08_2025-FN"])
+        self.assertTrue(all(url.startswith("https://coe.ngmc.ac.in/") for url in links.values()))
+
+    def test_syllabus_links_are_named_by_the_nearest_heading(self):
+        links = parse_syllabus_links(fixture("syllabus.html"), "https://www.ngmc.org")
+        self.assertEqual(links, {
+            "BA-Economics": "https://www.ngmc.org/syllabus-list-2/?eeFolder=syllabus/BA-Economics&eeFront=1&eeListID=1&ee=1",
+            "BSc-Computer-Science": "https://www.ngmc.org/syllabus-list-2/?eeFolder=syllabus/BSc-Computer-Science&eeFront=1&eeListID=1&ee=1",
+            "MCom": "https://www.ngmc.org/syllabus-list-2/?eeFolder=syllabus/MCom&eeFront=1&eeListID=1&ee=1",
+        })
+
+    def test_page_without_links(self):
+        html = fixture("redesigned.html")
+        self.assertEqual(parse_pdf_links(html, "https://coe.ngmc.ac.in"), {})
+        self.assertEqual(parse_open_links(html, "https://coe.ngmc.ac.in"), {})
+
+
+class ScrapeLinksTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.json_path = os.path.join(self.dir.name, "links.json")
+        self.state_path = os.path.join(self.dir.name, "state.json")
+        self.pages = {category: fixture(f"{category}.html") for category in PAGES.values()}
+        self.requests = []
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def fetch(self, url, validators):
+        # Recorded pages served like a conditional GET: 304 (None) when the ETag matches.
+        category = PAGES[url]
+        self.requests.append((category, dict(validators)))
+        etag = f'"{category}-{len(self.pages[category])}"'
+        if validators.get("etag") == etag:
+            return None, validators
+        return self.pages[category], {"etag": etag, "last_modified": None}
+
+    def scrape(self):
+        return scrape_links(self.json_path, None, self.state_path, fetch=self.fetch)
+
+    def read(self, path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def test_first_scrape_writes_every_category(self):
+        links, changes = self.scrape()
+        self.assertEqual({category: len(entries) for category, entries in links.items()},
+                         {"exam_schedule": 3, "fee_structure": 2, "seating_arrangements": 2, "syllabus": 3})
+        self.assertEqual(self.read(self.json_path), links)
+        self.assertEqual(set(changes), set(PAGES.values()))
+
+    def test_unchanged_pages_are_not_rewritten(self):
+        self.scrape()
+        mtime = os.stat(self.json_path).st_mtime_ns
+        links, changes = self.scrape()
+        self.assertEqual(changes, {})
+        self.assertEqual(os.stat(self.json_path).st_mtime_ns, mtime)
+        self.assertEqual(links["exam_schedule"], self.read(self.json_path)["exam_schedule"])
+
+    def test_validators_dropped_when_category_is_missing(self):
+        self.scrape()
+        catalogue = self.read(self.json_path)
+        del catalogue["syllabus"]
+        with open(self.json_path, "w", encoding="utf-8") as f:
+            json.dump(catalogue, f)
+        self.requests.clear()
+        links, changes = self.scrape()
+        self.assertIn(("syllabus", {}), self.requests)
+        self.assertEqual(len(links["syllabus"]), 3)
+        self.assertEqual(changes["syllabus"]["removed"], [])
+
+    def test_empty_page_keeps_known_links(self):
+        first, _ = self.scrape()
+        self.pages["exam_schedule"] = fixture("redesigned.html")
+        links, changes = self.scrape()
+        self.assertEqual(links["exam_schedule"], first["exam_schedule"])
+        self.assertNotIn("exam_schedule", changes)
+        # The new page's validators are not kept, so the next scrape fetches it in full.
+        self.assertNotEqual(self.read(self.state_path)["exam_schedule"]["etag"],
+                            f'"exam_schedule-{len(self.pages["exam_schedule"])}"')
+
+    def test_failed_fetch_keeps_known_links(self):
+        first, _ = self.scrape()
+
+        def failing(url, validators):
+            raise ConnectionError("offline")
+
+        links, changes = scrape_links(self.json_path, None, self.state_path, fetch=failing)
+        self.assertEqual(links, first)
+        self.assertEqual(changes, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import json
+import uuid
+
+from django.test import AsyncClient, Client, SimpleTestCase, override_settings
+
+from chatbot import views
+from chatbot.write_behind import write_behind
+
+from .test_views import new_user
+
+
+class ScopeTests(SimpleTestCase):
+    # Two users whose chats interleave by _id and share every search word: paging either
+    # endpoint, with any cursor, must only ever return the caller's own chats.
+    def setUp(self):
+        self.client = Client()
+        self.word = uuid.uuid4().hex[:12]
+        (self.alice, self.alice_password), (self.bob, self.bob_password) = new_user(), new_user()
+        self.chats = {self.alice.id: set(), self.bob.id: set()}
+        for i in range(4):
+            for user in (self.alice, self.bob):
+                message = f"{self.word} exam timetable question {i}"
+                parsed = {"reply": f"{self.word} timetable answer {i}", "title": f"{user.email} {i}"}
+                self.chats[user.id].add(str(views.save_new_chat(user, message, parsed).id))
+        write_behind.settle_all()
+
+    def credentials(self, user):
+        return {"email": user.email, "password": self.alice_password if user is self.alice else self.bob_password}
+
+    def post(self, path, user, **body):
+        response = self.client.post(path, json.dumps({**self.credentials(user), **body}), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def history(self, user, cursor=None):
+        seen, pages = [], 0
+        while True:
+            page = self.post("/getuserchats/history/", user, cursor=cursor, limit=1)
+            seen += [chat["id"] for chat in page["chats"]]
+            cursor, pages = page["nextCursor"], pages + 1
+            if cursor is None or pages > 10:
+                return seen
+
+    def search(self, user, cursor=None):
+        seen, pages = [], 0
+        while True:
+            page = self.post("/getuserchats/search/", user, query=self.word, cursor=cursor, limit=1)
+            seen += [result["chatId"] for result in page["results"]]
+            cursor, pages = page["nextCursor"], pages + 1
+            if cursor is None or pages > 20:
+                return seen
+
+    def test_history_pages(self):
+        for user in (self.alice, self.bob):
+            with self.subTest(user=user.email):
+                self.assertEqual(set(self.history(user)), self.chats[user.id])
+
+    def test_history_with_the_other_users_cursor(self):
+        # A cursor cut from Bob's newest chat still pages through Alice's chats only.
+        cursor = max(self.chats[self.bob.id])
+        seen = self.history(self.alice, cursor)
+        self.assertTrue(seen)
+        self.assertLessEqual(set(seen), self.chats[self.alice.id])
+        for summary in (True, False):
+            page = self.post("/getuserchats/history/", self.alice, cursor=cursor, limit=10, summary=summary)
+            self.assertLessEqual({chat["id"] for chat in page["chats"]}, self.chats[self.alice.id])
+
+    def test_search_pages(self):
+        for user in (self.alice, self.bob):
+            with self.subTest(user=user.email):
+                seen = self.search(user)
+                self.assertEqual(len(seen), 8)  # both messages of each of the user's chats
+                self.assertEqual(set(seen), self.chats[user.id])
+
+    def test_search_with_a_cursor_past_the_callers_results(self):
+        page = self.post("/getuserchats/search/", self.alice, query=self.word, cursor="8", limit=10)
+        self.assertEqual(page, {"results": [], "nextCursor": None})
+
+
+@override_settings(ROOT_URLCONF="config.asgi_urls")
+class AsyncScopeTests(ScopeTests):
+    async def test_async_views(self):
+        client = AsyncClient()
+        cursor = max(self.chats[self.bob.id])
+        for path, body, key, field in (("/getuserchats/history/", {"cursor": cursor, "limit": 10}, "chats", "id"),
+                                       ("/getuserchats/search/", {"query": self.word, "limit": 50}, "results", "chatId")):
+            with self.subTest(path=path):
+                response = await client.post(path, {**self.credentials(self.alice), **body}, content_type="application/json")
+                self.assertEqual(response.status_code, 200)
+                seen = {item[field] for item in response.json()[key]}
+                self.assertTrue(seen)
+                self.assertLessEqual(seen, self.chats[self.alice.id])
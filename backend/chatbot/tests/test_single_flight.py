@@ -0,0 +1,142 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from chatbot.single_flight import SingleFlight, coalesced_total, flight_key
+
+
+class ThreadTests(unittest.TestCase):
+    def setUp(self):
+        # A name per test, so coalesced_total counts this test's followers only.
+        self.flight = SingleFlight(self.id())
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.calls = 0
+        self.results = []
+
+    def slow(self, result=None, error=None):
+        def fn():
+            self.calls += 1
+            self.started.set()
+            self.release.wait(5)
+            if error is not None:
+                raise error
+            return result
+        return fn
+
+    def call(self, fn, timeout=None):
+        try:
+            self.results.append(self.flight.do("key", fn, timeout))
+        except BaseException as e:
+            self.results.append(e)
+
+    def run_flight(self, fn, followers):
+        # The leader runs fn; the followers join while it is running.
+        threads = [threading.Thread(target=self.call, args=(fn,))]
+        threads[0].start()
+        self.started.wait(5)
+        threads += [threading.Thread(target=self.call, args=(fn,)) for _ in range(followers)]
+        for thread in threads[1:]:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while coalesced_total.value(name=self.flight.name, mode="thread") < followers and time.monotonic() < deadline:
+            time.sleep(0.001)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+
+    def test_followers_get_the_leaders_result(self):
+        self.run_flight(self.slow(result={"reply": "hi"}), 4)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.results, [{"reply": "hi"}] * 5)
+        self.assertTrue(all(r is self.results[0] for r in self.results))
+        self.assertEqual(self.flight.in_flight(), 0)
+
+    def test_errors_reach_every_waiter(self):
+        error = ConnectionError("upstream down")
+        self.run_flight(self.slow(error=error), 3)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(len(self.results), 4)
+        self.assertTrue(all(r is error for r in self.results))
+        # Nothing is kept: the next call runs again.
+        self.assertEqual(self.flight.do("key", lambda: "fresh"), "fresh")
+
+    def test_follower_timeout(self):
+        leader = threading.Thread(target=self.call, args=(self.slow(result="late"),))
+        leader.start()
+        self.started.wait(5)
+        with self.assertRaises(TimeoutError):
+            self.flight.do("key", lambda: "not run", timeout=0.05)
+        self.release.set()
+        leader.join(5)
+        self.assertEqual((self.calls, self.results), (1, ["late"]))
+
+    def test_flight_key_ignores_whitespace_and_case(self):
+        a = flight_key([{"role": "user", "content": "UG  5th sem\nTimetable"}], model="m")
+        self.assertEqual(a, flight_key([{"role": "user", "content": "ug 5th sem timetable"}], model="m"))
+        self.assertNotEqual(a, flight_key([{"role": "user", "content": "ug 5th sem timetable"}], model="n"))
+
+
+class AsyncTests(unittest.IsolatedAsyncioTestCase):
+    async def test_followers_share_one_call(self):
+        flight = SingleFlight("test")
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "reply"
+
+        results = await asyncio.gather(*(flight.ado("key", fn) for _ in range(5)))
+        self.assertEqual(results, ["reply"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.in_flight(), 0)
+
+    async def test_errors_reach_every_waiter(self):
+        flight = SingleFlight("test")
+
+        async def fn():
+            await asyncio.sleep(0.01)
+            raise ConnectionError("upstream down")
+
+        results = await asyncio.gather(*(flight.ado("key", fn) for _ in range(3)), return_exceptions=True)
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(isinstance(r, ConnectionError) for r in results))
+
+    async def test_cancelled_leader_does_not_cancel_the_call(self):
+        flight = SingleFlight("test")
+        finished = asyncio.Event()
+
+        async def fn():
+            await asyncio.sleep(0.05)
+            finished.set()
+            return "reply"
+
+        leader = asyncio.ensure_future(flight.ado("key", fn))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.ado("key", fn))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+        self.assertEqual(await follower, "reply")
+        self.assertTrue(finished.is_set())
+
+    async def test_follower_timeout(self):
+        flight = SingleFlight("test")
+
+        async def fn():
+            await asyncio.sleep(0.2)
+            return "reply"
+
+        leader = asyncio.ensure_future(flight.ado("key", fn))
+        await asyncio.sleep(0)
+        with self.assertRaises(TimeoutError):
+            await flight.ado("key", fn, timeout=0.01)
+        # The call keeps running for the callers still waiting.
+        self.assertEqual(await leader, "reply")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import json
+import uuid
+
+from django.test import AsyncClient, Client, SimpleTestCase, override_settings
+
+from chatbot.models import User
+
+
+def new_user(password="secret-pass"):
+    email = f"{uuid.uuid4().hex}@ngmc.test"
+    return User.create("Student", email, password), password
+
+
+class RequestValidationTests(SimpleTestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user, self.password = new_user()
+
+    def post(self, path, body):
+        data = body if isinstance(body, str) else json.dumps(body)
+        return self.client.post(path, data, content_type="application/json")
+
+    def test_body_must_be_a_json_object(self):
+        for body in ("[]", '"text"', "1", "null", "{"):
+            with self.subTest(body=body):
+                for path in ("/postchat/", "/getuserchats/", "/checkAuth/"):
+                    response = self.post(path, body)
+                    self.assertEqual(response.status_code, 400, path)
+                    self.assertEqual(response.json(), {"error": "Invalid JSON"})
+
+    def test_message_must_be_a_string(self):
+        for message in (None, 1, ["hi"], {"text": "hi"}, "   "):
+            with self.subTest(message=message):
+                response = self.post("/postchat/", {"email": self.user.email, "password": self.password, "message": message})
+                self.assertEqual(response.status_code, 400)
+
+
+@override_settings(ROOT_URLCONF="config.asgi_urls")
+class AsyncRequestValidationTests(SimpleTestCase):
+    async def test_body_and_message(self):
+        client = AsyncClient()
+        user, password = new_user()
+        for body in ("[]", '"text"'):
+            response = await client.post("/postchat/", body, content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+        for message in (None, 1, ["hi"]):
+            response = await client.post("/postchat/", {"email": user.email, "password": password, "message": message},
+                                         content_type="application/json")
+            self.assertEqual(response.status_code, 400)
@@ -0,0 +1,108 @@
+import unittest
+from unittest import mock
+
+from bson import ObjectId
+
+from chatbot import models
+from chatbot.database import db
+from chatbot.models import Chat, Conversation
+from chatbot.write_behind import WriteBehind
+
+
+class FlakyCollection:
+    def __init__(self, database, collection):
+        self.database = database
+        self.collection = collection
+
+    def bulk_write(self, requests, ordered=True):
+        self.database.calls += 1
+        if self.database.calls not in self.database.fail_calls:
+            return self.collection.bulk_write(requests, ordered=ordered)
+        if self.database.applied:
+            # The server applied the writes but the reply was lost.
+            self.collection.bulk_write(requests, ordered=ordered)
+        raise ConnectionError("connection reset")
+
+
+class FlakyDatabase:
+    # Fails the bulk_writes to chats with the given (1-based) numbers.
+    def __init__(self, *fail_calls, applied=False):
+        self.fail_calls = set(fail_calls)
+        self.applied = applied
+        self.calls = 0
+
+    def __getitem__(self, name):
+        return FlakyCollection(self, db[name]) if name == "chats" else db[name]
+
+
+class RetryTests(unittest.TestCase):
+    def queue(self, database):
+        queue = WriteBehind(database, enabled=True)
+        # No background thread: the test flushes by hand.
+        for patcher in (mock.patch.object(queue, "_start"), mock.patch.object(models, "write_behind", queue)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return queue
+
+    def first_turn(self):
+        user_id = ObjectId()
+        chat = Chat.create("Exams", user_id)
+        turn = [Conversation(chat.id, "user", "hi"), Conversation(chat.id, "assistant", "hello")]
+        Conversation.bulk_create(turn, user_id)
+        chat.push_recent(turn)
+        return chat, turn
+
+    def assert_saved_once(self, chat, turn):
+        doc = db.chats.find_one({"_id": chat.id})
+        self.assertEqual(doc["message_count"], 2)
+        self.assertEqual([entry["_id"] for entry in doc["recent"]], [conv.id for conv in turn])
+        self.assertEqual(db.conversations.count_documents({"chat_id": chat.id}), 2)
+
+    def test_retry_after_a_failed_flush_counts_the_turn_once(self):
+        for applied in (False, True):
+            with self.subTest(applied=applied):
+                queue = self.queue(FlakyDatabase(1, applied=applied))
+                chat, turn = self.first_turn()
+                self.assertFalse(queue.flush())
+                self.assertTrue(queue.flush())
+                self.assert_saved_once(chat, turn)
+                self.assertFalse(queue.is_pending(str(chat.id)))
+
+    def test_update_after_a_replayed_insert_lands(self):
+        queue = self.queue(FlakyDatabase(1, applied=True))
+        chat, turn = self.first_turn()
+        self.assertFalse(queue.flush())
+        chat.title = "renamed"
+        chat.save()
+        self.assertTrue(queue.flush())
+        self.assert_saved_once(chat, turn)
+        self.assertEqual(db.chats.find_one({"_id": chat.id})["title"], "renamed")
+
+    def test_committed_insert_is_not_replayed_when_other_updates_fail(self):
+        # Second flush: the new chat (with its first turn folded in) is inserted, then the
+        # update to the older chat fails.
+        queue = self.queue(FlakyDatabase(3))
+        other = Chat.create("Fees", ObjectId())
+        self.assertTrue(queue.flush())
+        chat, turn = self.first_turn()
+        other.title = "Fee structure"
+        other.save()
+        self.assertFalse(queue.flush())
+        self.assertEqual([(op[1], op[2]) for op in queue._ops], [("update", other.id)])
+        chat.title = "renamed"
+        chat.save()
+        self.assertTrue(queue.flush())
+        self.assert_saved_once(chat, turn)
+        self.assertEqual(db.chats.find_one({"_id": chat.id})["title"], "renamed")
+        self.assertEqual(db.chats.find_one({"_id": other.id})["title"], "Fee structure")
+
+    def test_insert_of_an_existing_document_keeps_its_updates(self):
+        # A job run again re-creates its chat: the insert is a duplicate, and the turn
+        # folded into it is written as an update instead.
+        queue = self.queue(FlakyDatabase())
+        chat, turn = self.first_turn()
+        queue.flush()
+        db.chats.update_one({"_id": chat.id}, {"$set": {"recent": [], "message_count": 0}})
+        Chat.create("Exams", chat.user_id, _id=chat.id).push_recent(turn)
+        self.assertTrue(queue.flush())
+        self.assert_saved_once(chat, turn)
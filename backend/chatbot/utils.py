@@ -1,13 +1,28 @@
 import os
 import json
-import re
-from typing import Dict, List, Optional
-from openai import OpenAI
-import requests
-from bs4 import BeautifulSoup
-from .models import Conversation
-
-client = OpenAI(api_key=os.environ.get("CHAT_GPT_API"))
+import time
+import asyncio
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+from django.http import JsonResponse
+from . import llm
+from .llm import LLMError
+from .single_flight import SingleFlight, flight_key
+from .reply_parser import parse_reply
+from .rate_limit import llm_slots
+from .metrics import timed, timed_call, observe_stage, count_error
+from .auth import (
+    request_token, read_token, token_matches, verify_password, is_hashed,
+    user_cache, remember_user, remember_login, cached_login
+)
+
+# Identical prompts already on their way to the model wait for that call instead of
+# issuing their own (LLM_COALESCE=0 disables). Waiters give up after LLM_COALESCE_TIMEOUT.
+LLM_COALESCE = os.environ.get("LLM_COALESCE", "1") != "0"
+LLM_COALESCE_TIMEOUT = float(os.environ.get("LLM_COALESCE_TIMEOUT", "120"))
+llm_flight = SingleFlight("llm")
+
+# Returned with a 503 when no LLM backend answered; never saved as a reply.
+LLM_ERROR_REPLY = "I'm sorry, I'm having trouble processing your request right now. Please try again later."
 
 ALLOWED_ORIGINS = [
     "https://ngmchatbot.vercel.app",
@@ -24,100 +39,77 @@ def add_cors_headers(request, response):
     response["Access-Control-Allow-Credentials"] = "true"
     return response
 
-def webScrabedData():
-    current_dir=os.path.dirname(os.path.abspath(__file__))
-    files=["staff.txt","links.txt"]
-    contents=""
-    for filename in files:
-        filepath=os.path.join(current_dir,filename)
-        if os.path.isfile(filepath):
-            with open(filepath,"r",errors="ignore") as f:
-                contents+=f.read()+"\n"
-        else:
-            contents+=f"[{filename} not found]\n"
-    return contents.strip()
-
-def get_last_5_conversations_as_string():
-    conversations = Conversation.all()[:5]
-    conversations = reversed(conversations)
-
-    result=[]
-    for conv in conversations:
-        result.append(f"[{conv.role}] {conv.message}")
-    return "\n".join(result)
-
-ENHANCED_SYSTEM_PROMPT = """
-You are an intelligent AI assistant for Nallamuthu Gounder Mahalingam College (NGMC), Pollachi.
-Provide accurate, helpful, and engaging information about the college.
-Official site: https://www.ngmc.org
- 
-Always be helpful, accurate, and maintain a professional yet friendly tone.
-
-Dont repeat the same answer if asked multiple times.
- 
-Use the following web-scraped data for reference:
-""" + webScrabedData() + """ 
-and the last 5 conversations for context:
-""" + get_last_5_conversations_as_string() + """
-You may get 2 types of queries:
-1. General queries about NGMC college, courses, admissions, facilities, etc.
-for this you need to answer in a conversational manner.
-2. Specific queries about exam schedules, fee structures, seating arrangements, syllabus, etc.
-for this you need to  answer with simple and direct answers with relevant links from the provided data.
-
-for new line user \n use it.
-for bold text use **text**.
-
-ALWAYS output in JSON format with two keys: "reply" and "title". 
-
-LIMITS:
-- "reply" should be concise, ideally under 500 words.
-- "title" should be a brief summary of the reply, ideally under 4 words.
-""" 
-
 def call_chatgpt(messages: List[Dict]) -> str:
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=messages,
-            max_tokens=1200,
-            temperature=0.7
-        )
-        reply = response.choices[0].message.content.strip()
-
-        usage = response.usage
-        usd_prompt = (usage.prompt_tokens / 1000) * 0.03
-        usd_completion = (usage.completion_tokens / 1000) * 0.06
-        total_usd = usd_prompt + usd_completion
-        rupees = round(total_usd * 84, 2)
-
-        print(
-            f"[LOG] Tokens used → prompt={usage.prompt_tokens}, "
-            f"completion={usage.completion_tokens}, total={usage.total_tokens}, "
-            f"cost≈₹{rupees}"
-        )
-
-        return reply
-    except Exception as e:
-        print(f"OpenAI API Error: {e}")
-        return "I'm sorry, I'm having trouble processing your request right now. Please try again later."
+    # Raises LLMError when every backend on the route failed.
+    # Raises RateLimited when no upstream slot frees up in time.
+    backends = llm.route(messages)
+
+    def upstream():
+        with llm_slots.slot():
+            return llm.complete(messages, backends)
+
+    with timed("llm", "complete"):
+        if not LLM_COALESCE:
+            return upstream()
+        key = flight_key(messages, **llm.route_key(backends))
+        try:
+            return llm_flight.do(key, upstream, LLM_COALESCE_TIMEOUT)
+        except TimeoutError as e:
+            raise LLMError(str(e)) from e
 
-def extract_json_from_response(resp: str) -> Dict:
+def stream_chatgpt(messages: List[Dict]) -> Iterator[str]:
+    started = time.perf_counter()
+    first_token = False
     try:
-        parsed = json.loads(resp)
-        if parsed.get('reply') and parsed.get('title'):
-            return parsed
-    except json.JSONDecodeError:
-        pass
-    
-    match = re.search(r'\{[\s\S]*"reply"[\s\S]*"title"[\s\S]*\}', resp)
-    if match:
+        with llm_slots.slot():
+            for delta in llm.stream(messages):
+                if not first_token:
+                    first_token = True
+                    observe_stage("llm", "first_token", time.perf_counter() - started)
+                yield delta
+    except LLMError as e:
+        count_error("llm")
+        print(f"LLM error: {e}")
+        raise
+    finally:
+        observe_stage("llm", "stream", time.perf_counter() - started)
+
+async def acall_chatgpt(messages: List[Dict]) -> str:
+    backends = llm.route(messages)
+
+    async def upstream():
+        async with llm_slots.aslot():
+            return await llm.acomplete(messages, backends)
+
+    with timed("llm", "complete"):
+        if not LLM_COALESCE:
+            return await upstream()
+        key = flight_key(messages, **llm.route_key(backends))
         try:
-            return json.loads(match.group(0))
-        except json.JSONDecodeError:
-            pass
-    
-    return {"reply": resp, "title": "NGMC Query Response"}
+            return await llm_flight.ado(key, upstream, LLM_COALESCE_TIMEOUT)
+        except TimeoutError as e:
+            raise LLMError(str(e)) from e
+
+async def astream_chatgpt(messages: List[Dict]) -> AsyncIterator[str]:
+    started = time.perf_counter()
+    first_token = False
+    try:
+        async with llm_slots.aslot():
+            async for delta in llm.astream(messages):
+                if not first_token:
+                    first_token = True
+                    observe_stage("llm", "first_token", time.perf_counter() - started)
+                yield delta
+    except LLMError as e:
+        count_error("llm")
+        print(f"LLM error: {e}")
+        raise
+    finally:
+        observe_stage("llm", "stream", time.perf_counter() - started)
+
+@timed_call("parse")
+def extract_json_from_response(resp: str) -> Dict:
+    return parse_reply(resp)
 
 def validate_message(msg: str) -> Optional[str]:
     if not msg: 
@@ -139,102 +131,104 @@ def validate_user_data(userName: str, email: str, password: str = None) -> Optio
         return "Invalid email format"
     return None
 
+def parse_json_body(request) -> Dict:
+    # Parsed once per request; the auth middleware and the view share the result. A body
+    # that is not an object ([], "text", 1) is invalid JSON here, so callers can use .get().
+    if not hasattr(request, "_json_body"):
+        body = json.loads(request.body)
+        if not isinstance(body, dict):
+            raise json.JSONDecodeError("Expected a JSON object", request.body.decode("utf-8", "replace"), 0)
+        request._json_body = body
+    return request._json_body
+
+def body_str(body, name):
+    # '' for a missing or non-string field, so bad input is a 400/401 rather than a 500.
+    value = body.get(name)
+    return value.strip() if isinstance(value, str) else ''
+
+def _auth_error(message):
+    return JsonResponse({"error": message}, status=401), None
+
+@timed_call("auth")
 def user_auth_middleware(request):
     try:
-        body = json.loads(request.body)
+        body = parse_json_body(request)
     except json.JSONDecodeError:
         return JsonResponse({"error":"Invalid JSON"}, status=400), None
     
-    email = body.get('email','').strip()
-    password = body.get('password','').strip()
+    from .models import User
+    
+    token = request_token(request, body)
+    if token:
+        payload = read_token(token)
+        if not payload:
+            return _auth_error("Invalid or expired session")
+        user = user_cache.get(payload["uid"])
+        if user is None:
+            user = User.get(payload["uid"])
+            if user:
+                remember_user(user)
+        if not token_matches(payload, user):
+            return _auth_error("Invalid or expired session")
+        return None, user
+    
+    email = body_str(body, 'email')
+    password = body_str(body, 'password')
     
     if not email or not password:
-        return JsonResponse({"error":"Email and password are required"}, status=401), None
+        return _auth_error("Email and password are required")
     
-    from .models import User
-    user = User.get_by_email_password(email, password)
-    if not user:
-        return JsonResponse({"error":"Invalid credentials"}, status=401), None
+    user = cached_login(email, password)
+    if user:
+        return None, user
+    
+    user = User.get_by_email(email)
+    if not user or not verify_password(password, user.password):
+        return _auth_error("Invalid credentials")
+    if not is_hashed(user.password):
+        User.set_password(user, password)
+    remember_login(user, password)
     
     return None, user
 
-def scrape_links():
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
-    }
-
-    all_links = {}
-
-    url = "https://coe.ngmc.ac.in/exam-schedule/"
-    response = requests.get(url, headers=headers)
-    soup = BeautifulSoup(response.text, "html.parser")
-    exam_links = {}
-    for a_tag in soup.find_all("a"):
-        href = a_tag.get("href")
-        if href and href.lower().endswith(".pdf"):
-            if href.startswith("/"):
-                href = f"https://coe.ngmc.ac.in{href}"
-            file_name = os.path.basename(href)
-            key_name = os.path.splitext(file_name)[0]
-            exam_links[key_name] = href
-    all_links["exam_schedule"] = exam_links
-
-    url = "https://www.ngmc.org/admissions/fee-structure/"
-    response = requests.get(url, headers=headers)
-    soup = BeautifulSoup(response.text, "html.parser")
-    fee_links = {}
-    for a_tag in soup.find_all("a"):
-        href = a_tag.get("href")
-        if href and href.lower().endswith(".pdf"):
-            if href.startswith("/"):
-                href = f"https://www.ngmc.org{href}"
-            file_name = os.path.basename(href)
-            key_name = os.path.splitext(file_name)[0]
-            fee_links[key_name] = href
-    all_links["fee_structure"] = fee_links
-
-    url = "https://coe.ngmc.ac.in/seating-arrangements/"
-    response = requests.get(url, headers=headers)
-    soup = BeautifulSoup(response.text, "html.parser")
-    seating_links = {}
-    for a_tag in soup.find_all("a"):
-        if "open" in a_tag.text.lower():
-            link = a_tag.get("href")
-            if link:
-                if link.startswith("/"):
-                    link = f"https://coe.ngmc.ac.in{link}"
-                file_name = os.path.basename(link)
-                key_name = os.path.splitext(file_name)[0]
-                seating_links[key_name] = link
-    all_links["seating_arrangements"] = seating_links
-
-    url = "https://www.ngmc.org/syllabus-list-2/"
-    response = requests.get(url, headers=headers)
-    soup = BeautifulSoup(response.text, "html.parser")
-    syllabus_links = {}
-    for a_tag in soup.find_all("a"):
-        if "open" in a_tag.text.lower():
-            link = a_tag.get("href")
-            if link:
-                name_tag = a_tag.find_previous(lambda tag: tag.name in ["h3", "h4", "span", "strong"] and tag.text.strip())
-                name = name_tag.text.strip() if name_tag else f"link_{len(syllabus_links)+1}"
-                if link.startswith("/"):
-                    link = f"https://www.ngmc.org{link}"
-                syllabus_links[name] = link
-    all_links["syllabus"] = syllabus_links
-
-    with open("ngmc_college_links.json", "w", encoding="utf-8") as f:
-        json.dump(all_links, f, indent=4, ensure_ascii=False)
-
-    print(f"Saved data: Exam({len(exam_links)}), Fees({len(fee_links)}), Seating({len(seating_links)}), Syllabus({len(syllabus_links)}) → ngmc_college_links.json")
-
-    return all_links
-
-def clean_json_to_txt(json_file:str, txt_file:str):
-    with open(json_file,"r",encoding="utf-8") as f:
-        content=f.read()
-    for ch in ['[',']','"','{','}',',']:
-        content=content.replace(ch,'')
-    with open(txt_file,"w",encoding="utf-8") as f:
-        f.write(content.strip())
-    print(f"Cleaned content saved to {txt_file}")
+@timed_call("auth")
+async def auser_auth_middleware(request):
+    try:
+        body = parse_json_body(request)
+    except json.JSONDecodeError:
+        return JsonResponse({"error":"Invalid JSON"}, status=400), None
+    
+    from .async_models import User
+    
+    token = request_token(request, body)
+    if token:
+        payload = read_token(token)
+        if not payload:
+            return _auth_error("Invalid or expired session")
+        user = user_cache.get(payload["uid"])
+        if user is None:
+            user = await User.get(payload["uid"])
+            if user:
+                remember_user(user)
+        if not token_matches(payload, user):
+            return _auth_error("Invalid or expired session")
+        return None, user
+    
+    email = body_str(body, 'email')
+    password = body_str(body, 'password')
+    
+    if not email or not password:
+        return _auth_error("Email and password are required")
+    
+    user = cached_login(email, password)
+    if user:
+        return None, user
+    
+    user = await User.get_by_email(email)
+    if not user or not await asyncio.to_thread(verify_password, password, user.password):
+        return _auth_error("Invalid credentials")
+    if not is_hashed(user.password):
+        await User.set_password(user, password)
+    remember_login(user, password)
+    
+    return None, user
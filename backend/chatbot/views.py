@@ -1,14 +1,35 @@
 import json
-from django.http import JsonResponse, HttpResponse
+from bson import ObjectId
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from .models import User, Chat, Conversation
 from .utils import (
     add_cors_headers, validate_message, validate_user_data, 
-    user_auth_middleware, call_chatgpt, extract_json_from_response,
-    ENHANCED_SYSTEM_PROMPT
+    user_auth_middleware, call_chatgpt, stream_chatgpt, extract_json_from_response,
+    LLM_ERROR_REPLY, parse_json_body, body_str
 )
+from .llm import LLMError
+from .rate_limit import RATE_LIMITED_REPLY, RateLimited, check_rate
+from .auth import issue_token, verify_password, is_hashed, remember_login, SESSION_TTL_SECONDS
+from .prompt import NEW_CHAT_FORMAT, CONTINUE_CHAT_FORMAT, assemble, build_prompt
+from .context import build_context
+from .response_cache import response_cache
+from .reply_parser import ReplyParser
+from .fast_path import fast_answer
+from .search import SearchError, search_messages
+from .jobs import IDEMPOTENCY_KEY_MAX_CHARS, JobConflict, job_queue, job_view
+from .metrics import instrument, bind_endpoint, render as render_metrics
+from .database import mongo
+from .export import (
+    EXPORT_FORMATS, json_bytes, serialize_conversation, serialize_chat,
+    export_pieces, buffered, gzipped, export_filename
+)
+
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 50
 
 @csrf_exempt
+@instrument("checkAuth")
 def checkAuth(request):
     if request.method == "OPTIONS":
         resp = HttpResponse(status=204)
@@ -18,14 +39,14 @@ def checkAuth(request):
         return JsonResponse({"error":"POST required"}, status=405)
     
     try:
-        body = json.loads(request.body)
+        body = parse_json_body(request)
     except json.JSONDecodeError:
         return JsonResponse({"error":"Invalid JSON"}, status=400)
     
-    apikey = body.get('apikey','').strip()
-    userName = body.get('userName','').strip()
-    password = body.get('password','').strip()
-    email = body.get('email','').strip()
+    apikey = body_str(body, 'apikey')
+    userName = body_str(body, 'userName')
+    password = body_str(body, 'password')
+    email = body_str(body, 'email')
     
     if apikey != "Abkr212@ngmc":
         return JsonResponse({"error":"Invalid access key"}, status=401)
@@ -37,49 +58,137 @@ def checkAuth(request):
     try:
         existing_user = User.get_by_email(email)
         if existing_user:
-            resp = JsonResponse({"status": "success", "message": "User already exists"})
+            if not verify_password(password, existing_user.password):
+                return add_cors_headers(request, JsonResponse({"error":"Invalid credentials"}, status=401))
+            if not is_hashed(existing_user.password):
+                User.set_password(existing_user, password)
+            user, message = existing_user, "User already exists"
         else:
-            User.create(userName, email, password)
-            resp = JsonResponse({"status": "success", "message": "User created successfully"})
+            user = User.create(userName, email, password)
+            message = "User created successfully"
+        remember_login(user, password)
+        resp = JsonResponse({
+            "status": "success",
+            "message": message,
+            "userId": str(user.id),
+            "token": issue_token(user),
+            "expiresIn": SESSION_TTL_SECONDS
+        })
         return add_cors_headers(request, resp)
     except Exception as e:
         print(f"User creation error: {e}")
         return JsonResponse({"error": "Failed to create/get user"}, status=500)
 
-@csrf_exempt
-def post_chat(request):
+def read_chat_request(request):
+    # Shared preamble of the chat endpoints: method, auth and message checks.
     if request.method == "OPTIONS":
         resp = HttpResponse(status=204)
-        return add_cors_headers(request, resp)
+        return add_cors_headers(request, resp), None, None
     
     if request.method != 'POST': 
-        return JsonResponse({"error":"POST required"}, status=405)
-    
-    auth_error, user = user_auth_middleware(request)
-    if auth_error:
-        return add_cors_headers(request, auth_error)
+        return JsonResponse({"error":"POST required"}, status=405), None, None
     
     try:
-        body = json.loads(request.body)
-    except json.JSONDecodeError:
-        return JsonResponse({"error":"Invalid JSON"}, status=400)
+        check_rate(request)
+        auth_error, user = user_auth_middleware(request)
+        if auth_error:
+            return add_cors_headers(request, auth_error), None, None
+        check_rate(request, user)
+    except RateLimited as e:
+        return too_many_requests(request, e), None, None
+    
+    body = parse_json_body(request)
     
-    user_message = body.get('message','').strip()
+    user_message = body_str(body, 'message')
     
     err = validate_message(user_message)
     if err: 
-        return JsonResponse({"error": err}, status=400)
+        return JsonResponse({"error": err}, status=400), None, None
+    
+    return None, user, user_message
+
+def load_user_chat(chat_id, user):
+    try: 
+        chat = Chat.get(chat_id)
+        if not chat:
+            return JsonResponse({"error":"Chat not found"}, status=404), None
+    except Exception: 
+        return JsonResponse({"error":"Chat not found"}, status=404), None
+    
+    if chat.user_id and str(chat.user_id) != str(user.id):
+        return JsonResponse({"error": "Unauthorized to access this chat"}, status=403), None
+    
+    if not chat.user_id:
+        chat.user_id = user.id
+        chat.save()
     
-    prompt = f"{ENHANCED_SYSTEM_PROMPT}\nUser Query: {user_message}\nOutput JSON with reply and title only"
-    messages = [{"role":"system","content":prompt},{"role":"user","content":user_message}]
-    gpt_resp = call_chatgpt(messages)
-    parsed = extract_json_from_response(gpt_resp)
+    return None, chat
+
+def new_chat_messages(user_message):
+    return assemble(build_prompt(user_message, NEW_CHAT_FORMAT), user_message)
+
+def continue_chat_messages(chat, user_message):
+    return build_context(chat, build_prompt(user_message, CONTINUE_CHAT_FORMAT), user_message)
+
+def answer_new_chat(user_message):
+    # Raises LLMError or RateLimited; nothing is cached then.
+    parsed = fast_answer(user_message) or response_cache.get(user_message)
+    if parsed is None:
+        gpt_resp = call_chatgpt(new_chat_messages(user_message))
+        parsed = extract_json_from_response(gpt_resp)
+        response_cache.set(user_message, parsed)
+    return parsed
+
+def answer_turn(chat, user_message):
+    # No fast path: a follow-up is read in the context of the conversation.
+    gpt_resp = call_chatgpt(continue_chat_messages(chat, user_message))
+    return extract_json_from_response(gpt_resp)
+
+# chat_id and message_ids are given by chatbot.jobs, which allocates them ahead so that a
+# rerun of a turn writes the same documents.
+def save_new_chat(user, user_message, parsed, chat_id=None, message_ids=(None, None)):
+    chat = Chat.create(title=parsed['title'], user_id=user.id, _id=chat_id)
+    conversations = [
+        Conversation(chat.id, 'user', user_message, message_ids[0]),
+        Conversation(chat.id, 'AI', parsed['reply'], message_ids[1])
+    ]
+    Conversation.bulk_create(conversations, user_id=user.id)
+    chat.push_recent(conversations)
+    return chat
+
+def save_turn(chat, user_message, parsed, message_ids=(None, None)):
+    chat.save()
+    conversations = [
+        Conversation(chat.id, 'user', user_message, message_ids[0]),
+        Conversation(chat.id, 'AI', parsed['reply'], message_ids[1])
+    ]
+    Conversation.bulk_create(conversations, user_id=chat.user_id)
+    chat.push_recent(conversations)
+
+def too_many_requests(request, error):
+    resp = JsonResponse({"error": RATE_LIMITED_REPLY, "retryAfter": error.retry_after}, status=429)
+    resp["Retry-After"] = str(error.retry_after)
+    resp["Access-Control-Expose-Headers"] = "Retry-After"
+    return add_cors_headers(request, resp)
+
+def llm_unavailable(request):
+    # Nothing is saved or cached: the client can simply send the message again.
+    return add_cors_headers(request, JsonResponse({"error": LLM_ERROR_REPLY}, status=503))
+
+@csrf_exempt
+@instrument("post_chat")
+def post_chat(request):
+    error, user, user_message = read_chat_request(request)
+    if error:
+        return error
     
-    chat = Chat.create(title=parsed['title'], user_id=user.id)
-    Conversation.bulk_create([
-        Conversation(chat.id, 'user', user_message),
-        Conversation(chat.id, 'AI', parsed['reply'])
-    ])
+    try:
+        parsed = answer_new_chat(user_message)
+    except LLMError:
+        return llm_unavailable(request)
+    except RateLimited as e:
+        return too_many_requests(request, e)
+    chat = save_new_chat(user, user_message, parsed)
     
     resp = JsonResponse({
         "chatId": str(chat.id),
@@ -90,7 +199,77 @@ def post_chat(request):
     return add_cors_headers(request, resp)
 
 @csrf_exempt
+@instrument("continue_chat")
 def continue_chat(request, chat_id):
+    error, user, user_message = read_chat_request(request)
+    if error:
+        return error
+    
+    error, chat = load_user_chat(chat_id, user)
+    if error:
+        return error
+    
+    try:
+        parsed = answer_turn(chat, user_message)
+    except LLMError:
+        return llm_unavailable(request)
+    except RateLimited as e:
+        return too_many_requests(request, e)
+    save_turn(chat, user_message, parsed)
+    
+    resp = JsonResponse({
+        "chatId": str(chat.id),
+        "reply": parsed['reply'],
+        "userId": str(user.id)
+    })
+    return add_cors_headers(request, resp)
+
+def read_idempotency_key(request):
+    # Idempotency-Key header, or "idempotencyKey" in the body; optional.
+    key = request.META.get("HTTP_IDEMPOTENCY_KEY") or parse_json_body(request).get('idempotencyKey')
+    if key is None:
+        return None, None
+    if not isinstance(key, str) or not key.strip() or len(key) > IDEMPOTENCY_KEY_MAX_CHARS:
+        return JsonResponse({"error": "Invalid idempotency key"}, status=400), None
+    return None, key.strip()
+
+def read_wait(request):
+    try:
+        return None, float(parse_json_body(request).get('wait', 0))
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "Invalid wait"}, status=400), None
+
+def job_response(request, job, created=False):
+    # 202 for a new job; 200 when an idempotency key matched an earlier submission.
+    return add_cors_headers(request, JsonResponse(job_view(job), status=202 if created else 200))
+
+@csrf_exempt
+@instrument("submit_chat_job")
+def submit_chat_job(request, chat_id=None):
+    error, user, user_message = read_chat_request(request)
+    if error:
+        return error
+    
+    if chat_id is not None:
+        error, chat = load_user_chat(chat_id, user)
+        if error:
+            return error
+        chat_id = chat.id
+    
+    error, key = read_idempotency_key(request)
+    if error:
+        return add_cors_headers(request, error)
+    
+    try:
+        job, created = job_queue.submit(user.id, user_message, chat_id, key)
+    except JobConflict as e:
+        return add_cors_headers(request, JsonResponse({"error": str(e)}, status=409))
+    job_queue.start()
+    return job_response(request, job, created)
+
+@csrf_exempt
+@instrument("get_chat_job")
+def get_chat_job(request, job_id):
     if request.method == "OPTIONS":
         resp = HttpResponse(status=204)
         return add_cors_headers(request, resp)
@@ -102,55 +281,156 @@ def continue_chat(request, chat_id):
     if auth_error:
         return add_cors_headers(request, auth_error)
     
-    try:
-        body = json.loads(request.body)
-    except json.JSONDecodeError:
-        return JsonResponse({"error":"Invalid JSON"}, status=400)
-    
-    user_message = body.get('message','').strip()
-    
-    err = validate_message(user_message)
-    if err: 
-        return JsonResponse({"error": err}, status=400)
+    error, wait = read_wait(request)
+    if error:
+        return add_cors_headers(request, error)
     
-    try: 
-        chat = Chat.get(chat_id)
-        if not chat:
-            return JsonResponse({"error":"Chat not found"}, status=404)
-    except Exception: 
-        return JsonResponse({"error":"Chat not found"}, status=404)
-    
-    if chat.user_id and str(chat.user_id) != str(user.id):
-        return JsonResponse({"error": "Unauthorized to access this chat"}, status=403)
-    
-    if not chat.user_id:
-        chat.user_id = user.id
-        chat.save()
-    
-    last_msgs = Conversation.filter_by_chat_last_n(chat, 10)
-    conv_history = [{"role":"assistant" if c.role=="AI" else "user","content":c.message} for c in last_msgs][::-1]
-    conv_history.append({"role":"user","content":user_message})
+    job_queue.start()
+    job = job_queue.wait(job_id, user.id, wait)
+    if job is None:
+        return add_cors_headers(request, JsonResponse({"error": "Job not found"}, status=404))
+    return job_response(request, job)
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_turn(messages, finish, cache_key=None):
+    # The reply text goes out as the model writes it (the JSON around it is parsed away);
+    # the turn is saved once the stream ends.
+    parser = ReplyParser()
+    try:
+        for delta in stream_chatgpt(messages):
+            text = parser.feed(delta)
+            if text:
+                yield sse_event("token", {"delta": text})
+    except LLMError:
+        yield sse_event("error", {"error": LLM_ERROR_REPLY})
+        return
+    except RateLimited as e:
+        yield sse_event("error", {"error": RATE_LIMITED_REPLY, "retryAfter": e.retry_after})
+        return
+    
+    text = parser.close()
+    if text:
+        yield sse_event("token", {"delta": text})
+    parsed = parser.result()
+    if cache_key is not None:
+        response_cache.set(cache_key, parsed)
+    yield sse_event("done", finish(parsed))
+
+def cached_turn(parsed, finish):
+    yield sse_event("token", {"delta": parsed['reply']})
+    yield sse_event("done", finish(parsed))
+
+def sse_response(request, events):
+    resp = StreamingHttpResponse(bind_endpoint(events), content_type="text/event-stream")
+    resp["Cache-Control"] = "no-cache"
+    resp["X-Accel-Buffering"] = "no"
+    return add_cors_headers(request, resp)
+
+@csrf_exempt
+@instrument("post_chat_stream")
+def post_chat_stream(request):
+    error, user, user_message = read_chat_request(request)
+    if error:
+        return error
+    
+    def finish(parsed):
+        chat = save_new_chat(user, user_message, parsed)
+        return {
+            "chatId": str(chat.id),
+            "reply": parsed['reply'],
+            "title": parsed['title'],
+            "userId": str(user.id)
+        }
     
-    prompt = f"{ENHANCED_SYSTEM_PROMPT}\nUser Query: {user_message}\nOutput JSON with reply only"
-    messages = [{"role":"system","content":prompt}] + conv_history
-    gpt_resp = call_chatgpt(messages)
-    parsed = extract_json_from_response(gpt_resp)
-     
-    chat.save()
-    Conversation.bulk_create([
-        Conversation(chat.id, 'user', user_message),
-        Conversation(chat.id, 'AI', parsed['reply'])
-    ])
+    parsed = fast_answer(user_message) or response_cache.get(user_message)
+    if parsed is not None:
+        return sse_response(request, cached_turn(parsed, finish))
+    return sse_response(request, stream_turn(new_chat_messages(user_message), finish, cache_key=user_message))
+
+@csrf_exempt
+@instrument("continue_chat_stream")
+def continue_chat_stream(request, chat_id):
+    error, user, user_message = read_chat_request(request)
+    if error:
+        return error
+    
+    error, chat = load_user_chat(chat_id, user)
+    if error:
+        return error
+    
+    def finish(parsed):
+        save_turn(chat, user_message, parsed)
+        return {
+            "chatId": str(chat.id),
+            "reply": parsed['reply'],
+            "userId": str(user.id)
+        }
     
-    resp = JsonResponse({
-        "chatId": str(chat.id),
-        "reply": parsed['reply'],
-        "userId": str(user.id)
-    })
-    return add_cors_headers(request, resp)
+    return sse_response(request, stream_turn(continue_chat_messages(chat, user_message), finish))
+
+@csrf_exempt
+@instrument("cache_stats")
+def cache_stats(request):
+    if request.method != 'GET': 
+        return JsonResponse({"error":"GET required"}, status=405)
+    return JsonResponse(response_cache.stats())
+
+def metrics(request):
+    if request.method != 'GET': 
+        return JsonResponse({"error":"GET required"}, status=405)
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Liveness: the process is up and serving; never touches Mongo, so a database outage
+# does not get every worker restarted.
+def healthz(request):
+    if request.method != 'GET': 
+        return JsonResponse({"error":"GET required"}, status=405)
+    return JsonResponse({"status": "ok"})
+
+def readiness(ping_ms=None, error=None):
+    if error is not None:
+        return JsonResponse({"status": "unavailable", "mongo": {"ok": False, "error": type(error).__name__}}, status=503)
+    return JsonResponse({"status": "ready", "mongo": {"ok": True, "pingMs": round(ping_ms, 1)}})
+
+# Readiness: Mongo answers a ping within MONGODB_HEALTH_TIMEOUT; 503 otherwise.
+def readyz(request):
+    if request.method != 'GET': 
+        return JsonResponse({"error":"GET required"}, status=405)
+    try:
+        return readiness(mongo.ping())
+    except Exception as e:
+        print(f"Readiness check failed: {e}")
+        return readiness(error=e)
 
+def chat_list_pieces(pairs):
+    # Each chat is encoded as soon as its chunk is loaded, so the full list never exists
+    # as Conversation objects and dicts at the same time.
+    pieces = [b"["]
+    for chat, conversations in pairs:
+        if len(pieces) > 1:
+            pieces.append(b", ")
+        pieces.append(json_bytes(serialize_chat(chat, conversations)))
+    pieces.append(b"]")
+    return pieces
+
+def json_object(fields):
+    # Same output as JsonResponse(fields); list values are already-encoded byte pieces.
+    pieces = [b"{"]
+    for key, value in fields.items():
+        if len(pieces) > 1:
+            pieces.append(b", ")
+        pieces += [json_bytes(key), b": "]
+        pieces += value if isinstance(value, list) else [json_bytes(value)]
+    pieces.append(b"}")
+    return pieces
+
+def json_pieces_response(pieces):
+    return HttpResponse(b"".join(pieces), content_type="application/json")
 
 @csrf_exempt
+@instrument("get_chats")
 def get_chats(request):
     if request.method == "OPTIONS":
         resp = HttpResponse(status=204)
@@ -160,35 +440,15 @@ def get_chats(request):
         return JsonResponse({"error":"GET required"}, status=405)
     
     try:
-        all_chats = Chat.get_all()
-        chats_data = []
-        
-        for chat in all_chats:
-            conversations = Conversation.filter_by_chat(chat)
-            chat_data = {
-                'id': str(chat.id),
-                'title': chat.title,
-                'user_id': str(chat.user_id) if chat.user_id else None,
-                'created_at': chat.created_at.isoformat(),
-                'conversations': [
-                    {
-                        'id': str(conv.id),
-                        'role': conv.role,
-                        'message': conv.message,
-                        'created_at': conv.created_at.isoformat()
-                    }
-                    for conv in conversations
-                ]
-            }
-            chats_data.append(chat_data)
-        
-        resp = JsonResponse(chats_data, safe=False)
+        pairs = Conversation.iter_by_chats(Chat.iter_all())
+        resp = json_pieces_response(chat_list_pieces(pairs))
         return add_cors_headers(request, resp)
     except Exception as e:
         print(f"Error fetching chats: {e}")
         return JsonResponse({"error": "Failed to fetch chats"}, status=500)
     
 @csrf_exempt
+@instrument("get_user_chats")
 def get_user_chats(request):
     if request.method == "OPTIONS":
         resp = HttpResponse(status=204)
@@ -201,35 +461,123 @@ def get_user_chats(request):
     if auth_error:
         return add_cors_headers(request, auth_error)
     
-    user_chats = Chat.filter_by_user(user.id)
-    chats_data = []
-    
-    for chat in user_chats:
-        conversations = Conversation.filter_by_chat(chat)
-        
-        chat_data = {
-            'id': str(chat.id),
-            'title': chat.title,
-            'user_id': str(chat.user_id),
-            'created_at': chat.created_at.isoformat(),
-            'conversations': [
-                {
-                    'id': str(conv.id),
-                    'role': conv.role,
-                    'message': conv.message,
-                    'created_at': conv.created_at.isoformat()
-                }
-                for conv in conversations
-            ]
-        }
-        chats_data.append(chat_data)
-    
-    resp = JsonResponse({
+    pairs = Conversation.iter_by_chats(Chat.iter_by_user(user.id))
+    resp = json_pieces_response(json_object({
         "user": {
             "id": str(user.id),
             "userName": user.userName,
             "email": user.email
         },
-        "chats": chats_data
-    }, safe=False)
+        "chats": chat_list_pieces(pairs)
+    }))
     return add_cors_headers(request, resp)
+
+@csrf_exempt
+@instrument("get_user_chat_history")
+def get_user_chat_history(request):
+    if request.method == "OPTIONS":
+        resp = HttpResponse(status=204)
+        return add_cors_headers(request, resp)
+    
+    if request.method != 'POST': 
+        return JsonResponse({"error":"POST required"}, status=405)
+    
+    auth_error, user = user_auth_middleware(request)
+    if auth_error:
+        return add_cors_headers(request, auth_error)
+    
+    body = parse_json_body(request)
+    cursor = body.get('cursor') or None
+    summary = bool(body.get('summary', False))
+    try:
+        limit = min(max(int(body.get('limit', HISTORY_PAGE_SIZE)), 1), HISTORY_MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "Invalid limit"}, status=400)
+    if cursor and not ObjectId.is_valid(cursor):
+        return JsonResponse({"error": "Invalid cursor"}, status=400)
+    
+    if summary:
+        user_chats = Chat.page_by_user(user.id, before=cursor, limit=limit, recent=1)
+        last = Conversation.last_by_chats(user_chats)
+        chats_data = []
+        for chat in user_chats:
+            last_conv = last.get(chat.id)
+            chats_data.append({
+                'id': str(chat.id),
+                'title': chat.title,
+                'created_at': chat.created_at.isoformat(),
+                'lastMessage': serialize_conversation(last_conv) if last_conv else None,
+                'messageCount': chat.message_count,
+                'lastActivity': chat.last_activity.isoformat() if chat.last_activity else None
+            })
+        resp = JsonResponse({
+            "chats": chats_data,
+            "nextCursor": str(user_chats[-1].id) if len(user_chats) == limit else None
+        })
+    else:
+        user_chats = Chat.page_by_user(user.id, before=cursor, limit=limit)
+        resp = json_pieces_response(json_object({
+            "chats": chat_list_pieces(Conversation.iter_by_chats(user_chats)),
+            "nextCursor": str(user_chats[-1].id) if len(user_chats) == limit else None
+        }))
+    
+    return add_cors_headers(request, resp)
+
+@csrf_exempt
+@instrument("search_user_chats")
+def search_user_chats(request):
+    if request.method == "OPTIONS":
+        resp = HttpResponse(status=204)
+        return add_cors_headers(request, resp)
+    
+    if request.method != 'POST': 
+        return JsonResponse({"error":"POST required"}, status=405)
+    
+    auth_error, user = user_auth_middleware(request)
+    if auth_error:
+        return add_cors_headers(request, auth_error)
+    
+    body = parse_json_body(request)
+    try:
+        resp = JsonResponse(search_messages(user.id, body.get('query'), body.get('cursor'), body.get('limit')))
+    except SearchError as e:
+        resp = JsonResponse({"error": str(e)}, status=400)
+    
+    return add_cors_headers(request, resp)
+
+def read_export_options(request):
+    body = parse_json_body(request)
+    fmt = body.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return JsonResponse({"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}, status=400), None, None
+    return None, fmt, bool(body.get('gzip', False))
+
+def export_response(request, chunks, fmt, user, compress):
+    resp = StreamingHttpResponse(bind_endpoint(chunks), content_type="application/gzip" if compress else EXPORT_FORMATS[fmt])
+    resp["Content-Disposition"] = f'attachment; filename="{export_filename(fmt, user, compress)}"'
+    resp["Cache-Control"] = "no-store"
+    resp["X-Accel-Buffering"] = "no"
+    return add_cors_headers(request, resp)
+
+@csrf_exempt
+@instrument("export_user_chats")
+def export_user_chats(request):
+    if request.method == "OPTIONS":
+        resp = HttpResponse(status=204)
+        return add_cors_headers(request, resp)
+    
+    if request.method != 'POST': 
+        return JsonResponse({"error":"POST required"}, status=405)
+    
+    auth_error, user = user_auth_middleware(request)
+    if auth_error:
+        return add_cors_headers(request, auth_error)
+    
+    options_error, fmt, compress = read_export_options(request)
+    if options_error:
+        return add_cors_headers(request, options_error)
+    
+    chunks = buffered(export_pieces(fmt, user))
+    if compress:
+        chunks = gzipped(chunks)
+    return export_response(request, chunks, fmt, user, compress)
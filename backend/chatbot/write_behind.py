@@ -0,0 +1,274 @@
+import os
+import time
+import asyncio
+import atexit
+import threading
+from collections import Counter as Tally
+from typing import Dict, Iterable, List
+
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from .database import db
+from .metrics import Counter, Gauge, timed
+
+# Chat and conversation writes are queued here and flushed in batches by a background
+# thread, so a chat turn returns without waiting on MongoDB. Reads that must see a
+# queued write call settle() with the chat/user id, which flushes early only if needed.
+# A failed flush is retried, and writes that reached MongoDB before the failure are sent
+# again, so every op must be safe to replay: inserts are (a replayed one is a duplicate
+# key and skipped), $set updates are, and $inc/$push updates carry a guard filter that
+# stops matching once they are applied.
+WRITE_BEHIND = os.environ.get("WRITE_BEHIND", "1") != "0"
+WRITE_BATCH_SIZE = int(os.environ.get("WRITE_BATCH_SIZE", "200"))
+WRITE_FLUSH_INTERVAL = float(os.environ.get("WRITE_FLUSH_INTERVAL", "0.05"))
+WRITE_RETRY_SECONDS = 1.0
+
+write_ops_total = Counter("ngmc_write_behind_ops_total", "Writes accepted by the write-behind queue", ["kind"])
+write_batches_total = Counter("ngmc_write_behind_batches_total", "bulk_write calls issued by the write-behind queue", ["collection"])
+write_failures_total = Counter("ngmc_write_behind_failures_total", "Flushes that failed and were retried or dropped", ["reason"])
+
+
+
+def _sliced(items: List, count) -> List:
+    if count is None:
+        return items
+    return items[count:] if count < 0 else items[:count]
+
+
+def merge_update(into: Dict, update: Dict) -> Dict:
+    for op, fields in update.items():
+        target = into.setdefault(op, {})
+        for field, value in fields.items():
+            if op == "$set":
+                target[field] = value
+            elif op == "$inc":
+                target[field] = target.get(field, 0) + value
+            elif op == "$push":
+                each = target[field]["$each"] + list(value["$each"]) if field in target else list(value["$each"])
+                target[field] = {"$each": each}
+                if "$slice" in value:
+                    target[field]["$slice"] = value["$slice"]
+            else:
+                raise ValueError(f"write-behind cannot merge {op}")
+    return into
+
+
+def apply_update(doc: Dict, update: Dict) -> Dict:
+    # Same operators as merge_update, applied to a document that is not written yet.
+    for field, value in update.get("$set", {}).items():
+        doc[field] = value
+    for field, value in update.get("$inc", {}).items():
+        doc[field] = doc.get(field, 0) + value
+    for field, value in update.get("$push", {}).items():
+        doc[field] = _sliced(doc.get(field, []) + list(value["$each"]), value.get("$slice"))
+    return doc
+
+
+class WriteBehind:
+    def __init__(self, database, batch_size: int = WRITE_BATCH_SIZE, interval: float = WRITE_FLUSH_INTERVAL,
+                 enabled: bool = WRITE_BEHIND):
+        self.db = database
+        self.batch_size = batch_size
+        self.interval = interval
+        self.enabled = enabled
+        # (collection, "insert", doc, keys) or (collection, "update", _id, update, guard, keys)
+        self._ops: List[tuple] = []
+        self._pending = Tally()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+    def insert(self, collection: str, doc: Dict, keys: Iterable = ()):
+        write_ops_total.inc(kind="insert")
+        self._submit((collection, "insert", doc, tuple(keys)))
+
+    def update(self, collection: str, _id, fields: Dict, keys: Iterable = ()):
+        if fields:
+            self.modify(collection, _id, {"$set": dict(fields)}, keys)
+
+    def modify(self, collection: str, _id, update: Dict, keys: Iterable = (), guard: Dict = None):
+        # update uses $set, $inc and $push ({"$each": [...], "$slice": n}) only, so that
+        # updates to one document can be merged. guard is added to the update's filter
+        # and must stop matching once the update is applied; guarded updates are written
+        # one by one, in order, instead of merged.
+        if guard is None and ("$inc" in update or "$push" in update):
+            raise ValueError("write-behind $inc/$push updates need a guard to be safe to replay")
+        write_ops_total.inc(kind="update")
+        self._submit((collection, "update", _id, update, guard, tuple(keys)))
+
+    def _submit(self, op):
+        with self._cond:
+            self._ops.append(op)
+            self._pending.update(op[-1])
+            if len(self._ops) >= self.batch_size:
+                self._cond.notify_all()
+        if not self.enabled or self._closed:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self.flush()
+                return
+            # Called from async code: write on a worker thread instead of blocking the
+            # event loop. The keys stay pending until then, so asettle() still waits for it.
+            loop.run_in_executor(None, self.flush)
+        elif self._thread is None:
+            self._start()
+
+    def is_pending(self, *keys) -> bool:
+        with self._cond:
+            return any(self._pending[key] for key in keys if key is not None)
+
+    def settle(self, *keys):
+        # Read-your-writes: flush now if anything queued touches one of `keys`.
+        if self.is_pending(*keys):
+            self.flush()
+
+    def settle_all(self):
+        if self._ops:
+            self.flush()
+
+    async def asettle(self, *keys):
+        if self.is_pending(*keys):
+            await asyncio.to_thread(self.flush)
+
+    async def asettle_all(self):
+        if self._ops:
+            await asyncio.to_thread(self.flush)
+
+    def depth(self) -> int:
+        return len(self._ops)
+
+    def _start(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._ops or self._closed)
+                if self._closed:
+                    return
+                # Give concurrent requests a moment to add to the same batch.
+                self._cond.wait_for(lambda: len(self._ops) >= self.batch_size or self._closed, timeout=self.interval)
+            if not self.flush():
+                time.sleep(WRITE_RETRY_SECONDS)
+
+    def flush(self) -> bool:
+        with self._flush_lock:
+            with self._cond:
+                batch, self._ops = self._ops, []
+            if not batch:
+                return True
+            with timed("mongo", "write_behind.flush"):
+                retry = self._write(batch)
+            retrying = {id(op) for op in retry}
+            with self._cond:
+                # Connection-level (or unexpected) failure: put the ops that may not have
+                # been written back in front and retry later rather than lose the writes.
+                self._ops[:0] = retry
+                for op in batch:
+                    if id(op) not in retrying:
+                        self._pending.subtract(op[-1])
+                self._pending += Tally()
+                self._cond.notify_all()
+            return not retry
+
+    def _write(self, batch) -> List[tuple]:
+        # The ops to retry.
+        per_collection: Dict[str, List[tuple]] = {}
+        for op in batch:
+            per_collection.setdefault(op[0], []).append(op)
+        retry = []
+        for collection, ops in per_collection.items():
+            failed = self._write_collection(collection, ops)
+            if failed:
+                write_failures_total.inc(reason="retry")
+                retry += failed
+        return retry
+
+    def _write_collection(self, collection: str, ops: List[tuple]) -> List[tuple]:
+        # The ops still to write after a failure. Updates are applied to a copy of a
+        # document inserted in the same batch, so the queued insert stays as it was; if
+        # the document turns out to exist already (an insert replayed after a failed
+        # flush, a job run again), its updates are written separately instead. Inserts go
+        # first, unordered, so one duplicate does not hold up the others. Unguarded updates
+        # to one _id are merged; updates go in one ordered bulk_write when a document has
+        # more than one, so a guarded update lands after the updates queued before it.
+        inserts: Dict = {}
+        folded: Dict = {}  # _id -> the update ops applied to its insert
+        pending = []
+        for op in ops:
+            if op[1] == "insert":
+                inserts[op[2]["_id"]] = dict(op[2])
+            elif op[2] in inserts:
+                apply_update(inserts[op[2]], op[3])
+                folded.setdefault(op[2], []).append(op)
+            else:
+                pending.append(op)
+
+        if inserts:
+            try:
+                duplicates = self._bulk_write(collection, [InsertOne(doc) for doc in inserts.values()], ordered=False)
+            except Exception as e:
+                print(f"Write-behind flush to {collection} failed, will retry {len(ops)} writes: {e}")
+                return ops
+            ids = list(inserts)
+            pending[:0] = [op for i in sorted(duplicates) for op in folded.get(ids[i], [])]
+
+        updates: List[list] = []  # [_id, update, guard]
+        last: Dict = {}
+        for _, _, _id, update, guard in (op[:5] for op in pending):
+            if guard is None and _id in last and last[_id][2] is None:
+                merge_update(last[_id][1], update)
+            else:
+                last[_id] = [_id, merge_update({}, update), guard]
+                updates.append(last[_id])
+        if updates:
+            requests = [UpdateOne(dict(guard or {}, _id=_id), update) for _id, update, guard in updates]
+            try:
+                self._bulk_write(collection, requests, ordered=len(updates) > len(last))
+            except Exception as e:
+                # The inserts (with the updates applied to them) are written.
+                print(f"Write-behind flush to {collection} failed, will retry {len(pending)} writes: {e}")
+                return pending
+        write_batches_total.inc(collection=collection)
+        return []
+
+    def _bulk_write(self, collection: str, requests: List, ordered: bool) -> set:
+        # The indexes of the requests that failed on a duplicate key: inserts of documents
+        # that are already there.
+        try:
+            self.db[collection].bulk_write(requests, ordered=ordered)
+        except BulkWriteError as e:
+            # Per-document errors will not succeed on retry.
+            errors = e.details.get('writeErrors', [])
+            dropped = [error for error in errors if error.get('code') != 11000]
+            if dropped:
+                write_failures_total.inc(reason="dropped")
+                print(f"Write-behind dropped {len(dropped)} writes to {collection}: {dropped[:1]}")
+            return {error['index'] for error in errors if error.get('code') == 11000}
+        return set()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        for _ in range(3):
+            if self.flush():
+                break
+            time.sleep(WRITE_RETRY_SECONDS)
+        if self._ops:
+            print(f"Write-behind: {len(self._ops)} writes could not be flushed at shutdown")
+
+
+write_behind = WriteBehind(db)
+Gauge("ngmc_write_behind_queue_depth", "Writes waiting in the write-behind queue",
+      lambda: {"queued": write_behind.depth()}, ["state"])
@@ -1,9 +1,17 @@
+import os
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 load_dotenv()
 
-DEBUG = True
-SECRET_KEY = 'ngmc_secret'
+DEBUG = os.environ.get('DJANGO_DEBUG', '0') == '1'
+# Signs the session tokens (chatbot/auth.py): anyone who knows it can sign in as any user,
+# so it comes from the environment. Only a DEBUG server falls back to a fixed key.
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY')
+if not SECRET_KEY:
+    if not DEBUG:
+        raise ImproperlyConfigured("DJANGO_SECRET_KEY is not set (or set DJANGO_DEBUG=1 for local development)")
+    SECRET_KEY = 'ngmc-insecure-development-key'
 ALLOWED_HOSTS = ['*']
 
 INSTALLED_APPS = [
@@ -16,7 +24,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
 ]
 
-ROOT_URLCONF = 'config.urls'
+# asgi.py points this at config.asgi_urls to serve the async views.
+ROOT_URLCONF = os.environ.get('DJANGO_ROOT_URLCONF', 'config.urls')
 TIME_ZONE = 'Asia/Kolkata'
 USE_TZ = True
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -1,19 +1,27 @@
 #!/usr/bin/env python
 import os
 import sys
-from django.core.management import execute_from_command_line
-from chatbot.database import ensure_tables
-from chatbot.utils import scrape_links, clean_json_to_txt
+import threading
 
 if __name__ == '__main__':
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
     
+    if len(sys.argv) > 1 and sys.argv[1] == 'test':
+        # Same offline settings as `pytest` (see chatbot/tests/__init__.py).
+        import chatbot.tests
+    
+    from django.core.management import execute_from_command_line
+    from chatbot.database import ensure_indexes
+    from chatbot.scraper import start_scrape_scheduler
+    
     if len(sys.argv) > 1 and sys.argv[1] == 'runserver':
-        ensure_tables()
         print("Starting NGMC Chatbot Server...")
-        print("MongoDB initialized successfully!")
         
-        scrape_links()
-        clean_json_to_txt("ngmc_college_links.json","links.txt")
+        # Deploys run `manage.py ensure_indexes` once; the dev server does it in the
+        # background so it starts even while MongoDB is unreachable.
+        threading.Thread(target=ensure_indexes, name="ensure-indexes", daemon=True).start()
+        
+        # Scraping runs in the background so startup does not wait on the college sites.
+        start_scrape_scheduler()
     
     execute_from_command_line(sys.argv)